@@ -0,0 +1,90 @@
+"""
+Measures the per-task overhead of turning a scheduled task into an API call,
+for the old eval-string path and the precompiled dispatch table.
+The API itself is a no-op, so only the dispatch overhead is timed.
+
+Usage: python -m benchmarks.dispatch_overhead [iterations]
+"""
+import sys
+import time
+from typing import Any
+from typing import Dict
+from typing import Set
+
+from postr.schedule import task_processor
+from postr.schedule.task_processor import api_to_function
+from postr.schedule.task_processor import api_to_instance
+from postr.schedule.task_processor import get_existing_arguments
+
+DEFAULT_ITERATIONS = 100_000
+
+TASK: Dict[str, Any] = {
+    'Platforms': 'Twitter',
+    'Action': 'post_photo',
+    'Comment': 'A scheduled post',
+    'MediaPath': '/tmp/photo.png',
+    'OptionalText': None,
+}
+
+
+class NoopTwitter():
+    def post_photo(self, url: str, text: str) -> bool:  # pylint: disable=unused-argument
+        return True
+
+
+def legacy_create_command(api: str, task: Dict[str, Any], given_arguments: Set[str]) -> str:
+    """ The command string the task processor used to build and eval """
+    action = task['Action']
+    callable_func = f'api_to_instance["{api}"].' + api_to_function[api]['supported_actions'][action]['method']
+    functions_for_actions: Dict[str, str] = api_to_function[api]['supported_actions'][action]['arguments']
+
+    method_args = ''
+    for argument in given_arguments:
+        if argument not in functions_for_actions:
+            continue
+        method_args += f'{functions_for_actions[argument]}="{task[argument]}",'
+
+    return f'{callable_func}({method_args})'
+
+
+def legacy_dispatch(task: Dict[str, Any]) -> Any:
+    command = legacy_create_command('Twitter', task, get_existing_arguments(task))
+    return eval(command, {'api_to_instance': api_to_instance})  # pylint: disable=W0123
+
+
+def compiled_dispatch(task: Dict[str, Any]) -> Any:
+    dispatch = task_processor.dispatch_table[('Twitter', task['Action'])]
+    if not dispatch.required_arguments <= get_existing_arguments(task):
+        return False
+    function = getattr(api_to_instance.get('Twitter'), dispatch.method)
+    return function(**dispatch.map_arguments(task))
+
+
+def time_per_task(dispatch: Any, iterations: int) -> float:
+    """ Returns the mean time per dispatch, in microseconds """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        dispatch(TASK)
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS
+    api_to_instance['Twitter'] = NoopTwitter()
+
+    legacy = time_per_task(legacy_dispatch, iterations)
+    compiled = time_per_task(compiled_dispatch, iterations)
+    print(f'eval string dispatch:   {legacy:8.2f} us/task')
+    print(f'dispatch table:         {compiled:8.2f} us/task ({legacy / compiled:.0f}x faster)')
+
+    quoted = dict(TASK, Comment='She said "hi"')
+    try:
+        legacy_dispatch(quoted)
+        print('eval string dispatch handles quotes')
+    except SyntaxError:
+        print('eval string dispatch fails on a comment containing a quote')
+    print(f'dispatch table handles quotes: {compiled_dispatch(quoted)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures the Reader's hot queries on a large schedule database,
+before and after the version 4 indexes.
+
+Usage: python -m benchmarks.schedule_scan [rows]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+
+from postr.schedule.migrations import migrate
+
+DEFAULT_ROWS = 1_000_000
+REPEATS = 20
+
+# Mirror Reader.next_due_time and Reader.claim_due_jobs as of version 4
+QUERIES: Dict[str, Tuple[str, Callable[[int], Tuple[Any, ...]]]] = {
+    'next due time': (
+        """SELECT MIN(Due) FROM (
+                SELECT MIN(CustomDate) AS Due FROM CustomJob WHERE Status = 'pending'
+                UNION ALL
+                SELECT MIN(LeaseExpiry) AS Due FROM CustomJob WHERE Status = 'claimed'
+            )""",
+        lambda now: (),
+    ),
+    'claim expired leases': (
+        """SELECT CustomJobID FROM CustomJob
+            WHERE Status = 'claimed' AND LeaseExpiry <= ?
+            ORDER BY LeaseExpiry LIMIT 500""",
+        lambda now: (now,),
+    ),
+    'claim due jobs': (
+        """SELECT CustomJobID FROM CustomJob
+            WHERE Status = 'pending' AND CustomDate <= ?
+            ORDER BY CustomDate, CustomJobID LIMIT 500""",
+        lambda now: (now,),
+    ),
+    'occurrences of a job': (
+        'SELECT CustomJobID FROM CustomJob WHERE Job_ID = ?',
+        lambda now: (random.randint(1, 1000),),
+    ),
+}
+
+
+def populate(conn: sqlite3.Connection, rows: int, now: int) -> None:
+    """ Fills the database with a year of history and a week of upcoming jobs """
+    conn.executemany(
+        'INSERT INTO Job(Comment, MediaPath, OptionalText, Platforms, Action) VALUES(?, ?, ?, ?, ?)',
+        (('comment', '', '', 'Twitter,Slack', 'post_text') for _ in range(1000)),
+    )
+
+    def custom_jobs() -> Any:
+        for i in range(rows):
+            # 99% of rows are already executed history, the rest is still to come
+            if i % 100:
+                yield (now - random.randint(1, 365 * 86400), random.randint(1, 1000), 'done')
+            else:
+                yield (now + random.randint(1, 7 * 86400), random.randint(1, 1000), 'pending')
+
+    conn.executemany('INSERT INTO CustomJob(CustomDate, Job_ID, Status) VALUES(?, ?, ?)', custom_jobs())
+    conn.commit()
+
+
+def time_queries(conn: sqlite3.Connection, now: int) -> Dict[str, float]:
+    """ Returns the mean latency of each query, in milliseconds """
+    timings = {}
+    for name, (sql, params) in QUERIES.items():
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            conn.execute(sql, params(now)).fetchall()
+        timings[name] = (time.perf_counter() - start) / REPEATS * 1000
+    return timings
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    now = int(time.time())
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(os.path.join(directory, 'bench.sqlite'))
+        migrate(conn, target_version=3)
+        print(f'Inserting {rows} CustomJob rows...')
+        populate(conn, rows, now)
+        before = time_queries(conn, now)
+
+        start = time.perf_counter()
+        migrate(conn, target_version=4)
+        print(f'Migrated to version 4 in {time.perf_counter() - start:.1f}s')
+        after = time_queries(conn, now)
+        conn.close()
+
+    print(f'{"query":<24}{"before (ms)":>14}{"after (ms)":>14}')
+    for name in QUERIES:
+        print(f'{name:<24}{before[name]:>14.3f}{after[name]:>14.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Measures how many jobs per second the Reader and task processor dispatch end to end.
+
+A temporary schedule database is filled with a large history of done jobs, a backlog of
+due jobs and due recurring jobs, and every platform's adapter is replaced by an in-process
+fake that sleeps for a configurable latency and fails at a configurable rate. Rate limits
+are lifted, so only the scheduler is measured. Runs offline.
+
+Usage: python -m benchmarks.scheduler_load [--jobs 20000] [--history 1000000] [--latency 0.05] ...
+Pass --min-throughput to exit with an error below a number of jobs per second, e.g. in CI.
+"""
+import argparse
+import asyncio
+from contextlib import redirect_stdout
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from postr.rate_limiter import limiter
+from postr.schedule import job_platforms
+from postr.schedule import task_processor
+from postr.schedule.database import get_pool
+from postr.schedule.metrics import Histogram
+from postr.schedule.metrics import metrics
+from postr.schedule.reader import Reader
+
+# Distinct Job rows the history points at. Every due job gets a Job of its own,
+# otherwise the dispatch journal would rightly post the shared ones only once
+JOB_TEMPLATES = 1000
+
+
+class FakeAdapter():
+    """ Stands in for a platform's adapter. Every method sleeps for latency seconds, give or take
+        jitter, then fails with probability failure_rate: half of the time by raising,
+        half by returning False """
+
+    def __init__(self, latency: float, jitter: float, failure_rate: float, seed: int) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def __getattr__(self, name: str) -> Callable[..., bool]:
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(**arguments: Any) -> bool:  # pylint: disable=unused-argument
+            with self.lock:
+                self.calls += 1
+                delay = max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0)
+                roll = self.random.random()
+            time.sleep(delay)
+            if roll < self.failure_rate / 2:
+                raise ConnectionError(f'{name} failed')
+            return roll >= self.failure_rate
+
+        return call
+
+
+class RecordingHistogram(Histogram):
+    """ A histogram that also keeps every value, for exact percentiles """
+
+    def __init__(self, histogram: Histogram) -> None:
+        super().__init__(histogram.name, histogram.description, histogram.buckets, histogram.labels)
+        self.observed: List[float] = []
+
+    def observe(self, value: float, *label_values: str) -> None:
+        super().observe(value, *label_values)
+        self.observed.append(value)
+
+
+def populate(path: str, args: argparse.Namespace, now: int) -> None:
+    """ Fills the database with done history, a backlog of due jobs and due recurring jobs """
+    with get_pool(path).transaction() as cursor:
+        cursor.executemany(
+            'INSERT INTO Job(Comment, MediaPath, OptionalText, Platforms, Action) VALUES(?, ?, ?, ?, ?)',
+            (
+                (f'post {i}', '', '', args.platforms, 'post_text')
+                for i in range(JOB_TEMPLATES + args.jobs + args.recurring)
+            ),
+        )
+
+        def custom_jobs() -> Iterator[Tuple[int, int, str]]:
+            for _ in range(args.history):
+                yield (now - random.randint(1, 365 * 86400), random.randint(1, JOB_TEMPLATES), 'done')
+            for i in range(args.jobs):
+                yield (now - random.randint(0, args.spread), JOB_TEMPLATES + i + 1, 'pending')
+
+        cursor.executemany('INSERT INTO CustomJob(CustomDate, Job_ID, Status) VALUES(?, ?, ?)', custom_jobs())
+        # The due jobs' platform targets, which the Reader keeps up to date as it dispatches
+        job_platforms.add(cursor, args.history + 1, args.history + args.jobs)
+        daily_jobs = (
+            (now - random.randint(0, args.spread), JOB_TEMPLATES + args.jobs + i + 1)
+            for i in range(args.recurring)
+        )
+        cursor.executemany(
+            """INSERT INTO DailyJob(Frequency, IntervalInMinutes, StartTime, Job_ID, NextRunTime)
+                VALUES(1, 0, ?, ?, ?)""",
+            ((start, job_id, start) for start, job_id in daily_jobs),
+        )
+
+
+def install_fakes(args: argparse.Namespace) -> List[FakeAdapter]:
+    """ Replaces the adapters of the benchmarked platforms with fakes, and lifts their rate limits """
+    fakes = []
+    for seed, platform in enumerate(args.platforms.split(',')):
+        fake = FakeAdapter(args.latency, args.jitter, args.failure_rate, seed)
+        task_processor.api_to_instance[platform] = fake
+        fakes.append(fake)
+        for (api, _), dispatch in task_processor.dispatch_table.items():
+            if api == platform:
+                limiter.configure(api, dispatch.endpoint, rate=1e9, capacity=1e9)
+    return fakes
+
+
+def jobs_finished() -> int:
+    return int(sum(metrics.jobs_finished.values.values()))
+
+
+async def dispatch_all(reader: Reader, expected: int, timeout: float) -> float:
+    """ Runs the scheduler until expected jobs have been dispatched once, returning how long it took """
+    scanning = asyncio.ensure_future(reader.scan())
+    start = time.perf_counter()
+    try:
+        while jobs_finished() < expected and time.perf_counter() - start < timeout:
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - start
+    finally:
+        scanning.cancel()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def peak_memory_mb() -> Optional[float]:
+    """ Returns the process's peak resident memory, where the platform reports it """
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Measure end-to-end scheduler throughput with fake adapters')
+    parser.add_argument('--jobs', type=int, default=20_000, help='due one-time jobs to dispatch')
+    parser.add_argument('--history', type=int, default=1_000_000, help='done jobs already in the schedule')
+    parser.add_argument('--recurring', type=int, default=1000, help='due daily jobs')
+    parser.add_argument('--spread', type=int, default=0, help='seconds over which due jobs were scheduled')
+    parser.add_argument('--platforms', default='Twitter,Slack', help='platforms of every job')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per fake platform call')
+    parser.add_argument('--jitter', type=float, default=0.02, help='latency varies by up to this much')
+    parser.add_argument('--failure-rate', type=float, default=0.01, help='fraction of platform calls that fail')
+    parser.add_argument('--batch-size', type=int, default=500, help='jobs claimed per scan')
+    parser.add_argument('--max-concurrency', type=int, default=task_processor.MAX_CONCURRENT_DISPATCHES)
+    parser.add_argument('--timeout', type=float, default=600, help='give up after this many seconds')
+    parser.add_argument('--min-throughput', type=float, help='exit with an error below this many jobs/sec')
+    parser.add_argument('--directory', help='where to put the database, by default a temporary directory')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    expected = args.jobs + args.recurring
+    now = int(time.time())
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        path = os.path.join(directory, 'load.sqlite')
+        start = time.perf_counter()
+        populate(path, args, now)
+        size = os.path.getsize(path) / (1024 * 1024)
+        print(f'Populated {args.history + args.jobs} jobs and {args.recurring} recurring jobs '
+              f'in {time.perf_counter() - start:.1f}s ({size:.0f} MB)')
+
+        fakes = install_fakes(args)
+        lag = metrics.schedule_lag = RecordingHistogram(metrics.schedule_lag)
+        reader = Reader(
+            max_sleep=1, batch_size=args.batch_size, max_concurrency=args.max_concurrency, file_path=path,
+        )
+        # The scheduler prints every task and logs every failure, which would be most of the time measured
+        for name in ('reader', 'task_processor'):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            elapsed = asyncio.get_event_loop().run_until_complete(dispatch_all(reader, expected, args.timeout))
+        reader.cleanup()
+        get_pool(path).close()
+
+    finished = jobs_finished()
+    calls = sum(fake.calls for fake in fakes)
+    throughput = finished / elapsed
+    memory = peak_memory_mb()
+    print(f'{"jobs dispatched":<22}{finished:>12} of {expected}')
+    print(f'{"platform calls":<22}{calls:>12}')
+    print(f'{"seconds":<22}{elapsed:>12.2f}')
+    print(f'{"jobs/sec":<22}{throughput:>12.0f}')
+    print(f'{"calls/sec":<22}{calls / elapsed:>12.0f}')
+    print(f'{"retrying":<22}{int(metrics.jobs_finished.value("retrying")):>12}')
+    for name, fraction in [('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0)]:
+        print(f'{"lag " + name + " (s)":<22}{percentile(lag.observed, fraction):>12.2f}')
+    print(f'{"peak memory (MB)":<22}{memory:>12.0f}' if memory is not None else 'peak memory: not available')
+
+    if finished < expected:
+        sys.exit(f'Timed out after {args.timeout:.0f}s with {expected - finished} jobs left')
+    if args.min_throughput is not None and throughput < args.min_throughput:
+        sys.exit(f'Throughput {throughput:.0f} jobs/sec is below {args.min_throughput:.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Measures how many jobs per second the Writer schedules: one at a time,
+from concurrent threads sharing group commits, and with create_jobs.
+
+Usage: python -m benchmarks.writer_ingest [jobs] [directory]
+The database goes in a temporary directory unless one is given; pass a directory
+on the disk the schedule lives on, since commits cost what an fsync costs there.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable
+from typing import List
+
+from postr.schedule.writer import JobSpec
+from postr.schedule.writer import Writer
+
+DEFAULT_JOBS = 10_000
+THREADS = 8
+
+
+def spec(i: int) -> JobSpec:
+    return JobSpec(int(time.time()) + 86400 + i, f'campaign post {i}', '', '', 'Twitter,Slack', 'post_text')
+
+
+def single(writer: Writer, jobs: int) -> None:
+    """ create_job then create_custom_job, one job at a time: two commits per job """
+    for i in range(jobs):
+        job = spec(i)
+        job_id = writer.create_job(job.comment, job.media_path, job.optional_text, job.platforms, job.action)
+        writer.create_custom_job(job.date, job_id)
+
+
+def threaded(writer: Writer, jobs: int) -> None:
+    """ The same single-job calls from THREADS threads at once, sharing group commits """
+    threads = [
+        threading.Thread(target=single, args=(writer, jobs // THREADS))
+        for _ in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def batched(writer: Writer, jobs: int) -> None:
+    """ One create_jobs call: a single transaction """
+    writer.create_jobs(spec(i) for i in range(jobs))
+
+
+def run(directory: str, name: str, insert: Callable[[Writer, int], None], jobs: int) -> None:
+    path = os.path.join(directory, f'{name}.sqlite')
+    writer = Writer(path)
+    first_batch = writer.open_batch
+
+    start = time.perf_counter()
+    insert(writer, jobs)
+    elapsed = time.perf_counter() - start
+
+    commits = writer.open_batch - first_batch
+    writer.cleanup()
+    os.remove(path)
+    print(f'{name:<12}{jobs:>10}{elapsed:>12.2f}{jobs / elapsed:>14.0f}{commits:>10}')
+
+
+def main() -> None:
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_JOBS
+    benchmarks: List[Callable[[Writer, int], None]] = [single, threaded, batched]
+
+    with tempfile.TemporaryDirectory(dir=sys.argv[2] if len(sys.argv) > 2 else None) as directory:
+        print(f'{"insert":<12}{"jobs":>10}{"seconds":>12}{"jobs/sec":>14}{"commits":>10}')
+        for insert in benchmarks:
+            run(directory, insert.__name__, insert, jobs)
+
+
+if __name__ == '__main__':
+    main()
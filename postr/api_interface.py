@@ -1,22 +1,27 @@
 # api interface that all api classes must extend
 import abc
 from typing import List
+from typing import Union
+
+# What a post method returns: whether it succeeded, or the platform's ID of the new post,
+# which also means it succeeded. The scheduler keeps the ID to retract the post later
+PostResult = Union[bool, str]
 
 
 class ApiInterface(abc.ABC):
 
     @abc.abstractmethod
-    def post_text(self, text: str) -> bool:
+    def post_text(self, text: str) -> PostResult:
         ''' This method takes in the text the user want to post and returns the success of this action'''
         return False
 
     @abc.abstractmethod
-    def post_video(self, url: str, text: str) -> bool:
+    def post_video(self, url: str, text: str) -> PostResult:
         ''' This method takes in the url for the video the user want to post and returns the success of this action'''
         return False
 
     @abc.abstractmethod
-    def post_photo(self, url: str, text: str) -> bool:
+    def post_photo(self, url: str, text: str) -> PostResult:
         ''' This method takes in the url for the photo the user wants
         to post and returns the success of this action'''
         return False
@@ -0,0 +1,88 @@
+"""
+The time the scheduler and the rate limiter go by.
+
+Everything that reads the time or sleeps on behalf of the scheduler, from Reader.now() to
+the rate limiter's token buckets, goes through this module's current clock. Normally that
+is the real one. Replays install a VirtualClock instead, which starts at any moment and
+runs many times faster than real time, so a month of schedule plays out in minutes with
+every due time, lease, retry and rate limit scaled alike.
+"""
+import asyncio
+import time
+
+
+class Clock():
+    """ Real time """
+
+    def now(self) -> float:
+        """ Seconds since the epoch """
+        return time.time()
+
+    def monotonic(self) -> float:
+        """ Seconds from an arbitrary point, never going backwards """
+        return time.monotonic()
+
+    def real_seconds(self, seconds: float) -> float:
+        """ Returns how long seconds of this clock's time last in real time """
+        return seconds
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(self.real_seconds(seconds))
+
+    async def sleep_async(self, seconds: float) -> None:
+        await asyncio.sleep(self.real_seconds(seconds))
+
+
+class VirtualClock(Clock):
+    """ Time that starts at start, in seconds since the epoch, and runs speed times faster than real time """
+
+    def __init__(self, start: float, speed: float = 1.0) -> None:
+        self.start = start
+        self.speed = speed
+        self.real_start = time.monotonic()
+
+    def now(self) -> float:
+        return self.start + (time.monotonic() - self.real_start) * self.speed
+
+    def monotonic(self) -> float:
+        return self.now()
+
+    def real_seconds(self, seconds: float) -> float:
+        return seconds / self.speed
+
+
+_current = Clock()
+
+
+def set_clock(clock: Clock) -> Clock:
+    """ Makes clock the current clock, returning the previous one """
+    global _current  # pylint: disable=global-statement
+    previous, _current = _current, clock
+    return previous
+
+
+def get_clock() -> Clock:
+    return _current
+
+
+def now() -> float:
+    """ The current clock's time, in seconds since the epoch """
+    return _current.now()
+
+
+def monotonic() -> float:
+    return _current.monotonic()
+
+
+def real_seconds(seconds: float) -> float:
+    return _current.real_seconds(seconds)
+
+
+def sleep(seconds: float) -> None:
+    """ Sleeps for seconds of the current clock's time """
+    _current.sleep(seconds)
+
+
+async def sleep_async(seconds: float) -> None:
+    """ Sleeps for seconds of the current clock's time, without blocking the event loop """
+    await _current.sleep_async(seconds)
@@ -6,6 +6,8 @@ from discord import Message
 from postr.postr_logger import make_logger
 from postr.config import get_api_key
 from postr.config import update_api_key
+from postr.rate_limiter import limiter
+from postr.rate_limiter import rate_limited
 
 discord_client: Client = Client()
 log = make_logger('discord')
@@ -28,6 +30,7 @@ def id_to_channel(channel_id: Optional[str]) -> Channel:
 default_channel_id = get_api_key('Discord', 'default_channel')
 
 
+@rate_limited('Discord', 'post')
 async def post_text(text: str, channel_id: Optional[str] = default_channel_id) -> bool:
     ''' This method takes in the text the user want to post
         and returns the success of this action'''
@@ -39,10 +42,12 @@ async def post_text(text: str, channel_id: Optional[str] = default_channel_id) -
         log.info(f'Bot sent to {channel.name} message: {text}')
         return True
     except Exception as exp:
+        limiter.observe_error('Discord', 'post', exp)
         log.error(f'Failed to send message: {exp}')
         return False
 
 
+@rate_limited('Discord', 'delete')
 async def delete_bot_messages(channel_id: Optional[str] = default_channel_id) -> bool:
     def is_me(m: Message) -> bool:
         return m.author == discord_client.user  # type: ignore
@@ -52,10 +57,12 @@ async def delete_bot_messages(channel_id: Optional[str] = default_channel_id) ->
         await discord_client.send_message(channel, 'Deleted {} message(s)'.format(len(deleted)))
         return True
     except Exception as exp:
+        limiter.observe_error('Discord', 'delete', exp)
         log.error(f'Failed to delete bot messages: {exp}')
         return False
 
 
+@rate_limited('Discord', 'post')
 async def post_image(image_filepath: str, channel_id: Optional[str] = default_channel_id) -> bool:
     channel = discord_client.get_channel(channel_id)
     try:
@@ -63,16 +70,19 @@ async def post_image(image_filepath: str, channel_id: Optional[str] = default_ch
             await discord_client.send_file(channel, f)
             return True
     except Exception as exp:
+        limiter.observe_error('Discord', 'post', exp)
         log.error(f'Failed to post image: {exp}')
         return False
 
 
+@rate_limited('Discord', 'profile')
 async def update_status(status: str) -> bool:
     try:
         game_from_status = Game(name=status)
         await discord_client.change_presence(game=game_from_status)
         return True
     except Exception as exp:
+        limiter.observe_error('Discord', 'profile', exp)
         log.error(f'Failed to update status: {exp}')
         return False
 
@@ -7,6 +7,8 @@ from typing import Type, List
 from postr.config import get_api_key
 from postr.config import update_api_key
 from postr.api_interface import ApiInterface
+from postr.rate_limiter import limiter
+from postr.rate_limiter import rate_limited
 import facebook
 
 
@@ -118,15 +120,18 @@ class FacebookApi(ApiInterface):
 
         return success
 
+    @rate_limited('Facebook', 'post')
     def post_text(self, text: str) -> bool:
         success = True
         try:
             self.graph.put_object(parent_object='me', connection_name='feed', message=text)
-        except facebook.GraphAPIError:
+        except facebook.GraphAPIError as e:
+            limiter.observe_error('Facebook', 'post', e)
             print('An error occured when trying to post text.')
             success = False
         return success
 
+    @rate_limited('Facebook', 'post')
     def post_video(self, url: str, text: str) -> bool:
         success = True
         try:
@@ -136,43 +141,52 @@ class FacebookApi(ApiInterface):
                 message=text,
                 link=url,
             )
-        except facebook.GraphAPIError:
+        except facebook.GraphAPIError as e:
+            limiter.observe_error('Facebook', 'post', e)
             print('An error occured when trying to post video.')
             success = False
         return success
 
+    @rate_limited('Facebook', 'post')
     def post_photo(self, url: str, text: str) -> bool:
         success = True
         try:
             self.graph.put_photo(image=open(url, 'rb'), message=text)
-        except facebook.GraphAPIError:
+        except facebook.GraphAPIError as e:
+            limiter.observe_error('Facebook', 'post', e)
             print('An error occured when trying to post photo.')
             success = False
         return success
 
+    @rate_limited('Facebook', 'read')
     def get_user_likes(self) -> int:
         likesCount = 0
         try:
             likes = self.graph.get_connections(id='me', connection_name='likes')
             likesCount = len(list(likes))
-        except facebook.GraphAPIError:
+        except facebook.GraphAPIError as e:
+            limiter.observe_error('Facebook', 'read', e)
             print('An error occured when trying to get user likes.')
         return likesCount
 
+    @rate_limited('Facebook', 'read')
     def get_user_followers(self, text: str) -> List[str]:
         friend_list = [text]
         try:
             friends = self.graph.get_connections(id='me', connection_name='friends')
             friend_list = list(friends)
-        except facebook.GraphAPIError:
+        except facebook.GraphAPIError as e:
+            limiter.observe_error('Facebook', 'read', e)
             print('An error occured when trying to get user likes.')
         return friend_list
 
+    @rate_limited('Facebook', 'delete')
     def remove_post(self, post_id: str) -> bool:
         success = True
         try:
             self.graph.delete_object(id=post_id)
-        except facebook.GraphAPIError:
+        except facebook.GraphAPIError as e:
+            limiter.observe_error('Facebook', 'delete', e)
             print('An error occured when trying to post photo.')
             success = False
         return success
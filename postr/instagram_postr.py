@@ -14,6 +14,9 @@ from InstagramAPI import InstagramAPI
 
 from .instagram.instagram_key import InstagramKey
 from .api_interface import ApiInterface
+from .api_interface import PostResult
+from .rate_limiter import limiter
+from .rate_limiter import rate_limited
 
 
 matplotlib.use('TkAgg')
@@ -65,14 +68,41 @@ class Instagram(ApiInterface):
         """ Not an operations that the Instagram API allows. """
         return False
 
-    def post_photo(self, url: str, text: str) -> bool:
-        self.api.uploadPhoto(photo=url, caption=text)
-        return False
+    @rate_limited('Instagram', 'post')
+    def post_photo(self, url: str, text: str) -> PostResult:
+        """ Posts the photo at url with text as its caption. Returns the ID of the new post,
+            or False if it was not posted.
+            InstagramAPI.uploadPhoto always returns False, so whether the photo was posted is taken
+            from its configure request, which publishes the uploaded photo """
+        published: Dict[str, Any] = {}
+        configure = self.api.configure
+
+        def configure_and_keep_media(*args: Any, **kwargs: Any) -> bool:
+            succeeded: bool = configure(*args, **kwargs)
+            if succeeded:
+                published.update(self.api.LastJson)
+            return succeeded
+
+        self.api.configure = configure_and_keep_media
+        try:
+            self.api.uploadPhoto(photo=url, caption=text)
+        except Exception:
+            # Once configure succeeded the photo is posted, whatever fails after it
+            if not published:
+                raise
+        finally:
+            del self.api.configure
+
+        if not published:
+            return False
+        media_id = published.get('media', {}).get('id')
+        return str(media_id) if media_id else True
 
     def get_user_likes(self) -> int:
         """ Not supported by the API """
         return -1
 
+    @rate_limited('Instagram', 'read')
     def get_user_followers(self, text: str) -> List[str]:
         """ Gets the names of all users followers """
         # Get all follower information
@@ -81,12 +111,14 @@ class Instagram(ApiInterface):
         names: List[str] = list([x.username for x in followers])
         return names
 
+    @rate_limited('Instagram', 'delete')
     def remove_post(self, post_id: str) -> bool:
         """ Removes a post, prints an exception if the post doesn't exist """
         try:
             self.api.deleteMedia(mediaId=post_id)
             return True
         except BaseException as e:
+            limiter.observe_error('Instagram', 'delete', e)
             print('Error on data %s' % str(e))
             return False
 
@@ -137,6 +169,7 @@ class Instagram(ApiInterface):
         user = Instagram._profile_to_InstagramUser(profile_json)
         return user.uid
 
+    @rate_limited('Instagram', 'follow')
     def follow_by_id(self, uid: int) -> None:
         """ Follows a user based off of their uid """
         self.api.follow(uid)
@@ -149,6 +182,7 @@ class Instagram(ApiInterface):
         uid = self.username_to_id(username)
         self.api.follow(uid)
 
+    @rate_limited('Instagram', 'follow')
     def block_by_id(self, uid: int) -> None:
         """ Blocks a user based off their uid """
         self.api.block(uid)
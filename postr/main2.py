@@ -29,6 +29,7 @@ reddit = Reddit()
 slack = SlackApi()
 reader = Reader()
 instagram = Instagram()
+writer.add_listener(reader.notify)
 
 
 def setup(main_gui: Tk) -> Tk:
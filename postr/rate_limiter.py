@@ -0,0 +1,251 @@
+import asyncio
+import functools
+import threading
+from contextvars import ContextVar
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+from postr import clock
+from postr.postr_logger import make_logger
+
+log = make_logger('rate_limiter')
+
+# (rate in requests per second, burst capacity) per (platform, endpoint).
+# '*' is the platform-wide default. Sources are each platform's published limits,
+# rounded down; adjust them with limiter.configure(platform, endpoint, rate, capacity).
+DEFAULT_LIMITS: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ('Twitter', 'post'): (300 / (3 * 60 * 60), 10),      # 300 tweets per 3 hours
+    ('Twitter', 'followers'): (15 / (15 * 60), 15),      # 15 follower pages per 15 minutes
+    ('Twitter', '*'): (900 / (15 * 60), 15),
+    ('Reddit', '*'): (1, 10),                            # 60 requests per minute
+    ('Slack', 'post'): (1, 1),                           # 1 message per second
+    ('Slack', 'upload'): (20 / 60, 5),                   # files.upload: 20 per minute
+    ('Slack', '*'): (50 / 60, 5),
+    ('Instagram', '*'): (200 / (60 * 60), 5),            # 200 requests per hour
+    ('YouTube', 'post'): (6 / (24 * 60 * 60), 6),        # 10,000 quota units per day, 1,600 per upload
+    ('YouTube', '*'): (10000 / (24 * 60 * 60), 50),
+    ('Facebook', '*'): (200 / (60 * 60), 10),            # 200 calls per user per hour
+    ('Tumblr', 'post'): (250 / (24 * 60 * 60), 10),      # 250 posts per day
+    ('Tumblr', '*'): (1000 / (60 * 60), 10),
+    ('Discord', '*'): (1, 5),                            # 5 messages per 5 seconds
+}
+FALLBACK_LIMIT = (1.0, 5.0)
+
+# How long to back off after a 429 that did not say when to retry
+DEFAULT_RETRY_AFTER = 60.0
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+# The (platform, endpoint) whose token was taken before the current call was made, see RateLimiter.call_reserved
+reserved_token: ContextVar[Optional[Tuple[str, str]]] = ContextVar('reserved_token', default=None)
+
+
+class TokenBucket():
+    """
+    A thread-safe token bucket: capacity tokens, refilled at rate tokens per second.
+    Callers reserve a token and then sleep for however long the bucket tells them to,
+    so a burst of callers is spread out instead of retrying in a loop.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = clock.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """ Takes a token and returns how many seconds to wait before using it """
+        with self.lock:
+            now = clock.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now, 0.0)
+
+    def wait_time(self) -> float:
+        """ Returns how many seconds until a token is available, without taking it """
+        with self.lock:
+            now = clock.monotonic()
+            self._refill(now)
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            return max(wait, self.blocked_until - now, 0.0)
+
+    def pause(self, seconds: float) -> None:
+        """ Stops handing out tokens for the given number of seconds """
+        with self.lock:
+            now = clock.monotonic()
+            self._refill(now)
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = min(self.tokens, 0.0)
+
+    def update(self, remaining: int, reset_in: float) -> None:
+        """ Trusts the platform's own count of remaining calls in the current window """
+        if remaining <= 0:
+            self.pause(reset_in)
+            return
+
+        with self.lock:
+            self._refill(clock.monotonic())
+            self.tokens = min(self.capacity, float(remaining))
+
+
+class RateLimiter():
+    """
+    Token buckets keyed by (platform, endpoint), shared by every caller in the process:
+    the scheduler, the GUIs and the analytics helpers all post through the same adapters.
+    """
+
+    def __init__(self, limits: Mapping[Tuple[str, str], Tuple[float, float]]) -> None:
+        self.limits = dict(limits)
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def configure(self, platform: str, endpoint: str, rate: float, capacity: float) -> None:
+        """ Sets the limit of an endpoint, '*' for every endpoint of the platform without its own """
+        with self.lock:
+            self.limits[(platform, endpoint)] = (rate, capacity)
+            self.buckets.pop((platform, endpoint), None)
+
+    def reset(self) -> None:
+        """ Forgets the state of every bucket, e.g. after switching to another clock """
+        with self.lock:
+            self.buckets.clear()
+
+    def bucket(self, platform: str, endpoint: str) -> TokenBucket:
+        """ Returns the bucket of an endpoint, creating it from the configured limits """
+        key = (platform, endpoint)
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            return bucket
+
+        with self.lock:
+            if key not in self.buckets:
+                rate, capacity = self.limits.get(key) or self.limits.get((platform, '*')) or FALLBACK_LIMIT
+                self.buckets[key] = TokenBucket(rate, capacity)
+            return self.buckets[key]
+
+    def take_reserved(self, platform: str, endpoint: str) -> bool:
+        """ Uses up the token the current call was made with, if it was taken for this endpoint """
+        if reserved_token.get() != (platform, endpoint):
+            return False
+        reserved_token.set(None)
+        return True
+
+    def acquire(self, platform: str, endpoint: str) -> None:
+        """ Blocks until a call to the endpoint is allowed """
+        if self.take_reserved(platform, endpoint):
+            return
+        wait = self.bucket(platform, endpoint).reserve()
+        if wait > 0:
+            log.info(f'Waiting {wait:.1f}s for the {platform} {endpoint} rate limit')
+            clock.sleep(wait)
+
+    async def acquire_async(self, platform: str, endpoint: str) -> None:
+        """ Waits, without blocking the event loop, until a call to the endpoint is allowed """
+        if self.take_reserved(platform, endpoint):
+            return
+        wait = self.bucket(platform, endpoint).reserve()
+        if wait > 0:
+            log.info(f'Waiting {wait:.1f}s for the {platform} {endpoint} rate limit')
+            await clock.sleep_async(wait)
+
+    def call_reserved(self, platform: str, endpoint: str, func: Callable[..., Any], **kwargs: Any) -> Any:
+        """ Calls func with a token of the endpoint the caller already took with acquire_async,
+            so the first acquire() for the endpoint during the call does not wait for another.
+            Lets the scheduler wait out a rate limit before it gives the call a thread """
+        token = reserved_token.set((platform, endpoint))
+        try:
+            return func(**kwargs)
+        finally:
+            reserved_token.reset(token)
+
+    async def call_reserved_async(
+            self, platform: str, endpoint: str, func: Callable[..., Awaitable[Any]], **kwargs: Any,
+    ) -> Any:
+        """ call_reserved for coroutine functions """
+        token = reserved_token.set((platform, endpoint))
+        try:
+            return await func(**kwargs)
+        finally:
+            reserved_token.reset(token)
+
+    def retry_after(self, platform: str, endpoint: str, seconds: float) -> None:
+        """ Pauses an endpoint after the platform asked us to back off """
+        log.error(f'{platform} rate limited {endpoint}, backing off for {seconds:.0f}s')
+        self.bucket(platform, endpoint).pause(seconds)
+
+    def observe_headers(self, platform: str, endpoint: str, headers: Optional[Mapping[str, Any]]) -> None:
+        """ Adapts an endpoint's bucket to the rate limit headers of a response:
+            Retry-After, or X-Rate-Limit-Remaining / X-Rate-Limit-Reset (Twitter, epoch seconds)
+            and X-Ratelimit-Remaining / X-Ratelimit-Reset (Reddit, seconds from now) """
+        if not headers:
+            return
+        headers = {str(name).lower(): value for name, value in headers.items()}
+
+        if 'retry-after' in headers:
+            self.retry_after(platform, endpoint, float(headers['retry-after']))
+            return
+
+        for remaining_header, reset_header in (
+                ('x-rate-limit-remaining', 'x-rate-limit-reset'),
+                ('x-ratelimit-remaining', 'x-ratelimit-reset'),
+        ):
+            if remaining_header in headers and reset_header in headers:
+                reset = float(headers[reset_header])
+                # Epoch timestamps are turned into seconds from now
+                reset_in = reset - clock.now() if reset > 1e9 else reset
+                self.bucket(platform, endpoint).update(int(float(headers[remaining_header])), max(reset_in, 0.0))
+                return
+
+    def observe_error(self, platform: str, endpoint: str, error: BaseException) -> None:
+        """ Backs off an endpoint if an adapter call failed because of rate limiting """
+        response = getattr(error, 'response', None) or getattr(error, 'resp', None)
+        status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+        self.observe_headers(platform, endpoint, getattr(response, 'headers', None))
+
+        if status == 429 or type(error).__name__ in ('RateLimitError', 'TooManyRequests'):
+            bucket = self.bucket(platform, endpoint)
+            if bucket.wait_time() <= 0:
+                self.retry_after(platform, endpoint, DEFAULT_RETRY_AFTER)
+
+
+limiter = RateLimiter(DEFAULT_LIMITS)
+
+
+def rate_limited(platform: str, endpoint: str) -> Callable[[F], F]:
+    """ Decorates an adapter method so every call waits for the endpoint's rate limit,
+        and backs the endpoint off when a call is rejected for rate limiting """
+    def decorator(func: F) -> F:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                await limiter.acquire_async(platform, endpoint)
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    limiter.observe_error(platform, endpoint, e)
+                    raise
+            return async_wrapper  # type: ignore
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            limiter.acquire(platform, endpoint)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                limiter.observe_error(platform, endpoint, e)
+                raise
+        return wrapper  # type: ignore
+
+    return decorator
@@ -1,6 +1,8 @@
 from typing import List, Any
 import praw
 from postr.api_interface import ApiInterface
+from postr.api_interface import PostResult
+from postr.rate_limiter import rate_limited
 import postr.config
 
 # Scopes for user authentication
@@ -45,35 +47,36 @@ class Reddit(ApiInterface):
         self.subreddit_name = subreddit_name
         return True
 
-    def post_text(self, text: str) -> bool:
+    @rate_limited('Reddit', 'post')
+    def post_text(self, text: str) -> PostResult:
         ''' This method takes in the text the user want to post
-        and returns the success of this action'''
+        and returns the ID of the submission'''
         # TODO set title to something other than first 20 characters of text
         subreddit = self.client.subreddit('Postr')
-        subreddit.submit(text[0:20], selftext=text)
-        return True
+        submission = subreddit.submit(text[0:20], selftext=text)
+        return str(submission.id)
 
-    def post_link(self, url: str, text: str) -> bool:
+    @rate_limited('Reddit', 'post')
+    def post_link(self, url: str, text: str) -> PostResult:
         ''' This method takes in the simple link the user want to post
-        and returns the success of this action'''
+        and returns the ID of the submission'''
         # TODO set_subreddit should add subreddit to config.
         subreddit = self.client.subreddit('Postr')
-        subreddit.submit(text, url=url)
-        return True
+        submission = subreddit.submit(text, url=url)
+        return str(submission.id)
 
-    def post_video(self, url: str, text: str) -> bool:
+    def post_video(self, url: str, text: str) -> PostResult:
         ''' This method takes in the url for the video the user
-        want to post and returns the success of this action'''
+        want to post and returns the ID of the submission'''
         # TODO differentiate between YouTube video and image handling site if needed.
-        self.post_link(url, text)
-        return True
+        return self.post_link(url, text)
 
-    def post_photo(self, url: str, text: str) -> bool:
+    def post_photo(self, url: str, text: str) -> PostResult:
         ''' This method takes in the url for the photo the user
-        want to post and returns the success of this action'''
-        self.post_link(url, text)
-        return True
+        want to post and returns the ID of the submission'''
+        return self.post_link(url, text)
 
+    @rate_limited('Reddit', 'read')
     def get_user_likes(self) -> int:
         ''' This method returns the number of likes a user has total between link and client'''
         return int(self.client.user.me().comment_karma + self.client.user.me().link_karma)
@@ -90,6 +93,7 @@ class Reddit(ApiInterface):
         # pylint: disable=R0201
         return None  # type: ignore
 
+    @rate_limited('Reddit', 'delete')
     def remove_post(self, post_id: str) -> bool:
         ''' This method removes the post with the specified id
         and returns the success of this action'''
@@ -98,6 +102,7 @@ class Reddit(ApiInterface):
         submission.delete()
         return True
 
+    @rate_limited('Reddit', 'delete')
     def remove_comment(self, post_id: str) -> bool:
         ''' This method removes the post with the specified id
         and returns the success of this action'''
@@ -106,6 +111,7 @@ class Reddit(ApiInterface):
         comment.delete()
         return True
 
+    @rate_limited('Reddit', 'read')
     def top_submissions_in_subreddit(self, subreddit_name: str) -> List:
         ''' This method takes in a subreddit
         and returns the subreddit's top submissions at the time'''
@@ -115,6 +121,7 @@ class Reddit(ApiInterface):
             submission_list.append(submission)
         return submission_list
 
+    @rate_limited('Reddit', 'read')
     def top_submissions_in_subreddit_filter_by_words(self, subreddit_name: str, words: List[str]) -> List:
         ''' This method takes in a subreddit
         and returns the subreddit's top submissions at the time filtered by words in title'''
@@ -125,6 +132,7 @@ class Reddit(ApiInterface):
                 submission_list.append(submission)
         return submission_list
 
+    @rate_limited('Reddit', 'wiki')
     def create_wiki_page(self, subreddit_name: str, wiki_page_name: str, wiki_content: str) -> bool:
         ''' This method takes in a subreddit that a user is a mod of
         and creates a new wiki page on it
@@ -133,6 +141,7 @@ class Reddit(ApiInterface):
         subreddit_wiki.create(wiki_page_name, wiki_content)
         return True
 
+    @rate_limited('Reddit', 'read')
     def return_wiki_listings(self, subreddit_name: str) -> List:
         ''' This method takes in a subreddit
         and returns the wiki pages'''
@@ -141,6 +150,7 @@ class Reddit(ApiInterface):
             wiki_pages.append(wiki_page)
         return wiki_pages
 
+    @rate_limited('Reddit', 'wiki')
     def edit_wiki_page(self, subreddit_name: str, wiki_page_name: str, wiki_content: str) -> bool:
         ''' This method takes in a subreddit that a user is a mod of
         and edits a wiki page on it
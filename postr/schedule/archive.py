@@ -0,0 +1,240 @@
+"""
+Archival of finished jobs into one database file per month.
+
+CustomJob only ever grows: every occurrence of every job stays in it after it ran.
+archive_jobs() moves occurrences that finished (done or cancelled) more than
+ARCHIVE_AFTER_DAYS ago, in batches, into an archive file for the month they were due,
+e.g. master_schedule.2019-03.sqlite next to master_schedule.sqlite, along with their
+DispatchJournal entries and JobPlatform targets. A Job moves too once nothing in the
+schedule database refers to it any more: no occurrence, recurring job, dead letter or
+post receipt. So the schedule database holds what is upcoming, in flight or recent,
+however many years of history there are.
+
+Archives have the same schema as the schedule database. Rows are copied with
+INSERT OR REPLACE before they are deleted, so a batch interrupted between the two,
+whose archive copy committed without the delete, is simply copied again.
+history() and query_all() read the schedule database and the archives together.
+"""
+import argparse
+from datetime import datetime as dt
+import glob
+import os
+import re
+import sqlite3
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+
+from postr.schedule.database import ConnectionPool
+from postr.schedule.database import DB_PATH
+from postr.schedule.database import get_pool
+from postr.schedule.database import rows_to_dicts
+from postr.schedule.job_status import CANCELLED
+from postr.schedule.job_status import DONE
+from postr.schedule.migrations import migrate
+from postr.schedule.recurrence import RECURRING_TABLES
+
+# Finished occurrences stay in the schedule database this long before they are archived
+ARCHIVE_AFTER_DAYS = 30
+
+# Occurrences moved per write transaction, so the Reader is never locked out for long
+ARCHIVE_BATCH_SIZE = 1000
+
+# How often the Reader archives, when it does
+ARCHIVE_INTERVAL_SECONDS = 60 * 60
+
+ARCHIVED_STATUSES = (DONE, CANCELLED)
+
+MONTH_PATTERN = re.compile(r'\.(\d{4}-\d{2})\.sqlite$')
+
+
+def month_of(timestamp: int) -> str:
+    """ Returns the local 'YYYY-MM' month of a timestamp, which names its archive """
+    return dt.fromtimestamp(timestamp).strftime('%Y-%m')
+
+
+def archive_path(db_path: str, month: str) -> str:
+    """ Returns the path of a month's archive of a schedule database """
+    return f'{os.path.splitext(db_path)[0]}.{month}.sqlite'
+
+
+def archive_paths(db_path: str, since: Optional[int] = None, until: Optional[int] = None) -> List[str]:
+    """ Returns the existing archives of a schedule database, oldest first, limited to the
+        months from since until until when given """
+    paths = []
+    first = month_of(since) if since is not None else None
+    last = month_of(until) if until is not None else None
+    for path in sorted(glob.glob(archive_path(glob.escape(db_path), '*'))):
+        match = MONTH_PATTERN.search(path)
+        if match is None:
+            continue
+        month = match.group(1)
+        if (first is None or month >= first) and (last is None or month <= last):
+            paths.append(path)
+    return paths
+
+
+def _columns(cursor: sqlite3.Cursor, table: str) -> str:
+    cursor.execute(f'PRAGMA main.table_info({table})')
+    return ', '.join(row[1] for row in cursor.fetchall())
+
+
+def _copy(cursor: sqlite3.Cursor, table: str, key: str, ids: Sequence[int]) -> None:
+    """ Copies the rows of a table whose key is in ids into the attached archive """
+    columns = _columns(cursor, table)
+    cursor.execute(
+        f"""INSERT OR REPLACE INTO archive.{table}({columns})
+            SELECT {columns} FROM main.{table} WHERE {key} IN ({', '.join('?' * len(ids))})""",
+        ids,
+    )
+
+
+def _unreferenced_jobs(cursor: sqlite3.Cursor, job_ids: Sequence[int]) -> List[int]:
+    """ Returns the Jobs among job_ids that nothing in the schedule database refers to """
+    referring_tables = ['CustomJob', 'DeadLetter', 'PostReceipt', *RECURRING_TABLES]
+    cursor.execute(
+        f"""SELECT JobID FROM main.Job WHERE JobID IN ({', '.join('?' * len(job_ids))})
+            {''.join(
+                f' AND NOT EXISTS (SELECT 1 FROM main.{table} WHERE {table}.Job_ID = Job.JobID)'
+                for table in referring_tables
+            )}""",
+        job_ids,
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _archive_month(conn: sqlite3.Connection, db_path: str, month: str, custom_job_ids: List[int]) -> None:
+    """ Moves occurrences due in one month, and the Jobs only they referred to, to the month's archive """
+    path = archive_path(db_path, month)
+    if not os.path.exists(path):
+        archive = sqlite3.connect(path)
+        migrate(archive)
+        archive.close()
+
+    conn.commit()
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            placeholders = ', '.join('?' * len(custom_job_ids))
+            cursor.execute(
+                f'SELECT DISTINCT Job_ID FROM main.CustomJob WHERE CustomJobID IN ({placeholders})', custom_job_ids,
+            )
+            job_ids = [row[0] for row in cursor.fetchall()]
+
+            _copy(cursor, 'Job', 'JobID', job_ids)
+            _copy(cursor, 'CustomJob', 'CustomJobID', custom_job_ids)
+            for table in ('DispatchJournal', 'JobPlatform'):
+                _copy(cursor, table, 'CustomJob_ID', custom_job_ids)
+                cursor.execute(f'DELETE FROM main.{table} WHERE CustomJob_ID IN ({placeholders})', custom_job_ids)
+            cursor.execute(f'DELETE FROM main.CustomJob WHERE CustomJobID IN ({placeholders})', custom_job_ids)
+
+            unreferenced = _unreferenced_jobs(cursor, job_ids)
+            if unreferenced:
+                cursor.execute(
+                    f"DELETE FROM main.Job WHERE JobID IN ({', '.join('?' * len(unreferenced))})", unreferenced,
+                )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute('DETACH DATABASE archive')
+
+
+def archive_jobs(
+        pool: ConnectionPool,
+        now: int,
+        after_days: int = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+) -> int:
+    """ Moves one batch of occurrences that finished over after_days days before now
+        into their monthly archives. Returns how many moved; 0 once none are left """
+    with pool.acquire() as conn:
+        cursor = conn.execute(
+            f"""SELECT CustomJobID, CustomDate FROM CustomJob
+                WHERE Status IN ({', '.join('?' * len(ARCHIVED_STATUSES))}) AND CustomDate < ?
+                ORDER BY CustomDate
+                LIMIT ?""",
+            (*ARCHIVED_STATUSES, now - after_days * 24 * 60 * 60, batch_size),
+        )
+        by_month: Dict[str, List[int]] = {}
+        for custom_job_id, custom_date in cursor.fetchall():
+            by_month.setdefault(month_of(custom_date), []).append(custom_job_id)
+
+        for month, custom_job_ids in by_month.items():
+            _archive_month(conn, pool.path, month, custom_job_ids)
+        return sum(len(custom_job_ids) for custom_job_ids in by_month.values())
+
+
+def query_all(
+        db_path: str,
+        sql: str,
+        parameters: Sequence[Any] = (),
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """ Runs a read-only query on the archives of the months from since until until, oldest first,
+        then on the schedule database, and returns all of their rows as dicts """
+    rows: List[Dict[str, Any]] = []
+    seen: Set[str] = set()
+    for path in [*archive_paths(db_path, since, until), db_path]:
+        if path in seen or not os.path.exists(path):
+            continue
+        seen.add(path)
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            rows.extend(rows_to_dicts(conn.execute(sql, parameters)))
+        finally:
+            conn.close()
+    return rows
+
+
+def history(
+        db_path: str,
+        since: int,
+        until: int,
+        job_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """ Returns every occurrence due from since until until, archived or not, with its Job,
+        in order of due date. Limited to the occurrences of one Job when job_id is given """
+    sql = """SELECT * FROM CustomJob
+        INNER JOIN Job ON Job.JobID = CustomJob.Job_ID
+        WHERE CustomJob.CustomDate BETWEEN ? AND ?"""
+    parameters: List[Any] = [since, until]
+    if job_id is not None:
+        sql += ' AND CustomJob.Job_ID = ?'
+        parameters.append(job_id)
+
+    # An occurrence is in both only if archiving it was interrupted; the schedule database's copy comes last
+    rows = {row['CustomJobID']: row for row in query_all(db_path, sql, parameters, since, until)}
+    return sorted(rows.values(), key=lambda row: (row['CustomDate'], row['CustomJobID']))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Move finished jobs into monthly archive databases')
+    parser.add_argument(
+        '--after-days', type=int, default=ARCHIVE_AFTER_DAYS,
+        help=f'archive jobs finished this many days ago (default {ARCHIVE_AFTER_DAYS})',
+    )
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='jobs moved per transaction')
+    args = parser.parse_args()
+
+    pool = get_pool(DB_PATH)
+    now = int(time.time())
+    total = 0
+    while True:
+        moved = archive_jobs(pool, now, args.after_days, args.batch_size)
+        if not moved:
+            break
+        total += moved
+    print(f'Archived {total} jobs into {len(archive_paths(DB_PATH))} monthly archives')
+
+
+if __name__ == '__main__':
+    main()
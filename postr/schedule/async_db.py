@@ -0,0 +1,70 @@
+"""
+Awaitable access to the schedule database for code running on an event loop.
+
+sqlite3 calls block, so a coroutine that queries the database directly freezes
+every other coroutine on the loop, the Discord client included, until SQLite
+answers. AsyncDatabase runs that work on a dedicated thread with its own pooled
+connection, and the loop keeps dispatching while it waits. One thread is enough:
+SQLite runs a single writer at a time anyway, and the queries are index lookups.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import sqlite3
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import TypeVar
+
+from postr.schedule.database import ConnectionPool
+
+T = TypeVar('T')
+
+
+class AsyncDatabase():
+    """
+    Runs schedule database work on a dedicated thread, and lets coroutines await the result.
+    Work submitted through one AsyncDatabase runs in order, on the thread's own connection
+    """
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self.pool = pool
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='schedule-db')
+
+    async def run(self, function: Callable[..., T], *args: Any) -> T:
+        """ Runs function(*args) on the database thread """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, partial(function, *args))
+
+    async def query(self, sql: str, parameters: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """ Runs a query and returns its rows as dicts """
+        return await self.run(self.pool.query, sql, parameters)
+
+    async def query_one(self, sql: str, parameters: Sequence[Any] = ()) -> Optional[Any]:
+        """ Runs a query and returns the first column of its first row """
+        return await self.run(self.pool.query_one, sql, parameters)
+
+    async def execute(self, sql: str, parameters: Sequence[Any] = ()) -> int:
+        """ Runs and commits a single write, returning the rows changed """
+        return await self.run(self.pool.execute, sql, parameters)
+
+    async def executemany(self, sql: str, parameters: Iterable[Sequence[Any]]) -> int:
+        """ Runs and commits a write for every set of parameters, in one transaction """
+        return await self.run(self.pool.executemany, sql, parameters)
+
+    async def transaction(self, work: Callable[[sqlite3.Cursor], T]) -> T:
+        """ Runs work(cursor) in a write transaction, committed if it returns """
+        def run_in_transaction() -> T:
+            with self.pool.transaction() as cursor:
+                return work(cursor)
+
+        return await self.run(run_in_transaction)
+
+    def close(self) -> None:
+        """ Closes the database thread's connection and stops the thread """
+        self.executor.submit(self.pool.release).result()
+        self.executor.shutdown()
@@ -0,0 +1,186 @@
+"""
+Connections to the schedule database.
+
+Every connection runs in WAL mode, so readers never wait for a writer and a
+writer only waits for another writer, for at most BUSY_TIMEOUT_MS. A
+ConnectionPool hands each thread its own connection, and an asyncio task or any
+other unit of work can check one out for itself with acquire(), so no
+connection or cursor is ever shared by two threads at once.
+
+The query helpers run on the calling thread's connection, whose statement cache
+keeps the compiled form of every SQL string it has seen: pass the same SQL with
+different parameters and the statement is prepared only once.
+"""
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+from postr.schedule import migrations
+
+DB_PATH = os.path.join('postr', 'schedule', 'master_schedule.sqlite')
+
+# How long a write waits for another writer's lock before "database is locked"
+BUSY_TIMEOUT_MS = 10_000
+
+# Compiled statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+
+def connect(path: str = DB_PATH) -> sqlite3.Connection:
+    """ Opens a connection to the schedule database with the settings every connection uses:
+        WAL journal, synchronous=NORMAL (durable at every WAL checkpoint, and never corrupt)
+        and a busy timeout instead of failing at once on a locked database """
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def rows_to_dicts(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    """ Returns the remaining rows of the cursor's last query as dicts of column to value """
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class ConnectionPool():
+    """
+    Connections to one schedule database, one per thread plus any checked out with acquire().
+    The database is migrated to the latest schema when the pool is created.
+    """
+
+    def __init__(self, path: str = DB_PATH) -> None:
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.idle: List[sqlite3.Connection] = []
+        self.connections: List[sqlite3.Connection] = []
+
+        with self.acquire() as conn:
+            migrations.migrate(conn)
+
+    def connect(self) -> sqlite3.Connection:
+        """ Opens a new connection that belongs to the pool, and is closed with it """
+        conn = connect(self.path)
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """ Returns the calling thread's connection """
+        conn: Optional[sqlite3.Connection] = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = self.connect()
+            self.local.cursor = conn.cursor()
+        return conn
+
+    def cursor(self) -> sqlite3.Cursor:
+        """ Returns the calling thread's cursor, on the thread's connection """
+        self.connection()
+        cursor: sqlite3.Cursor = self.local.cursor
+        return cursor
+
+    @contextmanager
+    def acquire(self) -> Iterator[sqlite3.Connection]:
+        """ Checks out a connection for a single unit of work, e.g. an asyncio task
+            that awaits in the middle of a transaction, and returns it to the pool after """
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            conn = self.connect()
+
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            with self.lock:
+                self.idle.append(conn)
+
+    @contextmanager
+    def transaction(self, conn: Optional[sqlite3.Connection] = None) -> Iterator[sqlite3.Cursor]:
+        """ Runs a block in a write transaction on conn, by default the thread's connection.
+            The write lock is taken up front, so the block never fails halfway on a busy database """
+        conn = conn or self.connection()
+        conn.commit()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def query(self, sql: str, parameters: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """ Runs a query on the thread's connection and returns its rows as dicts """
+        cursor = self.connection().execute(sql, parameters)
+        return rows_to_dicts(cursor)
+
+    def query_one(self, sql: str, parameters: Sequence[Any] = ()) -> Optional[Any]:
+        """ Runs a query on the thread's connection and returns the first column of its first row """
+        row = self.connection().execute(sql, parameters).fetchone()
+        return row[0] if row else None
+
+    def execute(self, sql: str, parameters: Sequence[Any] = ()) -> int:
+        """ Runs and commits a single write on the thread's connection, returning the rows changed """
+        conn = self.connection()
+        changed: int = conn.execute(sql, parameters).rowcount
+        conn.commit()
+        return changed
+
+    def executemany(self, sql: str, parameters: Iterable[Sequence[Any]]) -> int:
+        """ Runs and commits a write for every set of parameters, in one transaction """
+        with self.transaction() as cursor:
+            cursor.executemany(sql, parameters)
+            changed: int = cursor.rowcount
+        return changed
+
+    def release(self, conn: Optional[sqlite3.Connection] = None) -> None:
+        """ Closes a connection from connect(), by default the calling thread's connection,
+            e.g. before the thread exits """
+        if conn is None:
+            conn = getattr(self.local, 'conn', None)
+            self.local.conn = self.local.cursor = None
+        if conn is None:
+            return
+
+        with self.lock:
+            if conn in self.connections:
+                self.connections.remove(conn)
+        conn.close()
+
+    def close(self) -> None:
+        """ Closes every connection of the pool """
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+            self.idle.clear()
+        self.local = threading.local()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str = DB_PATH) -> ConnectionPool:
+    """ Returns the process-wide pool of a database, so the Reader, the Writer
+        and anything else in the process share connections """
+    key = os.path.abspath(path)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(path)
+        return _pools[key]
@@ -0,0 +1,201 @@
+"""
+Streaming import of scheduled jobs from CSV or JSONL files.
+
+Each row is one post: a date, the platforms and action, and the action's arguments,
+in columns named like the fields of JobSpec:
+
+    date,platforms,action,comment,media_path,optional_text,campaign
+    2019-05-01 09:00,"Twitter,Slack",post_text,Launch day!,,,launch
+
+campaign and person_id are optional, and group jobs to retract together.
+
+Rows are read, validated against the platforms' supported actions and written in
+batches of batch_size jobs, one transaction each, so memory use does not depend on
+the size of the file. Rejected rows are written to a report as they are found.
+
+Usage: python -m postr.schedule.importer campaign.csv [--rejects rejected.csv] [--batch-size 1000]
+"""
+import argparse
+import csv
+from datetime import datetime as dt
+import json
+import os
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import TextIO
+from typing import Tuple
+
+from postr.schedule.task_processor import api_to_function
+from postr.schedule.task_processor import dispatch_table
+from postr.schedule.task_processor import get_existing_arguments
+from postr.schedule.writer import JobSpec
+from postr.schedule.writer import Writer
+
+# Jobs written per transaction
+BATCH_SIZE = 1000
+
+# Accepted formats of the date column, besides a Unix timestamp. Dates are local time
+DATE_FORMATS = ['%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S']
+
+COLUMNS = list(JobSpec._fields)
+
+
+class ImportResult(NamedTuple):
+    """ How many rows of a file were imported and rejected """
+    imported: int
+    rejected: int
+
+
+class RejectedRow(Exception):
+    """ Raised for a row that cannot be scheduled, with the reason """
+
+
+def read_csv(file: TextIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """ Yields the line number and columns of each row of a CSV file with a header row """
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(file: TextIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """ Yields the line number and object of each line of a JSON lines file """
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {'error': f'Invalid JSON: {e}'}
+        yield line_number, row if isinstance(row, dict) else {'error': 'Not a JSON object'}
+
+
+def parse_date(value: Any) -> int:
+    """ Returns the Unix timestamp of a date column """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+
+    text = str(value or '').strip()
+    if text.isdigit():
+        return int(text)
+    for date_format in DATE_FORMATS:
+        try:
+            return int(dt.strptime(text, date_format).timestamp())
+        except ValueError:
+            continue
+    raise RejectedRow(f'Invalid date "{text}"')
+
+
+def validate(row: Dict[str, Any], now: int, allow_past: bool = False) -> JobSpec:
+    """ Returns the job a row describes, or raises RejectedRow with why it cannot be scheduled """
+    if 'error' in row and len(row) == 1:
+        raise RejectedRow(row['error'])
+
+    missing = [column for column in ('date', 'platforms', 'action') if not row.get(column)]
+    if missing:
+        raise RejectedRow(f'Missing {", ".join(missing)}')
+
+    date = parse_date(row['date'])
+    if date < now and not allow_past:
+        raise RejectedRow(f'Date {dt.fromtimestamp(date)} is in the past')
+
+    person_id = str(row.get('person_id') or '').strip()
+    if person_id and not person_id.isdigit():
+        raise RejectedRow(f'Invalid person_id "{person_id}"')
+
+    spec = JobSpec(
+        date=date,
+        comment=str(row.get('comment') or ''),
+        media_path=str(row.get('media_path') or ''),
+        optional_text=str(row.get('optional_text') or ''),
+        platforms=','.join(platform.strip() for platform in str(row['platforms']).split(',')),
+        action=str(row['action']).strip(),
+        campaign=str(row.get('campaign') or '').strip() or None,
+        person_id=int(person_id) if person_id else None,
+    )
+
+    provided = get_existing_arguments({
+        'Comment': spec.comment,
+        'MediaPath': spec.media_path,
+        'OptionalText': spec.optional_text,
+    })
+    for platform in spec.platforms.split(','):
+        if platform not in api_to_function:
+            raise RejectedRow(f'Unknown platform "{platform}"')
+        dispatch = dispatch_table.get((platform, spec.action))
+        if dispatch is None:
+            raise RejectedRow(f'{platform} does not support {spec.action}')
+        if not dispatch.required_arguments <= provided:
+            missing_arguments = ', '.join(sorted(dispatch.required_arguments - provided))
+            raise RejectedRow(f'{spec.action} on {platform} needs {missing_arguments}')
+
+    return spec
+
+
+def import_jobs(
+        file: TextIO,
+        writer: Writer,
+        file_format: str = 'csv',
+        rejects: Optional[TextIO] = None,
+        batch_size: int = BATCH_SIZE,
+        allow_past: bool = False,
+) -> ImportResult:
+    """ Schedules every valid row of a CSV or JSONL file, batch_size jobs per transaction.
+        Each rejected row is written to rejects as a CSV row: its line, the reason and its columns """
+    rows = read_jsonl(file) if file_format == 'jsonl' else read_csv(file)
+    report = csv.writer(rejects) if rejects is not None else None
+    if report is not None:
+        report.writerow(['line', 'reason'] + COLUMNS)
+
+    now = Writer.now()
+    imported = rejected = 0
+    batch: List[JobSpec] = []
+    for line_number, row in rows:
+        try:
+            batch.append(validate(row, now, allow_past))
+        except RejectedRow as e:
+            rejected += 1
+            if report is not None:
+                report.writerow([line_number, str(e)] + [row.get(column, '') for column in COLUMNS])
+            continue
+
+        if len(batch) >= batch_size:
+            imported += len(writer.create_jobs(batch))
+            batch = []
+
+    if batch:
+        imported += len(writer.create_jobs(batch))
+
+    return ImportResult(imported, rejected)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Schedule the posts of a CSV or JSONL file')
+    parser.add_argument('path', help='file to import, .csv or .jsonl')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='file format, by default from the extension')
+    parser.add_argument('--rejects', help='where to write rejected rows, by default next to the file')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='jobs written per transaction')
+    parser.add_argument('--allow-past', action='store_true', help='schedule rows dated in the past right away')
+    args = parser.parse_args()
+
+    file_format = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.json')) else 'csv')
+    rejects_path = args.rejects or f'{os.path.splitext(args.path)[0]}.rejected.csv'
+
+    writer = Writer()
+    with open(args.path, newline='', encoding='utf-8') as file, \
+            open(rejects_path, 'w', newline='', encoding='utf-8') as rejects:
+        result = import_jobs(file, writer, file_format, rejects, args.batch_size, args.allow_past)
+    writer.cleanup()
+
+    print(f'Imported {result.imported} jobs')
+    if result.rejected:
+        print(f'Rejected {result.rejected} rows, see {rejects_path}')
+    else:
+        os.remove(rejects_path)
+
+
+if __name__ == '__main__':
+    main()
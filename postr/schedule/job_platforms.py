@@ -0,0 +1,187 @@
+"""
+JobPlatform: one row per occurrence and platform it targets, with that platform's status.
+
+Job.Platforms is a comma-separated list, which cannot be indexed, so what is queued for
+one platform could only be found by reading and splitting every job. JobPlatform holds
+the targets one per row, indexed on (Platform, DueTime) and (Status, DueTime), and follows
+each platform through the job lifecycle: pending, claimed while a Reader dispatches it,
+then done, retrying (due again at its own DueTime), failed or cancelled.
+
+Job.Platforms only says which targets a new occurrence gets, see add(). From then on the
+targets alone decide what is claimed, dispatched and retried: a Reader claims the jobs
+with targets due, and dispatches each job to the targets it claimed.
+"""
+import sqlite3
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import Set
+
+from postr.schedule import database
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.job_status import DONE
+from postr.schedule.job_status import PENDING
+from postr.schedule.job_status import RETRYING
+from postr.schedule.task_processor import DispatchError
+
+# Statuses of a platform still waiting to be dispatched
+QUEUED = (PENDING, RETRYING)
+
+
+def split_platforms(platforms: Optional[str]) -> List[str]:
+    return [platform for platform in (platforms or '').split(',') if platform]
+
+
+def add(cursor: sqlite3.Cursor, first_custom_job_id: int, last_custom_job_id: int) -> None:
+    """ Adds the pending targets of the CustomJobs with IDs from first to last, inserted just before """
+    cursor.execute(
+        """SELECT CustomJob.CustomJobID, CustomJob.CustomDate, Job.Platforms FROM CustomJob
+            INNER JOIN Job ON Job.JobID = CustomJob.Job_ID
+            WHERE CustomJob.CustomJobID BETWEEN ? AND ?""",
+        (first_custom_job_id, last_custom_job_id),
+    )
+    cursor.executemany(
+        'INSERT OR IGNORE INTO JobPlatform(CustomJob_ID, Platform, DueTime, Status) VALUES(?, ?, ?, ?)',
+        [
+            (custom_job_id, platform, due_time, PENDING)
+            for custom_job_id, due_time, platforms in cursor.fetchall()
+            for platform in split_platforms(platforms)
+        ],
+    )
+
+
+def due(cursor: sqlite3.Cursor, now: int, limit: int) -> List[int]:
+    """ Returns up to limit jobs with targets due by now that no Reader holds, retries first, then
+        earliest due first. Each status is a range walk over the (Status, DueTime) index
+        that stops once limit jobs are found """
+    custom_job_ids: List[int] = []
+    seen: Set[int] = set()
+    for status in (RETRYING, PENDING):
+        # CROSS JOIN keeps JobPlatform the outer loop, so the walk follows the index
+        cursor.execute(
+            """SELECT JobPlatform.CustomJob_ID FROM JobPlatform
+                CROSS JOIN CustomJob ON CustomJob.CustomJobID = JobPlatform.CustomJob_ID
+                WHERE JobPlatform.Status = ? AND JobPlatform.DueTime <= ? AND CustomJob.Status IN (?, ?)
+                ORDER BY JobPlatform.DueTime, JobPlatform.CustomJob_ID""",
+            (status, now, *QUEUED),
+        )
+        for row in cursor:
+            if len(custom_job_ids) >= limit:
+                return custom_job_ids
+            if row[0] not in seen:
+                seen.add(row[0])
+                custom_job_ids.append(row[0])
+    return custom_job_ids
+
+
+def next_due_time(cursor: sqlite3.Cursor) -> Optional[int]:
+    """ Returns the earliest due time of a target of a job no Reader holds, None if there is none """
+    due_times = []
+    for status in QUEUED:
+        cursor.execute(
+            """SELECT JobPlatform.DueTime FROM JobPlatform
+                CROSS JOIN CustomJob ON CustomJob.CustomJobID = JobPlatform.CustomJob_ID
+                WHERE JobPlatform.Status = ? AND CustomJob.Status IN (?, ?)
+                ORDER BY JobPlatform.DueTime
+                LIMIT 1""",
+            (status, *QUEUED),
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            due_times.append(row[0])
+    return min(due_times, default=None)
+
+
+def claim(cursor: sqlite3.Cursor, custom_job_ids: Sequence[int], now: int) -> Dict[int, List[str]]:
+    """ Marks the targets of claimed jobs that are due by now claimed, and returns the platforms
+        each job is to be dispatched to: its claimed targets, including any left claimed by a
+        worker whose lease ran out. Targets due later stay queued """
+    placeholders = ', '.join('?' * len(custom_job_ids))
+    cursor.execute(
+        f"""UPDATE JobPlatform SET Status = ?
+            WHERE CustomJob_ID IN ({placeholders}) AND Status IN (?, ?) AND DueTime <= ?""",
+        (CLAIMED, *custom_job_ids, *QUEUED, now),
+    )
+    cursor.execute(
+        f"""SELECT CustomJob_ID, Platform FROM JobPlatform
+            WHERE CustomJob_ID IN ({placeholders}) AND Status = ?
+            ORDER BY JobPlatformID""",
+        (*custom_job_ids, CLAIMED),
+    )
+    platforms: Dict[int, List[str]] = {custom_job_id: [] for custom_job_id in custom_job_ids}
+    for custom_job_id, platform in cursor.fetchall():
+        platforms[custom_job_id].append(platform)
+    return platforms
+
+
+def waiting(cursor: sqlite3.Cursor, custom_job_id: int) -> Optional[str]:
+    """ Returns the status a job goes back to once dispatched, when it has targets still queued
+        for later: retrying if any of them is, else pending. None if it has none """
+    cursor.execute(
+        f"""SELECT DISTINCT Status FROM JobPlatform
+            WHERE CustomJob_ID = ? AND Status IN ({', '.join('?' * len(QUEUED))})""",
+        (custom_job_id, *QUEUED),
+    )
+    statuses = {row[0] for row in cursor.fetchall()}
+    if not statuses:
+        return None
+    return RETRYING if RETRYING in statuses else PENDING
+
+
+def succeed(cursor: sqlite3.Cursor, custom_job_id: int, failed: Iterable[str], now: int) -> None:
+    """ Marks the claimed targets of a dispatched job done, except the failed platforms """
+    failed = list(failed)
+    cursor.execute(
+        f"""UPDATE JobPlatform SET Status = ?, FinishedAt = ?, Error = NULL
+            WHERE CustomJob_ID = ? AND Status = ? AND Platform NOT IN ({', '.join('?' * len(failed))})""",
+        (DONE, now, custom_job_id, CLAIMED, *failed),
+    )
+
+
+def fail(
+        cursor: sqlite3.Cursor,
+        custom_job_id: int,
+        errors: Mapping[str, DispatchError],
+        status: str,
+        now: int,
+        retry_at: Optional[int] = None,
+) -> None:
+    """ Records the errors of the platforms a job failed on, now retrying at retry_at or failed """
+    cursor.executemany(
+        """UPDATE JobPlatform SET Status = ?, DueTime = COALESCE(?, DueTime), FinishedAt = ?, Error = ?
+            WHERE CustomJob_ID = ? AND Platform = ?""",
+        [
+            (status, retry_at, None if retry_at else now, error.message, custom_job_id, platform)
+            for platform, error in errors.items()
+        ],
+    )
+
+
+def requeue(cursor: sqlite3.Cursor, custom_job_id: int, platforms: Iterable[str]) -> None:
+    """ Makes the targets of a job on platforms pending again, due at the job's CustomDate """
+    cursor.executemany(
+        """UPDATE JobPlatform SET Status = ?, FinishedAt = NULL,
+                DueTime = (SELECT CustomDate FROM CustomJob WHERE CustomJobID = JobPlatform.CustomJob_ID)
+            WHERE CustomJob_ID = ? AND Platform = ?""",
+        [(PENDING, custom_job_id, platform) for platform in platforms],
+    )
+
+
+def queued(cursor: sqlite3.Cursor, platform: str, since: int, until: int) -> List[Dict[str, Any]]:
+    """ Returns what is queued for a platform with a due time from since to until, with its Job,
+        soonest first: a range walk over the (Platform, DueTime) index """
+    cursor.execute(
+        f"""SELECT JobPlatform.*, CustomJob.Job_ID, Job.Comment, Job.MediaPath, Job.OptionalText, Job.Action
+            FROM JobPlatform
+            INNER JOIN CustomJob ON CustomJob.CustomJobID = JobPlatform.CustomJob_ID
+            INNER JOIN Job ON Job.JobID = CustomJob.Job_ID
+            WHERE JobPlatform.Platform = ? AND JobPlatform.DueTime BETWEEN ? AND ?
+                AND JobPlatform.Status IN ({', '.join('?' * len(QUEUED))})
+            ORDER BY JobPlatform.DueTime, JobPlatform.CustomJob_ID""",
+        (platform, since, until, *QUEUED),
+    )
+    return database.rows_to_dicts(cursor)
@@ -0,0 +1,15 @@
+"""
+Lifecycle of a CustomJob row.
+
+A job is pending until one of its JobPlatform targets is due and a Reader claims it.
+A claimed job ends done, is pending again when it has targets due later,
+or is retrying until its RetryAt when some platforms failed, or failed once it ran
+out of retries, in which case it also has a row in DeadLetter. A job retracted
+before it ran is cancelled.
+"""
+PENDING = 'pending'
+CLAIMED = 'claimed'
+RETRYING = 'retrying'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
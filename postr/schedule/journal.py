@@ -0,0 +1,119 @@
+"""
+The dispatch journal: at most one post per job occurrence and platform.
+
+Before a platform call, the Reader records it in DispatchJournal as started, under an
+idempotency key derived from the Job, its scheduled date, the platform and the content
+of the post. After the call, the entry is marked succeeded or failed. A later dispatch
+of the same post, whether a retry, a reclaim after a crash or a duplicate CustomJob
+row, looks the key up first:
+
+    succeeded   the platform is skipped, the post already went out
+    failed      the call is made again
+    started     by a job another worker holds a live claim on: skipped, that worker is on it;
+                otherwise the call stopped halfway, e.g. the worker crashed, and may or may
+                not have posted. The platform fails without retrying, so the job lands in the
+                dead letters for someone to check; replaying it clears the entry
+
+A call that fails in doubt, e.g. its worker process died or hung during it, is left started
+as well, so it is never made again on its own either.
+"""
+import hashlib
+import sqlite3
+from typing import Any
+from typing import Dict
+from typing import Mapping
+from typing import Sequence
+
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.task_processor import DispatchError
+
+STARTED = 'started'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Columns of a task that identify a post, besides the platform
+KEY_COLUMNS = ('Job_ID', 'CustomDate', 'Action', 'Comment', 'MediaPath', 'OptionalText')
+
+
+def idempotency_key(task: Mapping[str, Any], platform: str) -> str:
+    """ Returns the key of posting a task on a platform: the same post of the same job,
+        due at the same time, always has the same key """
+    content = '\0'.join(str(task.get(column) or '') for column in KEY_COLUMNS) + '\0' + platform
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def platforms_of(task: Mapping[str, Any]) -> Sequence[str]:
+    return [platform for platform in (task['Platforms'] or '').split(',') if platform]
+
+
+def begin(cursor: sqlite3.Cursor, task: Dict[str, Any], worker_id: str, now: int) -> Dict[str, DispatchError]:
+    """ Journals the calls about to be made for a task, and narrows its Platforms to them.
+        Platforms that already posted it, or are posting it for another job, are dropped.
+        Returns the platforms whose earlier call is in doubt, each with its error """
+    keys = {platform: idempotency_key(task, platform) for platform in platforms_of(task)}
+    if not keys:
+        return {}
+
+    cursor.execute(
+        f"""SELECT DispatchJournal.IdempotencyKey, DispatchJournal.Status, DispatchJournal.CustomJob_ID,
+                   CustomJob.Status = ? AND CustomJob.LeaseExpiry > ? AS Claimed
+            FROM DispatchJournal
+            LEFT JOIN CustomJob ON CustomJob.CustomJobID = DispatchJournal.CustomJob_ID
+            WHERE IdempotencyKey IN ({', '.join('?' * len(keys))})""",
+        (CLAIMED, now, *keys.values()),
+    )
+    journaled = {key: (status, custom_job_id, claimed) for key, status, custom_job_id, claimed in cursor.fetchall()}
+
+    to_send = []
+    in_doubt = {}
+    for platform, key in keys.items():
+        status, custom_job_id, claimed = journaled.get(key, (None, None, None))
+        if status == SUCCEEDED:
+            continue
+        if status == STARTED:
+            if custom_job_id != task['CustomJobID'] and claimed:
+                continue
+            in_doubt[platform] = DispatchError(
+                f'{platform} may already have posted this: an earlier dispatch stopped before finishing '
+                f'(idempotency key {key})',
+                retryable=False,
+                in_doubt=True,
+            )
+            continue
+        to_send.append(platform)
+
+    cursor.executemany(
+        """INSERT OR REPLACE INTO DispatchJournal(IdempotencyKey, CustomJob_ID, Platform, Status, WorkerID, StartedAt)
+            VALUES(?, ?, ?, ?, ?, ?)""",
+        [(keys[platform], task['CustomJobID'], platform, STARTED, worker_id, now) for platform in to_send],
+    )
+    task['Platforms'] = ','.join(to_send)
+    return in_doubt
+
+
+def finish(cursor: sqlite3.Cursor, task: Mapping[str, Any], errors: Mapping[str, DispatchError], now: int) -> None:
+    """ Marks the journaled calls of a task succeeded, or failed on the platforms in errors.
+        Calls whose error is in doubt stay started, so they are not made again unless replayed """
+    cursor.executemany(
+        """UPDATE DispatchJournal SET Status = ?, FinishedAt = ?, Error = ?
+            WHERE IdempotencyKey = ? AND Status = ?""",
+        [
+            (
+                FAILED if platform in errors else SUCCEEDED,
+                now,
+                errors[platform].message if platform in errors else None,
+                idempotency_key(task, platform),
+                STARTED,
+            )
+            for platform in platforms_of(task)
+            if not (platform in errors and errors[platform].in_doubt)
+        ],
+    )
+
+
+def clear_in_doubt(cursor: sqlite3.Cursor, custom_job_ids: Sequence[int]) -> None:
+    """ Forgets the unfinished calls of jobs, so they are made again, e.g. when a dead letter is replayed """
+    cursor.executemany(
+        'DELETE FROM DispatchJournal WHERE CustomJob_ID = ? AND Status = ?',
+        [(custom_job_id, STARTED) for custom_job_id in custom_job_ids],
+    )
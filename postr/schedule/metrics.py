@@ -0,0 +1,200 @@
+"""
+Scheduler metrics: how late posts go out, how long platform calls take and how
+much work each scan finds, as counters and histograms in the Prometheus text format.
+
+The task processor and the Reader record into the process-wide `metrics`. A Reader
+started with metrics_port serves them at http://127.0.0.1:<port>/metrics, and one
+started with metrics_file rewrites that file every METRICS_INTERVAL_SECONDS, e.g.
+for the node exporter's textfile collector.
+"""
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+import os
+import threading
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+# How often a Reader rewrites its metrics file
+METRICS_INTERVAL_SECONDS = 15
+
+# Upper bounds of the histogram buckets, in seconds or jobs
+LAG_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+CALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+BATCH_BUCKETS = (1, 5, 10, 50, 100, 250, 500, 1000)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return f'{{{pairs}}}'
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter():
+    """ A thread-safe count of events, one per combination of label values """
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self.values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}')
+        return lines
+
+
+class Histogram():
+    """ A thread-safe distribution of observed values over fixed buckets,
+        with their sum and count, one per combination of label values """
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float], labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.labels = tuple(labels)
+        # label values -> [count per bucket..., count above the last bucket], sum
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self.lock:
+            if label_values not in self.values:
+                self.values[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = self.values[label_values]
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def count(self, *label_values: str) -> int:
+        counts, _ = self.values.get(label_values, ([0], [0.0]))
+        return sum(counts)
+
+    def sum(self, *label_values: str) -> float:
+        _, total = self.values.get(label_values, ([0], [0.0]))
+        return total[0]
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        bucket_labels = self.labels + ('le',)
+        with self.lock:
+            for label_values, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else format_value(bound)
+                    labels = format_labels(bucket_labels, label_values + (le,))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {format_value(total[0])}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Metrics():
+    """ Everything the scheduler measures """
+
+    def __init__(self) -> None:
+        self.schedule_lag = Histogram(
+            'postr_schedule_lag_seconds',
+            'Time from when a post was scheduled to when its platform call started',
+            LAG_BUCKETS, ('platform',),
+        )
+        self.platform_call = Histogram(
+            'postr_platform_call_seconds',
+            'Duration of platform calls, by outcome: ok, failed (reported failure) or error (raised)',
+            CALL_BUCKETS, ('platform', 'outcome'),
+        )
+        self.dispatches = Counter(
+            'postr_dispatches_total',
+            'Tasks dispatched to a platform, by outcome: ok, failed, error, invalid or unavailable',
+            ('platform', 'outcome'),
+        )
+        self.scan_cycles = Counter('postr_scan_cycles_total', 'Times the Reader claimed due jobs')
+        self.jobs_claimed = Histogram(
+            'postr_jobs_claimed_per_cycle', 'Jobs claimed per scan cycle', BATCH_BUCKETS,
+        )
+        self.claim_duration = Histogram(
+            'postr_claim_seconds', 'Duration of the claim transaction of a scan cycle', QUERY_BUCKETS,
+        )
+        self.jobs_finished = Counter(
+            'postr_jobs_finished_total', 'Dispatched jobs, by resulting status: done, retrying or failed',
+            ('status',),
+        )
+        self.prefetched = Counter(
+            'postr_prefetched_total',
+            'Upcoming targets staged ahead of their due time, by outcome: ok or invalid',
+            ('platform', 'outcome'),
+        )
+
+    def all(self) -> List[Any]:
+        return [
+            self.schedule_lag,
+            self.platform_call,
+            self.dispatches,
+            self.scan_cycles,
+            self.jobs_claimed,
+            self.claim_duration,
+            self.jobs_finished,
+            self.prefetched,
+        ]
+
+    def render(self) -> str:
+        """ Returns every metric in the Prometheus text format """
+        return ''.join(line + '\n' for metric in self.all() for line in metric.render())
+
+    def write(self, path: str) -> None:
+        """ Replaces the metrics file at path, atomically so a scrape never reads half a file """
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write(self.render())
+        os.replace(temporary_path, path)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> HTTPServer:
+        """ Serves the metrics over HTTP on a background thread. Port 0 picks a free port """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+                pass
+
+        server = HTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+        thread.start()
+        return server
+
+
+metrics = Metrics()
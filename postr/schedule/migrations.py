@@ -0,0 +1,339 @@
+"""
+Versioned schema for the schedule database.
+
+The schema version lives in SQLite's user_version pragma. migrate() runs every
+migration newer than it in order, each in its own write transaction, so existing
+databases are upgraded in place and concurrent processes never migrate twice.
+Migrations are only ever appended to MIGRATIONS, never edited.
+"""
+import sqlite3
+import time
+from typing import Callable
+from typing import List
+from typing import Optional
+
+# Module imports here and in database and job_platforms, which import each other through recurrence
+from postr.schedule import recurrence
+
+Migration = Callable[[sqlite3.Cursor], None]
+
+
+def _has_column(cursor: sqlite3.Cursor, table: str, column: str) -> bool:
+    cursor.execute(f'PRAGMA table_info({table})')
+    return column in [row[1] for row in cursor.fetchall()]
+
+
+def _create_tables(cursor: sqlite3.Cursor) -> None:
+    """ Version 1: the original scheduling tables """
+    # Define Job, the main driver of all scheduling tasks
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Job(
+            JobID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Comment TEXT,
+            MediaPath TEXT,
+            OptionalText TEXT,
+            Platforms TEXT,
+            Action TEXT
+            )""")
+
+    # Define a generic bio
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Bio (
+            BioID INTEGER PRIMARY KEY AUTOINCREMENT,
+            UseDisplayNameInfo INTEGER NOT NULL,
+            DisplayFirstName TEXT,
+            DisplayLastName TEXT,
+            Age INTEGER NOT NULL,
+            Comment TEXT,
+            Website TEXT,
+            Person_ID INTEGER NOT NULL,
+            FOREIGN KEY (Person_ID) REFERENCES Person(PersonID) ON DELETE CASCADE
+            )""")
+
+    # Define a person
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Person (
+            PersonID INTEGER PRIMARY KEY AUTOINCREMENT,
+            FirstName TEXT NOT NULL,
+            LastName TEXT NOT NULL,
+            SocialMedia TEXT NOT NULL
+            )""")
+
+    # Create storage for daily jobs
+    cursor.execute("""CREATE TABLE IF NOT EXISTS DailyJob (
+            DailyJobID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Frequency INTEGER DEFAULT 1,
+            FrequencyCounter INTEGER DEFAULT 1,
+            IntervalInMinutes INTEGER DEFAULT 0,
+            StartTime INTEGER NOT NULL,
+            EndTime INTEGER,
+            Job_ID INTEGER NOT NULL,
+            FOREIGN KEY (Job_ID) REFERENCES Job(JobID) ON DELETE CASCADE
+            )""")
+
+    # Create storage for monthly jobs
+    cursor.execute("""CREATE TABLE IF NOT EXISTS MonthlyJob (
+            MonthlyJobID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Frequency INTEGER DEFAULT 1,
+            FrequencyCounter INTEGER DEFAULT 1,
+            IntervalInDays INTEGER DEFAULT 0,
+            StartTime INTEGER NOT NULL,
+            EndTime INTEGER,
+            Job_ID INTEGER NOT NULL,
+            FOREIGN KEY (Job_ID) REFERENCES Job(JobID) ON DELETE CASCADE
+            )""")
+
+    cursor.execute("""CREATE TABLE IF NOT EXISTS CustomJob (
+            CustomJobID INTEGER PRIMARY KEY AUTOINCREMENT,
+            CustomDate INTEGER NOT NULL,
+            Job_ID INTEGER NOT NULL,
+            FOREIGN KEY (Job_ID) REFERENCES Job(JobID) ON DELETE CASCADE
+            )""")
+
+
+def _create_scheduler_state(cursor: sqlite3.Cursor) -> None:
+    """ Version 2: key/value progress of the Reader """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS SchedulerState (
+            Key TEXT PRIMARY KEY,
+            Value INTEGER NOT NULL
+            )""")
+
+
+def _add_custom_job_claims(cursor: sqlite3.Cursor) -> None:
+    """ Version 3: Status is one of pending, claimed, done or failed.
+        A claimed job belongs to WorkerID until LeaseExpiry """
+    if _has_column(cursor, 'CustomJob', 'Status'):
+        return
+
+    cursor.execute("ALTER TABLE CustomJob ADD COLUMN Status TEXT NOT NULL DEFAULT 'pending'")
+    cursor.execute('ALTER TABLE CustomJob ADD COLUMN WorkerID TEXT')
+    cursor.execute('ALTER TABLE CustomJob ADD COLUMN LeaseExpiry INTEGER')
+
+    # Jobs the watermark-based Reader already got through must not be replayed.
+    # Without a watermark, behave like the original Reader, which never ran jobs due before it started.
+    cursor.execute(
+        """SELECT Key, Value FROM SchedulerState
+            WHERE Key IN ('LastCustomDate', 'LastCustomJobID')""",
+    )
+    state = dict(cursor.fetchall())
+    last_date = state.get('LastCustomDate', int(time.time()))
+    last_id = state.get('LastCustomJobID', 0)
+    cursor.execute(
+        """UPDATE CustomJob SET Status = 'done'
+            WHERE CustomDate < ? OR (CustomDate = ? AND CustomJobID <= ?)""",
+        (last_date, last_date, last_id),
+    )
+
+
+def _create_indexes(cursor: sqlite3.Cursor) -> None:
+    """ Version 4: indexes for the Reader's hot queries and the foreign keys.
+        (Status, CustomDate) covers both the next due time and the ordered claim
+        of pending jobs, since the CustomJobID rowid is part of every index """
+    cursor.execute('CREATE INDEX IF NOT EXISTS CustomJob_Status_CustomDate ON CustomJob(Status, CustomDate)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS CustomJob_Status_LeaseExpiry ON CustomJob(Status, LeaseExpiry)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS CustomJob_Job_ID ON CustomJob(Job_ID)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS DailyJob_Job_ID ON DailyJob(Job_ID)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS MonthlyJob_Job_ID ON MonthlyJob(Job_ID)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS Bio_Person_ID ON Bio(Person_ID)')
+
+
+def _add_next_run_times(cursor: sqlite3.Cursor) -> None:
+    """ Version 5: recurring jobs keep their next occurrence in an indexed NextRunTime.
+        NULL means the job has ended. The tables are the recurring jobs there were at version 5;
+        later kinds of recurring job create their NextRunTime themselves """
+    now = int(time.time())
+    for table, key, interval, next_run in (
+            ('DailyJob', 'DailyJobID', 'IntervalInMinutes', recurrence.next_daily_run),
+            ('MonthlyJob', 'MonthlyJobID', 'IntervalInDays', recurrence.next_monthly_run),
+    ):
+        if not _has_column(cursor, table, 'NextRunTime'):
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN NextRunTime INTEGER')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_NextRunTime ON {table}(NextRunTime)')
+
+        cursor.execute(f'SELECT {key}, StartTime, Frequency, {interval}, EndTime FROM {table}')
+        for row_id, start_time, frequency, interval_value, end_time in cursor.fetchall():
+            cursor.execute(
+                f'UPDATE {table} SET NextRunTime = ? WHERE {key} = ?',
+                (next_run(start_time, frequency, interval_value, now - 1, end_time), row_id),
+            )
+
+
+def _add_retries(cursor: sqlite3.Cursor) -> None:
+    """ Version 6: failed dispatches are retried at RetryAt, on the platforms in RetryPlatforms
+        (NULL means all of the Job's platforms). Jobs out of retries are copied to DeadLetter """
+    for column, definition in (
+            ('Attempts', 'INTEGER NOT NULL DEFAULT 0'),
+            ('RetryPlatforms', 'TEXT'),
+            ('RetryAt', 'INTEGER'),
+            ('LastError', 'TEXT'),
+    ):
+        if not _has_column(cursor, 'CustomJob', column):
+            cursor.execute(f'ALTER TABLE CustomJob ADD COLUMN {column} {definition}')
+    cursor.execute('CREATE INDEX IF NOT EXISTS CustomJob_Status_RetryAt ON CustomJob(Status, RetryAt)')
+
+    cursor.execute("""CREATE TABLE IF NOT EXISTS DeadLetter (
+            DeadLetterID INTEGER PRIMARY KEY AUTOINCREMENT,
+            CustomJob_ID INTEGER NOT NULL,
+            Job_ID INTEGER NOT NULL,
+            Platforms TEXT NOT NULL,
+            Attempts INTEGER NOT NULL,
+            LastError TEXT,
+            FailedAt INTEGER NOT NULL,
+            FOREIGN KEY (CustomJob_ID) REFERENCES CustomJob(CustomJobID) ON DELETE CASCADE,
+            FOREIGN KEY (Job_ID) REFERENCES Job(JobID) ON DELETE CASCADE
+            )""")
+
+
+def _create_dispatch_journal(cursor: sqlite3.Cursor) -> None:
+    """ Version 7: every platform call is journaled under an idempotency key before it is made,
+        and marked succeeded or failed after, so a post is never sent twice """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS DispatchJournal (
+            IdempotencyKey TEXT PRIMARY KEY,
+            CustomJob_ID INTEGER NOT NULL,
+            Platform TEXT NOT NULL,
+            Status TEXT NOT NULL,
+            WorkerID TEXT,
+            StartedAt INTEGER NOT NULL,
+            FinishedAt INTEGER,
+            Error TEXT,
+            FOREIGN KEY (CustomJob_ID) REFERENCES CustomJob(CustomJobID) ON DELETE CASCADE
+            )""")
+    cursor.execute('CREATE INDEX IF NOT EXISTS DispatchJournal_CustomJob_ID ON DispatchJournal(CustomJob_ID)')
+
+
+def _add_post_receipts(cursor: sqlite3.Cursor) -> None:
+    """ Version 8: the platform's ID of every post is kept in PostReceipt, so posts can be retracted.
+        Jobs can belong to a campaign and a Person, to retract them together """
+    for column, definition in (
+            ('Campaign', 'TEXT'),
+            ('Person_ID', 'INTEGER REFERENCES Person(PersonID) ON DELETE SET NULL'),
+    ):
+        if not _has_column(cursor, 'Job', column):
+            cursor.execute(f'ALTER TABLE Job ADD COLUMN {column} {definition}')
+    cursor.execute('CREATE INDEX IF NOT EXISTS Job_Campaign ON Job(Campaign)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS Job_Person_ID ON Job(Person_ID)')
+
+    cursor.execute("""CREATE TABLE IF NOT EXISTS PostReceipt (
+            PostReceiptID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Job_ID INTEGER NOT NULL,
+            CustomJob_ID INTEGER NOT NULL,
+            Platform TEXT NOT NULL,
+            PostID TEXT NOT NULL,
+            PostedAt INTEGER NOT NULL,
+            RetractedAt INTEGER,
+            RetractError TEXT,
+            FOREIGN KEY (Job_ID) REFERENCES Job(JobID) ON DELETE CASCADE,
+            FOREIGN KEY (CustomJob_ID) REFERENCES CustomJob(CustomJobID) ON DELETE CASCADE
+            )""")
+    cursor.execute('CREATE INDEX IF NOT EXISTS PostReceipt_Job_ID ON PostReceipt(Job_ID)')
+
+
+def _create_cron_jobs(cursor: sqlite3.Cursor) -> None:
+    """ Version 9: CronJob, recurring jobs on a cron expression. Expression is kept as written,
+        Schedule is its parsed, compact form, see cron """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS CronJob (
+            CronJobID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Expression TEXT NOT NULL,
+            Schedule TEXT NOT NULL,
+            FrequencyCounter INTEGER DEFAULT 1,
+            StartTime INTEGER NOT NULL,
+            EndTime INTEGER,
+            NextRunTime INTEGER,
+            Job_ID INTEGER NOT NULL,
+            FOREIGN KEY (Job_ID) REFERENCES Job(JobID) ON DELETE CASCADE
+            )""")
+    cursor.execute('CREATE INDEX IF NOT EXISTS CronJob_NextRunTime ON CronJob(NextRunTime)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS CronJob_Job_ID ON CronJob(Job_ID)')
+
+
+def _create_job_platforms(cursor: sqlite3.Cursor) -> None:
+    """ Version 10: JobPlatform, the platforms each CustomJob targets, one per row with its own
+        status, indexed on (Platform, DueTime). Filled in from Job.Platforms, where the platforms a
+        retrying or failed job has left are its RetryPlatforms and the others are done """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS JobPlatform (
+            JobPlatformID INTEGER PRIMARY KEY AUTOINCREMENT,
+            CustomJob_ID INTEGER NOT NULL,
+            Platform TEXT NOT NULL,
+            DueTime INTEGER NOT NULL,
+            Status TEXT NOT NULL DEFAULT 'pending',
+            FinishedAt INTEGER,
+            Error TEXT,
+            UNIQUE (CustomJob_ID, Platform),
+            FOREIGN KEY (CustomJob_ID) REFERENCES CustomJob(CustomJobID) ON DELETE CASCADE
+            )""")
+    cursor.execute('CREATE INDEX IF NOT EXISTS JobPlatform_Platform_DueTime ON JobPlatform(Platform, DueTime)')
+
+    cursor.execute(
+        """SELECT CustomJob.CustomJobID, CustomJob.CustomDate, CustomJob.Status, CustomJob.RetryPlatforms,
+                  CustomJob.RetryAt, Job.Platforms
+            FROM CustomJob INNER JOIN Job ON Job.JobID = CustomJob.Job_ID""",
+    )
+    targets = []
+    for custom_job_id, custom_date, status, retry_platforms, retry_at, platforms in cursor.fetchall():
+        left = [platform for platform in (retry_platforms or '').split(',') if platform]
+        for platform in (platforms or '').split(','):
+            if not platform:
+                continue
+            if status in ('retrying', 'failed') and left and platform not in left:
+                targets.append((custom_job_id, platform, custom_date, 'done'))
+            elif status == 'retrying':
+                targets.append((custom_job_id, platform, retry_at or custom_date, status))
+            else:
+                targets.append((custom_job_id, platform, custom_date, status))
+    cursor.executemany(
+        'INSERT OR IGNORE INTO JobPlatform(CustomJob_ID, Platform, DueTime, Status) VALUES(?, ?, ?, ?)', targets,
+    )
+
+
+def _index_due_targets(cursor: sqlite3.Cursor) -> None:
+    """ Version 11: the Reader claims jobs by the due time of their JobPlatform targets,
+        indexed on (Status, DueTime, CustomJob_ID) """
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS JobPlatform_Status_DueTime ON JobPlatform(Status, DueTime, CustomJob_ID)',
+    )
+
+
+# MIGRATIONS[i] upgrades a database from version i to version i + 1
+MIGRATIONS: List[Migration] = [
+    _create_tables,
+    _create_scheduler_state,
+    _add_custom_job_claims,
+    _create_indexes,
+    _add_next_run_times,
+    _add_retries,
+    _create_dispatch_journal,
+    _add_post_receipts,
+    _create_cron_jobs,
+    _create_job_platforms,
+    _index_due_targets,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """ Returns the schema version of the database """
+    version: int = conn.execute('PRAGMA user_version').fetchone()[0]
+    return version
+
+
+def migrate(conn: sqlite3.Connection, target_version: Optional[int] = None) -> int:
+    """ Upgrades the database to target_version (default: the latest) and returns its version """
+    target = LATEST_VERSION if target_version is None else target_version
+    if schema_version(conn) >= target:
+        return schema_version(conn)
+
+    cursor = conn.cursor()
+    conn.commit()
+    while True:
+        # Re-read the version inside the write lock, another process may have migrated meanwhile
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(conn)
+            if version >= target:
+                conn.commit()
+                return version
+
+            MIGRATIONS[version](cursor)
+            cursor.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
@@ -0,0 +1,117 @@
+"""
+Wakes Readers in other processes when a Writer commits a new job.
+
+A Writer in the same process as a Reader wakes it through Writer.add_listener(reader.notify).
+The GUI and the scheduler usually run as separate processes though, and then a job due in a
+minute would wait for the Reader's next poll. So every running Reader also listens on a Unix
+datagram socket of its own, in a directory named after the schedule database, and the Writer
+sends one datagram to each socket there after every commit. The Reader then wakes up and
+re-reads its next due time. A datagram is all a wake-up takes: there is no connection to
+keep, nothing blocks if a Reader is busy, and sockets left behind by crashed Readers are
+noticed and removed by the next Writer.
+
+Platforms without Unix sockets fall back to polling: listen() returns None and notify() does nothing.
+"""
+import hashlib
+import itertools
+import os
+import socket
+import tempfile
+from typing import Optional
+
+from postr.postr_logger import make_logger
+
+log = make_logger('notify')
+
+_socket_ids = itertools.count()
+
+
+def supported() -> bool:
+    return hasattr(socket, 'AF_UNIX')
+
+
+def socket_directory(db_path: str) -> str:
+    """ Returns the directory of the sockets of the Readers of a schedule database.
+        It is kept in the temporary directory, since socket paths cannot be long """
+    digest = hashlib.sha1(os.path.abspath(db_path).encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f'postr-{digest}')
+
+
+class Listener():
+    """ A Reader's socket. Readable whenever a Writer has committed since the last drain() """
+
+    def __init__(self, db_path: str) -> None:
+        directory = socket_directory(db_path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(directory, f'{os.getpid()}-{next(_socket_ids)}.sock')
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(self.path)
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def drain(self) -> int:
+        """ Reads every pending notification, returning how many there were """
+        count = 0
+        while True:
+            try:
+                self.socket.recv(64)
+            except (BlockingIOError, InterruptedError):
+                return count
+            count += 1
+
+    def close(self) -> None:
+        """ Stops listening, removing the socket, and its directory if no other Reader uses it """
+        self.socket.close()
+        try:
+            os.unlink(self.path)
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            pass
+
+
+def listen(db_path: str) -> Optional[Listener]:
+    """ Starts listening for the commits of Writers to a schedule database, if the platform can """
+    if not supported():
+        return None
+    try:
+        return Listener(db_path)
+    except OSError as e:
+        log.error(f'Cannot listen for new jobs, falling back to polling: {e}')
+        return None
+
+
+def notify(db_path: str) -> int:
+    """ Wakes every Reader listening on a schedule database. Returns how many were sent a notification """
+    if not supported():
+        return 0
+    directory = socket_directory(db_path)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+
+    sent = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+        sender.setblocking(False)
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                sender.sendto(b'1', path)
+                sent += 1
+            except BlockingIOError:
+                # Its queue is full of notifications it has not read yet, one more adds nothing
+                sent += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a Reader that did not exit cleanly
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                log.error(f'Failed to notify the Reader at {path}: {e}')
+    return sent
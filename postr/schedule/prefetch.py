@@ -0,0 +1,184 @@
+"""
+Staging of upcoming jobs, so that at their due time dispatching them is only the platform call.
+
+Left to dispatch time, the first post to a platform waits for its adapter to be built and
+logged in, a photo or video waits for the disk, and a job that can never run is only found
+out when it is due. A top-of-the-hour campaign pays all of that at once, on the hour.
+
+A Prefetcher looks PREFETCH_HORIZON_SECONDS ahead: at the targets queued in JobPlatform, and
+at the next run of every recurring job. For each target due within the horizon it
+- checks that the platform supports the action and that the job has its required arguments,
+- checks that its MediaPath exists and asks the OS to read the file into its page cache,
+- builds the platform's adapter, logging in with its credentials,
+once per job and platform. Problems are logged, and counted in metrics.prefetched, while
+there is still time to fix the job; the job itself is left as it is, so dispatch finds the
+same problem again if it was not fixed.
+"""
+import asyncio
+import os
+import sqlite3
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from postr import clock
+from postr.postr_logger import make_logger
+from postr.schedule import task_processor
+from postr.schedule.async_db import AsyncDatabase
+from postr.schedule.database import rows_to_dicts
+from postr.schedule.job_platforms import QUEUED
+from postr.schedule.job_platforms import split_platforms
+from postr.schedule.metrics import metrics
+from postr.schedule.recurrence import RECURRING_TABLES
+
+log = make_logger('prefetch')
+
+# How far ahead jobs are staged
+PREFETCH_HORIZON_SECONDS = 5 * 60
+
+# How often the horizon is looked at again, unless a Writer commits before
+PREFETCH_INTERVAL_SECONDS = 30
+
+# Size of the reads that warm the page cache where posix_fadvise is not available
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class StagedTarget(NamedTuple):
+    """ A job's target platform, staged ahead of its due time. error says why it cannot run, if it cannot """
+    job_id: int
+    platform: str
+    due_time: int
+    error: Optional[str]
+
+
+def upcoming(cursor: sqlite3.Cursor, since: int, until: int) -> List[Dict[str, Any]]:
+    """ Returns every target due from since to until, with its Job: queued targets from JobPlatform
+        and the next runs of recurring jobs, which only become CustomJobs once they are due """
+    platforms = list(task_processor.api_to_function)
+    recurring = ' UNION ALL '.join(
+        f'SELECT Job_ID, NextRunTime FROM {table} WHERE NextRunTime BETWEEN :since AND :until'
+        for table in RECURRING_TABLES
+    )
+    parameters: Dict[str, Any] = {'since': since, 'until': until}
+    parameters.update({f'platform{i}': platform for i, platform in enumerate(platforms)})
+    parameters.update({f'status{i}': status for i, status in enumerate(QUEUED)})
+    cursor.execute(
+        f"""SELECT Job.*, JobPlatform.Platform AS Platform, JobPlatform.DueTime AS DueTime
+            FROM JobPlatform
+            INNER JOIN CustomJob ON CustomJob.CustomJobID = JobPlatform.CustomJob_ID
+            INNER JOIN Job ON Job.JobID = CustomJob.Job_ID
+            WHERE JobPlatform.Platform IN ({', '.join(f':platform{i}' for i in range(len(platforms)))})
+                AND JobPlatform.DueTime BETWEEN :since AND :until
+                AND JobPlatform.Status IN ({', '.join(f':status{i}' for i in range(len(QUEUED)))})
+            UNION ALL
+            SELECT Job.*, NULL AS Platform, Recurring.NextRunTime AS DueTime
+            FROM ({recurring}) AS Recurring
+            INNER JOIN Job ON Job.JobID = Recurring.Job_ID
+            ORDER BY DueTime""",
+        parameters,
+    )
+    targets = []
+    for row in rows_to_dicts(cursor):
+        platform = row.pop('Platform')
+        for api in [platform] if platform is not None else split_platforms(row['Platforms']):
+            targets.append(dict(row, Platform=api))
+    return targets
+
+
+def check(job: Dict[str, Any]) -> Optional[str]:
+    """ Returns why a job cannot run on its target platform, or None if it can """
+    api, action = job['Platform'], job['Action']
+    dispatch = task_processor.dispatch_table.get((api, action))
+    if dispatch is None:
+        return f'{api} does not support {action}'
+    missing = dispatch.required_arguments - task_processor.get_existing_arguments(job)
+    if missing:
+        return f'{action} on {api} needs {", ".join(sorted(missing))}'
+    if job['MediaPath'] and not os.path.isfile(job['MediaPath']):
+        return f'{job["MediaPath"]} does not exist'
+    return None
+
+
+def warm_media(path: str) -> None:
+    """ Has the OS read a file into its page cache, so reading it at dispatch time does not wait for the disk """
+    try:
+        with open(path, 'rb') as media:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(media.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            else:
+                while media.read(READ_CHUNK_SIZE):
+                    pass
+    except OSError as e:
+        log.error(f'Failed to prefetch {path}: {e}')
+
+
+class Prefetcher():
+    """ Stages the targets of a schedule database due within horizon seconds, each once """
+
+    def __init__(self, db: AsyncDatabase, horizon: int = PREFETCH_HORIZON_SECONDS) -> None:
+        self.db = db
+        self.horizon = horizon
+        # (JobID, platform) -> its staged target, kept until it is a horizon past due
+        self.staged: Dict[Tuple[int, str], StagedTarget] = {}
+
+    def upcoming(self, now: int) -> List[Dict[str, Any]]:
+        """ Returns the targets due within the horizon that are not staged yet. Runs on the database thread """
+        return [
+            target for target in upcoming(self.db.pool.cursor(), now, now + self.horizon)
+            if (target['JobID'], target['Platform']) not in self.staged
+        ]
+
+    async def stage(self, targets: List[Dict[str, Any]]) -> List[StagedTarget]:
+        """ Checks targets, warms their media and builds their platforms' adapters """
+        loop = asyncio.get_event_loop()
+        media = {target['MediaPath'] for target in targets if target['MediaPath']}
+        # Platforms run by worker processes build their adapters there
+        apis = {
+            target['Platform'] for target in targets
+            if target['Platform'] in task_processor.api_to_instance
+            and target['Platform'] not in task_processor.platform_workers
+        }
+        await asyncio.gather(
+            *[loop.run_in_executor(task_processor.dispatch_executor(), warm_media, path) for path in media],
+            *[task_processor.get_adapter(api) for api in apis],
+        )
+
+        staged = []
+        for target in targets:
+            api = target['Platform']
+            error = check(target)
+            if error is None and api in apis and task_processor.api_to_instance.instances.get(api) is None:
+                error = f'the {api} adapter is not available'
+            if error is not None:
+                log.error(f'Job {target["JobID"]}, due at {target["DueTime"]}, will fail on {api}: {error}')
+            metrics.prefetched.inc(api, 'ok' if error is None else 'invalid')
+            staged_target = StagedTarget(target['JobID'], api, target['DueTime'], error)
+            self.staged[(staged_target.job_id, staged_target.platform)] = staged_target
+            staged.append(staged_target)
+        return staged
+
+    def forget_past(self, now: int) -> None:
+        """ Drops what was due over a horizon ago, so a recurring job's next run is staged again """
+        for key, target in list(self.staged.items()):
+            if target.due_time < now - self.horizon:
+                del self.staged[key]
+
+    async def run(self, wake: asyncio.Event) -> None:
+        """ Stages what comes due every PREFETCH_INTERVAL_SECONDS, or as soon as wake is set, until cancelled """
+        while True:
+            wake.clear()
+            now = int(clock.now())
+            self.forget_past(now)
+            try:
+                targets = await self.db.run(self.upcoming, now)
+                if targets:
+                    await self.stage(targets)
+            except sqlite3.Error as e:
+                log.error(f'Failed to prefetch upcoming jobs: {e}')
+            try:
+                await asyncio.wait_for(wake.wait(), clock.real_seconds(PREFETCH_INTERVAL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,281 @@
+"""
+Dispatch in worker processes, one per group of platforms.
+
+In a single process, a client that holds the GIL or blocks (InstagramAPI, a resumable
+YouTube upload, TextBlob) slows down every other platform. A ProcessDispatcher starts a
+worker process for each group of platforms and routes their tasks to it over a pipe, so
+groups run on separate cores and a misbehaving library only stalls its own group.
+
+Each worker runs the usual run_platform on its own event loop, with its own adapters,
+rate limiter and up to max_concurrency calls at once. A platform belongs to exactly one
+worker, so its rate limit is still tracked in one place. A worker that crashes, or does not
+answer within timeout seconds, is restarted. The calls it had may have posted, so they fail
+in doubt: not retried, and left unfinished in the dispatch journal, see journal.
+Workers are started with 'spawn', so they share no threads, sockets or database connections
+with the scheduler.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import itertools
+import multiprocessing
+from multiprocessing.connection import Connection
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from postr.postr_logger import make_logger
+from postr.schedule import task_processor
+from postr.schedule.task_processor import DispatchError
+
+log = make_logger('process_pool')
+
+# Longest a worker may take over one task before it is considered hung and restarted.
+# Generous, since a video upload can take minutes
+WORKER_TIMEOUT_SECONDS = 900
+
+# Pause before restarting a crashed worker, so a worker that crashes on start does not spin
+RESTART_DELAY_SECONDS = 1.0
+
+# How long close() waits for a worker to finish its tasks before terminating it
+CLOSE_TIMEOUT_SECONDS = 30
+
+context = multiprocessing.get_context('spawn')
+
+
+async def serve_requests(requests: Connection, results: Connection, max_concurrency: int) -> None:
+    """ Runs every task sent over requests, up to max_concurrency platform calls at once,
+        and sends back each (request id, result of run_platform, ID of the new post if any).
+        Returns once requests is closed """
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    receiver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='worker-requests')
+    running: Set[asyncio.Future] = set()
+
+    async def run(request_id: int, api: str, task: Dict[str, Any]) -> None:
+        try:
+            error = await task_processor.run_platform(api, task, semaphore)
+        except Exception as e:
+            error = DispatchError(f'{api} failed in its worker process: {e}', retryable=True)
+        results.send((request_id, error, task.get('PostIDs', {}).get(api)))
+
+    while True:
+        try:
+            request = await loop.run_in_executor(receiver, requests.recv)
+        except EOFError:
+            request = None
+        if request is None:
+            break
+
+        future = asyncio.ensure_future(run(*request))
+        running.add(future)
+        future.add_done_callback(running.discard)
+
+    if running:
+        await asyncio.wait(running)
+    receiver.shutdown()
+
+
+def worker_main(
+        requests: Connection,
+        results: Connection,
+        max_concurrency: int,
+        adapters: Dict[str, Tuple[str, str]],
+) -> None:
+    """ Entry point of a worker process. adapters maps a platform to the (module, class)
+        of an adapter to build in place of the registry's, e.g. a fake one """
+    task_processor.platform_workers.clear()
+    task_processor.set_max_concurrency(max_concurrency)
+    for api, (module_name, class_name) in adapters.items():
+        task_processor.api_to_instance[api] = getattr(importlib.import_module(module_name), class_name)()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(serve_requests(requests, results, max_concurrency))
+    loop.close()
+
+
+class WorkerProcess():
+    """
+    A worker process that dispatches the tasks of a group of platforms.
+    dispatch() is safe to call from any event loop; results come back on a listener thread
+    """
+
+    def __init__(
+            self,
+            platforms: Iterable[str],
+            max_concurrency: int = task_processor.MAX_CONCURRENT_DISPATCHES,
+            timeout: float = WORKER_TIMEOUT_SECONDS,
+            adapters: Optional[Dict[str, Tuple[str, str]]] = None,
+    ) -> None:
+        self.platforms = tuple(platforms)
+        self.name = '-'.join(self.platforms)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.adapters = adapters or {}
+
+        self.lock = threading.Lock()
+        self.request_ids = itertools.count()
+        # request id -> the loop and future waiting for its result and post ID
+        self.pending: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self.process: Any = None
+        self.requests: Optional[Connection] = None
+        self.closed = False
+        self.restarts = 0
+
+    def start(self) -> None:
+        """ Starts the worker process and the thread listening for its results """
+        receive_requests, send_requests = context.Pipe(duplex=False)
+        receive_results, send_results = context.Pipe(duplex=False)
+        process = context.Process(
+            target=worker_main,
+            args=(receive_requests, send_results, self.max_concurrency, self.adapters),
+            name=f'postr-dispatch-{self.name}',
+            daemon=True,
+        )
+        process.start()
+        # Only the worker holds these ends now, so the pipes break when it exits
+        receive_requests.close()
+        send_results.close()
+
+        with self.lock:
+            self.process, self.requests = process, send_requests
+        listener = threading.Thread(
+            target=self.listen, args=(process, receive_results, send_requests), name=f'listen-{self.name}', daemon=True,
+        )
+        listener.start()
+        log.info(f'Started the {self.name} worker process, pid {process.pid}')
+
+    def listen(self, process: Any, results: Connection, requests: Connection) -> None:
+        """ Hands each result from the worker to its waiting task until the worker exits,
+            then fails its remaining tasks and starts a new worker, unless closing """
+        while True:
+            try:
+                request_id, error, post_id = results.recv()
+            except (EOFError, OSError):
+                break
+            self.resolve(request_id, error, post_id)
+
+        process.join()
+        results.close()
+
+        with self.lock:
+            requests.close()
+            unanswered = list(self.pending)
+        for request_id in unanswered:
+            # The call may have posted before the worker died
+            message = f'The {self.name} worker process exited with code {process.exitcode} during the call'
+            self.resolve(request_id, DispatchError(message, retryable=False, in_doubt=True))
+
+        if not self.closed:
+            log.error(f'The {self.name} worker process exited with code {process.exitcode}, restarting it')
+            time.sleep(RESTART_DELAY_SECONDS)
+            self.restarts += 1
+            self.start()
+
+    def resolve(self, request_id: int, error: Optional[DispatchError], post_id: Optional[str] = None) -> None:
+        with self.lock:
+            waiting = self.pending.pop(request_id, None)
+        if waiting is None:
+            return
+
+        loop, future = waiting
+
+        def set_result() -> None:
+            if not future.done():
+                future.set_result((error, post_id))
+
+        loop.call_soon_threadsafe(set_result)
+
+    async def dispatch(self, api: str, task: Dict[str, Any]) -> Optional[DispatchError]:
+        """ Runs a task on one of this worker's platforms, returning None if it succeeded or why it failed """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        with self.lock:
+            request_id = next(self.request_ids)
+            self.pending[request_id] = (loop, future)
+            process, requests = self.process, self.requests
+            try:
+                assert requests is not None, 'The worker process was never started'
+                requests.send((request_id, api, task))
+            except (OSError, ValueError) as e:
+                # The worker just died and its replacement is not up yet
+                self.pending.pop(request_id)
+                return DispatchError(f'The {self.name} worker process is restarting: {e}', retryable=True)
+
+        error: Optional[DispatchError]
+        post_id: Optional[str]
+        try:
+            error, post_id = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.pending.pop(request_id, None)
+            log.error(f'{api} took over {self.timeout}s in the {self.name} worker process, restarting it')
+            process.terminate()
+            return DispatchError(
+                f'{api} did not finish within {self.timeout}s, it may have posted', retryable=False, in_doubt=True,
+            )
+
+        if post_id is not None:
+            task.setdefault('PostIDs', {})[api] = post_id
+        return error
+
+    def close(self) -> None:
+        """ Lets the worker finish its tasks, then stops it """
+        self.closed = True
+        with self.lock:
+            process, requests = self.process, self.requests
+        if process is None or requests is None:
+            return
+
+        try:
+            requests.send(None)
+        except (OSError, ValueError):
+            pass
+        process.join(CLOSE_TIMEOUT_SECONDS)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+
+class ProcessDispatcher():
+    """
+    Worker processes for groups of platforms, e.g. [['Instagram'], ['YouTube'], ['Twitter', 'Slack']].
+    While started, tasks for those platforms go to their worker instead of running in this process;
+    platforms in no group still run here
+    """
+
+    def __init__(
+            self,
+            groups: Iterable[Iterable[str]],
+            max_concurrency: int = task_processor.MAX_CONCURRENT_DISPATCHES,
+            timeout: float = WORKER_TIMEOUT_SECONDS,
+            adapters: Optional[Dict[str, Tuple[str, str]]] = None,
+    ) -> None:
+        adapters = adapters or {}
+        self.workers: List[WorkerProcess] = []
+        for group in groups:
+            platforms = list(group)
+            group_adapters = {api: adapters[api] for api in platforms if api in adapters}
+            self.workers.append(WorkerProcess(platforms, max_concurrency, timeout, group_adapters))
+
+    def start(self) -> None:
+        """ Starts every worker and routes its platforms' tasks to it """
+        for worker in self.workers:
+            worker.start()
+            for api in worker.platforms:
+                task_processor.platform_workers[api] = worker.dispatch
+
+    def close(self) -> None:
+        """ Routes tasks back to this process, and stops every worker """
+        for worker in self.workers:
+            for api in worker.platforms:
+                task_processor.platform_workers.pop(api, None)
+        for worker in self.workers:
+            worker.close()
@@ -1,14 +1,57 @@
-import time
 import asyncio
-from datetime import datetime as dt
+import time
 import os
+import socket
 import sqlite3
 from typing import List
 from typing import Any
 from typing import Dict
+from typing import Optional
+from typing import Sequence
+from typing import Set
 
+from postr import clock
+from postr.postr_logger import make_logger
+from postr.schedule import archive
+from postr.schedule import job_platforms
+from postr.schedule import journal
+from postr.schedule import receipts
+from postr.schedule import recurrence
+from postr.schedule import retry
+from postr.schedule.async_db import AsyncDatabase
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.job_status import DONE
+from postr.schedule.job_status import RETRYING
+from postr.schedule.database import DB_PATH
+from postr.schedule.database import get_pool
+from postr.schedule.metrics import METRICS_INTERVAL_SECONDS
+from postr.schedule.metrics import metrics
+from postr.schedule.notify import listen
+from postr.schedule.notify import Listener
+from postr.schedule.prefetch import PREFETCH_HORIZON_SECONDS
+from postr.schedule.prefetch import Prefetcher
+from postr.schedule.process_pool import ProcessDispatcher
+from postr.schedule import task_processor
+from postr.schedule.task_processor import DispatchError
 from postr.schedule.task_processor import process_scheduler_events
 
+log = make_logger('reader')
+
+# Longest the scheduler sleeps before re-reading the next due time.
+# Jobs inserted by another process are picked up no later than this.
+MAX_SLEEP_SECONDS = 30
+
+# Most jobs one worker claims and hands to the task processor at once
+BATCH_SIZE = 500
+
+# How long a claim stays valid. A worker renews the leases of the batches it is dispatching,
+# so a lease only runs out when the worker holding it has died.
+LEASE_SECONDS = 300
+
+# Batches being dispatched at once. The next batch is claimed while the last one is still
+# being dispatched, so slow platform calls and database work overlap
+MAX_BATCHES_IN_FLIGHT = 2
+
 
 def clean_empty_strings(items: Dict[str, Any]) -> Dict[str, Any]:
     print(f'Items was: {items}')
@@ -21,19 +64,88 @@ class Reader():
     Returns any scheduled operations that need to be ran.
     """
 
-    def __init__(self) -> None:
-        file_path: str = os.path.join('postr', 'schedule', 'master_schedule.sqlite')
-        self.conn = sqlite3.connect(file_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+    def __init__(
+            self,
+            max_sleep: int = MAX_SLEEP_SECONDS,
+            batch_size: int = BATCH_SIZE,
+            lease_seconds: int = LEASE_SECONDS,
+            worker_id: Optional[str] = None,
+            max_concurrency: int = task_processor.MAX_CONCURRENT_DISPATCHES,
+            max_attempts: int = retry.MAX_ATTEMPTS,
+            file_path: str = DB_PATH,
+            metrics_port: Optional[int] = None,
+            metrics_file: Optional[str] = None,
+            worker_groups: Optional[List[List[str]]] = None,
+            archive_after_days: Optional[int] = None,
+            prefetch_horizon: Optional[int] = None,
+    ) -> None:
+        # Connections come from the process-wide pool, which also migrates the database.
+        # The scheduler's own queries run on a database thread, see AsyncDatabase
+        self.pool = get_pool(file_path)
+        self.db = AsyncDatabase(self.pool)
+        self.max_sleep = max_sleep
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        # Most platform calls this Reader has in flight at once, across its batches.
+        # scan() creates the semaphore, other Readers in the process keep their own limits.
+        # The shared thread pool of the synchronous APIs grows to let all of them run at once
+        self.max_concurrency = max_concurrency
+        task_processor.ensure_dispatch_threads(max_concurrency)
+        self.dispatch_slots: Optional[asyncio.Semaphore] = None
+
+        # Where scan() publishes the scheduler's metrics, if anywhere
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+
+        # Groups of platforms dispatched in their own worker process, see ProcessDispatcher
+        self.worker_groups = worker_groups
+
+        # scan() moves jobs finished this many days ago to the monthly archives, see archive. None never does
+        self.archive_after_days = archive_after_days
+
+        # scan() stages jobs due within this many seconds ahead of time, see prefetch. None never does
+        self.prefetch_horizon = prefetch_horizon
+
+        # Identifies this Reader's claims; unique across processes and hosts sharing the database
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+
+        # CustomJobIDs of the batches being dispatched, the only claims keep_leases_alive() renews
+        self.in_flight: Set[int] = set()
+
+        # Set by notify(), or a Writer in another process through the notify socket,
+        # to wake the scheduler before its sleep runs out
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.new_job_event: Optional[asyncio.Event] = None
+        self.prefetch_event: Optional[asyncio.Event] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """ The calling thread's connection to the schedule database """
+        return self.pool.connection()
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """ The calling thread's cursor """
+        return self.pool.cursor()
 
     def cleanup(self) -> None:
-        """ Closes the database connection"""
-        self.conn.close()
+        """ Closes the database connections"""
+        self.db.close()
+        self.pool.release()
 
     @classmethod
     def now(cls) -> int:
-        """ Returns the current time """
-        return int(dt.now().timestamp())
+        """ Returns the current time, by the current clock """
+        return int(clock.now())
+
+    def rows_to_json(self) -> List[Dict[str, Any]]:
+        """ Converts the rows of the last query into a list of JSON objects """
+        return [{
+            self.cursor.description[i][0]: value
+            for i, value in enumerate(row)
+        } for row in self.cursor.fetchall()]
 
     def scan_custom_jobs(self, seconds: int = 30) -> List[Dict[str, Any]]:
         """ Scans jobs every 'seconds' seconds, and returns a JSON
@@ -41,27 +153,323 @@ class Reader():
         lower = self.schedule_range(seconds)
         upper = self.now()
 
-        self.cursor.execute(f"""SELECT * FROM CustomJob
+        self.cursor.execute(
+            """SELECT * FROM CustomJob
                 INNER JOIN Job on Job.JobID = CustomJob.Job_ID
-                WHERE CustomJob.CustomDate BETWEEN {lower} and {upper}""")
+                WHERE CustomJob.CustomDate BETWEEN ? and ?""", (lower, upper),
+        )
 
-        json = [{
-            self.cursor.description[i][0]: value
-            for i, value in enumerate(row)
-        } for row in self.cursor.fetchall()]
+        return self.rows_to_json()
 
-        return json
+    def next_due_time(self) -> Optional[int]:
+        """ Returns the time at which a job next becomes claimable: the earliest due target of a
+            pending or retrying job, the earliest lease to run out or the earliest recurring occurrence.
+            None if there is none of those """
+        self.cursor.execute('SELECT MIN(LeaseExpiry) FROM CustomJob WHERE Status = ?', (CLAIMED,))
+        due_times = [
+            self.cursor.fetchone()[0],
+            job_platforms.next_due_time(self.cursor),
+            recurrence.next_due_time(self.cursor),
+        ]
+        return min((due for due in due_times if due is not None), default=None)
 
-    async def scan(self) -> Any:
-        """ Scans every 30 seconds for new jobs in the past 30 seconds """
+    def claim_due_jobs(self) -> List[Dict[str, Any]]:
+        """ Claims up to batch_size due jobs for this worker, oldest first, and returns them.
+            A job is claimable when it is pending or retrying with a JobPlatform target due, or when
+            the lease of the worker that claimed it has run out. Due recurring occurrences are first turned into
+            pending jobs. Claims happen in a single write transaction,
+            so two Readers sharing the database never claim the same job.
+            Each job's Platforms are its claimed targets, the only platforms it is dispatched to """
+        now = self.now()
+
+        self.conn.commit()
+        self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            recurrence.materialize_due_jobs(self.cursor, now, self.batch_size)
+
+            # Separate queries instead of an OR, so each one is a range walk over its own index
+            # that stops after batch_size rows, with no sort
+            self.cursor.execute(
+                """SELECT CustomJobID FROM CustomJob
+                    WHERE Status = ? AND LeaseExpiry <= ?
+                    ORDER BY LeaseExpiry
+                    LIMIT ?""", (CLAIMED, now, self.batch_size),
+            )
+            job_ids = [row[0] for row in self.cursor.fetchall()]
+            job_ids += job_platforms.due(self.cursor, now, self.batch_size - len(job_ids))
+            if not job_ids:
+                self.conn.commit()
+                return []
+
+            placeholders = ', '.join('?' * len(job_ids))
+            self.cursor.execute(
+                f"""UPDATE CustomJob SET Status = ?, WorkerID = ?, LeaseExpiry = ?
+                    WHERE CustomJobID IN ({placeholders})""",
+                (CLAIMED, self.worker_id, now + self.lease_seconds, *job_ids),
+            )
+            platforms = job_platforms.claim(self.cursor, job_ids, now)
+            self.cursor.execute(
+                f"""SELECT * FROM CustomJob
+                    INNER JOIN Job on Job.JobID = CustomJob.Job_ID
+                    WHERE CustomJob.CustomJobID IN ({placeholders})
+                    ORDER BY CustomJob.CustomDate, CustomJob.CustomJobID""", job_ids,
+            )
+            jobs = self.rows_to_json()
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+        # Job.Platforms lists the platforms of the job's occurrences, not what is left of this one
+        for job in jobs:
+            job['Platforms'] = ','.join(platforms[job['CustomJobID']])
+
+        return jobs
+
+    def renew_leases(self, custom_job_ids: Sequence[int]) -> None:
+        """ Extends this worker's leases on jobs it is still dispatching """
+        lease_expiry = self.now() + self.lease_seconds
+        self.cursor.executemany(
+            """UPDATE CustomJob SET LeaseExpiry = ?
+                WHERE CustomJobID = ? AND Status = ? AND WorkerID = ?""",
+            [(lease_expiry, custom_job_id, CLAIMED, self.worker_id) for custom_job_id in custom_job_ids],
+        )
+        self.conn.commit()
+
+    def release_jobs(self, custom_job_ids: Sequence[int]) -> None:
+        """ Gives up this worker's claims on jobs, ending their leases now so the next claim takes them over """
+        now = self.now()
+        self.cursor.executemany(
+            """UPDATE CustomJob SET LeaseExpiry = ?
+                WHERE CustomJobID = ? AND Status = ? AND WorkerID = ?""",
+            [(now, custom_job_id, CLAIMED, self.worker_id) for custom_job_id in custom_job_ids],
+        )
+        self.conn.commit()
+
+    def finish_job(self, custom_job_id: int, status: str) -> None:
+        """ Releases this worker's claim on a job, marking it done or failed,
+            or pending or retrying again if it has targets due later """
+        self.conn.commit()
+        self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            self.cursor.execute(
+                """UPDATE CustomJob SET Status = ?, LeaseExpiry = NULL
+                    WHERE CustomJobID = ? AND Status = ? AND WorkerID = ?""",
+                (
+                    job_platforms.waiting(self.cursor, custom_job_id) or status,
+                    custom_job_id, CLAIMED, self.worker_id,
+                ),
+            )
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def retry_job(self, custom_job_id: int, errors: Dict[str, DispatchError]) -> Optional[str]:
+        """ Schedules a retry of the platforms a job failed on, or dead-letters it.
+            Returns the job's new status, None if this worker no longer holds its claim """
+        self.conn.commit()
+        self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            status = retry.record_failure(
+                self.cursor, custom_job_id, self.worker_id, errors, self.now(), self.max_attempts,
+            )
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+        if status == RETRYING:
+            log.error(f'Job {custom_job_id} failed on {", ".join(errors)}, will retry')
+        elif status is not None:
+            log.error(f'Job {custom_job_id} failed on {", ".join(errors)}, moved to the dead letters')
+        return status
+
+    def start_dispatches(self, tasks: List[Dict[str, Any]]) -> List[Dict[str, DispatchError]]:
+        """ Journals the platform calls about to be made, narrowing each task's Platforms to the
+            platforms it has not been posted on yet. Returns the platforms of each task whose
+            earlier call is in doubt, see journal """
+        now = self.now()
+        with self.pool.transaction() as cursor:
+            return [journal.begin(cursor, task, self.worker_id, now) for task in tasks]
+
+    def record_results(self, tasks: List[Dict[str, Any]], results: List[Dict[str, DispatchError]]) -> None:
+        """ Marks each dispatched job done, or schedules a retry of the platforms it failed on,
+            and keeps the receipts of the posts it made """
+        now = self.now()
+        with self.pool.transaction() as cursor:
+            for task, errors in zip(tasks, results):
+                journal.finish(cursor, task, errors, now)
+                job_platforms.succeed(cursor, task['CustomJobID'], errors, now)
+                receipts.record(cursor, task, now)
+
+        for task, errors in zip(tasks, results):
+            if errors:
+                status = self.retry_job(task['CustomJobID'], errors)
+            else:
+                self.finish_job(task['CustomJobID'], DONE)
+                status = DONE
+            if status is not None:
+                metrics.jobs_finished.inc(status)
+
+    def claim_and_measure(self) -> List[Dict[str, Any]]:
+        """ claim_due_jobs, recording the scan cycle in the metrics """
+        start = time.perf_counter()
+        jobs = self.claim_due_jobs()
+        metrics.claim_duration.observe(time.perf_counter() - start)
+        metrics.scan_cycles.inc()
+        metrics.jobs_claimed.observe(len(jobs))
+        return jobs
+
+    async def publish_metrics(self) -> None:
+        """ Rewrites metrics_file every METRICS_INTERVAL_SECONDS until cancelled """
+        assert self.metrics_file is not None
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, metrics.write, self.metrics_file)
+            except OSError as e:
+                log.error(f'Failed to write the metrics to {self.metrics_file}: {e}')
+            await asyncio.sleep(METRICS_INTERVAL_SECONDS)
+
+    async def archive_history(self) -> None:
+        """ Archives finished jobs one batch at a time, every ARCHIVE_INTERVAL_SECONDS until cancelled """
+        assert self.archive_after_days is not None
         while True:
-            time.sleep(30)
-            tasks = self.scan_custom_jobs()
+            try:
+                while await self.db.run(archive.archive_jobs, self.pool, self.now(), self.archive_after_days):
+                    pass
+            except sqlite3.Error as e:
+                log.error(f'Failed to archive finished jobs: {e}')
+            await clock.sleep_async(archive.ARCHIVE_INTERVAL_SECONDS)
+
+    async def keep_leases_alive(self) -> None:
+        """ Renews the leases of the batches being dispatched until cancelled """
+        while True:
+            await clock.sleep_async(self.lease_seconds / 3)
+            if self.in_flight:
+                await self.db.run(self.renew_leases, sorted(self.in_flight))
+
+    def notify(self) -> None:
+        """ Wakes the scheduler so it re-reads the next due time.
+            Safe to call from any thread, e.g. right after a Writer commit """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wake)
+
+    def on_notification(self, listener: Listener) -> None:
+        """ Wakes the scheduler after a Writer in another process committed """
+        if listener.drain():
+            self.wake()
+
+    def wake(self) -> None:
+        """ Wakes the scan loop, and the prefetcher to stage any new job. Runs on the event loop """
+        for event in (self.new_job_event, self.prefetch_event):
+            if event is not None:
+                event.set()
+
+    async def wait_for_next_job(self) -> None:
+        """ Sleeps until the next job is due, a new job is inserted,
+            or max_sleep seconds pass, whichever comes first """
+        assert self.new_job_event is not None
+        # Clear before querying: a job committed after this point either shows up
+        # in the query below or sets the event again
+        self.new_job_event.clear()
+
+        timeout: float = self.max_sleep
+        next_due = await self.db.run(self.next_due_time)
+        if next_due is not None:
+            timeout = min(timeout, next_due - clock.now())
+
+        if timeout <= 0:
+            return
+
+        try:
+            await asyncio.wait_for(self.new_job_event.wait(), clock.real_seconds(timeout))
+        except asyncio.TimeoutError:
+            pass
+
+    async def dispatch(self, tasks: List[Dict[str, Any]], batch_slots: asyncio.Semaphore) -> None:
+        """ Runs a claimed batch and records the results, then frees its batch slot """
+        job_ids = [task['CustomJobID'] for task in tasks]
+        self.in_flight.update(job_ids)
+        try:
+            in_doubt = await self.db.run(self.start_dispatches, tasks)
+            to_send = [task for task in tasks if task['Platforms']]
             cleaned_tasks = [
                 clean_empty_strings(task)
-                for task in tasks
+                for task in to_send
+            ]
+            sent_results = await process_scheduler_events(cleaned_tasks, self.dispatch_slots)
+            for task, cleaned in zip(to_send, cleaned_tasks):
+                if 'PostIDs' in cleaned:
+                    task['PostIDs'] = cleaned['PostIDs']
+
+            results_by_id = {task['CustomJobID']: errors for task, errors in zip(to_send, sent_results)}
+            results = [
+                dict(errors, **results_by_id.get(task['CustomJobID'], {}))
+                for task, errors in zip(tasks, in_doubt)
             ]
-            await process_scheduler_events(cleaned_tasks)
+            await self.db.run(self.record_results, tasks, results)
+        except Exception as e:
+            # Hand the jobs back to the next claim. Should that fail too, the leases run out,
+            # since only the batches still in flight are renewed. Calls that had started are
+            # in doubt when the jobs are claimed again, see journal
+            log.error(f'Failed to dispatch a batch of {len(tasks)} jobs: {e}')
+            try:
+                await self.db.run(self.release_jobs, job_ids)
+            except sqlite3.Error as release_error:
+                log.error(f'Failed to release a batch of {len(tasks)} jobs: {release_error}')
+        finally:
+            self.in_flight.difference_update(job_ids)
+            batch_slots.release()
+
+    async def scan(self) -> Any:
+        """ Sleeps until the next job is due, then claims due jobs one batch at a time,
+            and dispatches up to MAX_BATCHES_IN_FLIGHT batches at once.
+            Database work runs on the database thread, so it never blocks the event loop """
+        self.loop = asyncio.get_event_loop()
+        self.new_job_event = asyncio.Event()
+        self.dispatch_slots = asyncio.Semaphore(self.max_concurrency)
+        batch_slots = asyncio.Semaphore(MAX_BATCHES_IN_FLIGHT)
+
+        background = [asyncio.ensure_future(self.keep_leases_alive())]
+        if self.metrics_file is not None:
+            background.append(asyncio.ensure_future(self.publish_metrics()))
+        if self.archive_after_days is not None:
+            background.append(asyncio.ensure_future(self.archive_history()))
+        if self.prefetch_horizon is not None:
+            self.prefetch_event = asyncio.Event()
+            prefetcher = Prefetcher(self.db, self.prefetch_horizon)
+            background.append(asyncio.ensure_future(prefetcher.run(self.prefetch_event)))
+        server = metrics.serve(self.metrics_port) if self.metrics_port is not None else None
+        workers = ProcessDispatcher(self.worker_groups, self.max_concurrency) if self.worker_groups else None
+        if workers is not None:
+            workers.start()
+        listener = listen(self.pool.path)
+        if listener is not None:
+            self.loop.add_reader(listener.fileno(), self.on_notification, listener)
+        try:
+            while True:
+                await batch_slots.acquire()
+                await self.wait_for_next_job()
+                tasks = await self.db.run(self.claim_and_measure)
+                if not tasks:
+                    batch_slots.release()
+                    continue
+
+                asyncio.ensure_future(self.dispatch(tasks, batch_slots))
+        finally:
+            for task in background:
+                task.cancel()
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if listener is not None:
+                self.loop.remove_reader(listener.fileno())
+                listener.close()
+            if workers is not None:
+                # Joining the worker processes can take a while; other tasks keep running meanwhile
+                await self.loop.run_in_executor(None, workers.close)
 
     def run_scheduler(self) -> None:
         loop = asyncio.get_event_loop()
@@ -74,5 +482,5 @@ class Reader():
 
 
 if __name__ == '__main__':
-    r = Reader()
+    r = Reader(archive_after_days=archive.ARCHIVE_AFTER_DAYS, prefetch_horizon=PREFETCH_HORIZON_SECONDS)
     r.run_scheduler()
@@ -0,0 +1,104 @@
+"""
+Receipts of published posts: which platform post each Job became.
+
+When an adapter returns the ID of the post it made, the Reader stores it in PostReceipt
+along with the dispatch results. Retraction looks the posts of a job, a Person or a
+campaign up here, and marks each receipt retracted, or why it could not be.
+"""
+import sqlite3
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from postr.schedule.database import rows_to_dicts
+from postr.schedule.job_status import CANCELLED
+from postr.schedule.job_status import PENDING
+from postr.schedule.job_status import RETRYING
+from postr.schedule.recurrence import RECURRING_TABLES
+
+
+def record(cursor: sqlite3.Cursor, task: Mapping[str, Any], now: int) -> None:
+    """ Stores the post IDs a dispatched task collected in 'PostIDs', one receipt per platform """
+    cursor.executemany(
+        """INSERT INTO PostReceipt(Job_ID, CustomJob_ID, Platform, PostID, PostedAt)
+            VALUES(?, ?, ?, ?, ?)""",
+        [
+            (task['Job_ID'], task['CustomJobID'], platform, post_id, now)
+            for platform, post_id in (task.get('PostIDs') or {}).items()
+        ],
+    )
+
+
+def job_filter(
+        job_ids: Sequence[int] = (),
+        person_id: Optional[int] = None,
+        campaign: Optional[str] = None,
+) -> Tuple[str, List[Any]]:
+    """ Returns a subquery of the JobIDs of the given jobs, a Person's jobs and a campaign's jobs,
+        and its parameters. At least one of them must be given """
+    conditions: List[str] = []
+    parameters: List[Any] = []
+    if job_ids:
+        conditions.append(f"JobID IN ({', '.join('?' * len(job_ids))})")
+        parameters.extend(job_ids)
+    if person_id is not None:
+        conditions.append('Person_ID = ?')
+        parameters.append(person_id)
+    if campaign is not None:
+        conditions.append('Campaign = ?')
+        parameters.append(campaign)
+    if not conditions:
+        raise ValueError('Choose jobs by ID, Person or campaign')
+
+    return f"SELECT JobID FROM Job WHERE {' OR '.join(conditions)}", parameters
+
+
+def posts(cursor: sqlite3.Cursor, jobs: Tuple[str, List[Any]]) -> List[Dict[str, Any]]:
+    """ Returns the receipts of the posts of jobs, from job_filter, not retracted yet """
+    subquery, parameters = jobs
+    cursor.execute(
+        f"""SELECT PostReceiptID, Job_ID, Platform, PostID, PostedAt FROM PostReceipt
+            WHERE RetractedAt IS NULL AND Job_ID IN ({subquery})
+            ORDER BY PostReceiptID""",
+        parameters,
+    )
+    return rows_to_dicts(cursor)
+
+
+def cancel_jobs(cursor: sqlite3.Cursor, jobs: Tuple[str, List[Any]]) -> int:
+    """ Stops jobs, from job_filter, from posting again: their pending and retrying occurrences
+        are cancelled and their recurring jobs end. Returns the number of occurrences cancelled.
+        Occurrences being dispatched right now still post """
+    subquery, parameters = jobs
+    cursor.execute(
+        f"""UPDATE JobPlatform SET Status = ?
+            WHERE Status IN (?, ?) AND CustomJob_ID IN (
+                SELECT CustomJobID FROM CustomJob WHERE Status IN (?, ?) AND Job_ID IN ({subquery})
+            )""",
+        (CANCELLED, PENDING, RETRYING, PENDING, RETRYING, *parameters),
+    )
+    cursor.execute(
+        f"""UPDATE CustomJob SET Status = ?, RetryAt = NULL
+            WHERE Status IN (?, ?) AND Job_ID IN ({subquery})""",
+        (CANCELLED, PENDING, RETRYING, *parameters),
+    )
+    cancelled: int = cursor.rowcount
+    for table in RECURRING_TABLES:
+        cursor.execute(f'UPDATE {table} SET NextRunTime = NULL WHERE Job_ID IN ({subquery})', parameters)
+    return cancelled
+
+
+def mark_retracted(cursor: sqlite3.Cursor, results: Sequence[Tuple[int, Optional[str]]], now: int) -> None:
+    """ Records the outcome of retracting posts: (PostReceiptID, None if it was deleted or why not) """
+    cursor.executemany(
+        'UPDATE PostReceipt SET RetractedAt = ?, RetractError = NULL WHERE PostReceiptID = ?',
+        [(now, receipt_id) for receipt_id, error in results if error is None],
+    )
+    cursor.executemany(
+        'UPDATE PostReceipt SET RetractError = ? WHERE PostReceiptID = ?',
+        [(error, receipt_id) for receipt_id, error in results if error is not None],
+    )
@@ -0,0 +1,164 @@
+"""
+Recurrence engine for DailyJob, MonthlyJob and CronJob.
+
+Each recurring job stores only its next occurrence, in an indexed NextRunTime column.
+When that time comes, materialize_due_jobs() inserts a pending CustomJob for the
+occurrence and advances NextRunTime in the same transaction, so from then on the
+occurrence is claimed, leased and dispatched exactly like a one-off job.
+Future occurrences are never expanded up front.
+"""
+import sqlite3
+from datetime import datetime as dt
+from datetime import timedelta
+import calendar
+from typing import Callable
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from postr.schedule import job_platforms
+from postr.schedule.cron import next_cron_run
+
+MINUTE = 60
+DAY = 24 * 60 * MINUTE
+
+
+def add_days(timestamp: int, days: int) -> int:
+    """ Moves a timestamp by whole calendar days, keeping its local time of day """
+    moved = dt.fromtimestamp(timestamp) + timedelta(days=days)
+    return int(moved.timestamp())
+
+
+def add_months(timestamp: int, months: int) -> int:
+    """ Moves a timestamp by whole calendar months, keeping its local day and time.
+        The day is clamped to the end of shorter months, e.g. Jan 31 + 1 month is Feb 28 """
+    start = dt.fromtimestamp(timestamp)
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return int(start.replace(year=year, month=month, day=day).timestamp())
+
+
+def _next_occurrence(
+        start_time: int,
+        after: int,
+        step: Callable[[int, int], int],
+        approximate_period: int,
+) -> int:
+    """ Returns the first occurrence step(start_time, n) that is later than after.
+        The index n is estimated from approximate_period and then corrected, so the
+        cost does not depend on how many occurrences have already gone by """
+    if after < start_time:
+        return start_time
+
+    n = max((after - start_time) // approximate_period, 0)
+    while n > 0 and step(start_time, n) > after:
+        n -= 1
+    while step(start_time, n) <= after:
+        n += 1
+    return step(start_time, n)
+
+
+def next_daily_run(
+        start_time: int,
+        frequency: int,
+        interval_in_minutes: int,
+        after: int,
+        end_time: Optional[int] = None,
+) -> Optional[int]:
+    """ Returns the first run of a DailyJob later than after, or None once it has ended.
+        A DailyJob runs at StartTime, then every IntervalInMinutes minutes when that is set,
+        otherwise every Frequency days at the same local time """
+    if interval_in_minutes:
+        period = interval_in_minutes * MINUTE
+        next_run = start_time
+        if after >= start_time:
+            next_run += ((after - start_time) // period + 1) * period
+    else:
+        days = max(frequency or 1, 1)
+        next_run = _next_occurrence(start_time, after, lambda start, n: add_days(start, n * days), days * DAY)
+
+    if end_time is not None and next_run > end_time:
+        return None
+    return next_run
+
+
+def next_monthly_run(
+        start_time: int,
+        frequency: int,
+        interval_in_days: int,
+        after: int,
+        end_time: Optional[int] = None,
+) -> Optional[int]:
+    """ Returns the first run of a MonthlyJob later than after, or None once it has ended.
+        A MonthlyJob runs at StartTime, then every IntervalInDays days when that is set,
+        otherwise every Frequency months on the same day of the month """
+    if interval_in_days:
+        next_run = _next_occurrence(
+            start_time, after, lambda start, n: add_days(start, n * interval_in_days), interval_in_days * DAY,
+        )
+    else:
+        months = max(frequency or 1, 1)
+        next_run = _next_occurrence(
+            start_time, after, lambda start, n: add_months(start, n * months), months * 28 * DAY,
+        )
+
+    if end_time is not None and next_run > end_time:
+        return None
+    return next_run
+
+
+# Table -> (primary key, columns passed to the next run function before after and end_time, next run function)
+RECURRING_TABLES: Dict[str, Tuple[str, Tuple[str, ...], Callable[..., Optional[int]]]] = {
+    'DailyJob': ('DailyJobID', ('StartTime', 'Frequency', 'IntervalInMinutes'), next_daily_run),
+    'MonthlyJob': ('MonthlyJobID', ('StartTime', 'Frequency', 'IntervalInDays'), next_monthly_run),
+    'CronJob': ('CronJobID', ('StartTime', 'Schedule'), next_cron_run),
+}
+
+
+def first_run(start_time: int, end_time: Optional[int] = None) -> Optional[int]:
+    """ Returns the NextRunTime of a newly created recurring job """
+    if end_time is not None and start_time > end_time:
+        return None
+    return start_time
+
+
+def next_due_time(cursor: sqlite3.Cursor) -> Optional[int]:
+    """ Returns the earliest NextRunTime of any recurring job """
+    cursor.execute(
+        f"""SELECT MIN(NextRunTime) FROM ({' UNION ALL '.join(
+            f'SELECT MIN(NextRunTime) AS NextRunTime FROM {table}' for table in RECURRING_TABLES
+        )})""",
+    )
+    next_due: Optional[int] = cursor.fetchone()[0]
+    return next_due
+
+
+def materialize_due_jobs(cursor: sqlite3.Cursor, now: int, limit: int) -> int:
+    """ Turns up to limit due recurring occurrences into pending CustomJobs, and
+        advances each job's NextRunTime past now. Must run inside the caller's write
+        transaction, so the insert and the advance commit or roll back together.
+        Occurrences missed while no scheduler ran collapse into a single run.
+        Returns the number of CustomJobs inserted """
+    inserted = 0
+    for table, (key, columns, next_run) in RECURRING_TABLES.items():
+        cursor.execute(
+            f"""SELECT {key}, Job_ID, NextRunTime, EndTime, {', '.join(columns)}
+                FROM {table}
+                WHERE NextRunTime <= ?
+                ORDER BY NextRunTime
+                LIMIT ?""", (now, limit - inserted),
+        )
+        for row_id, job_id, run_time, end_time, *values in cursor.fetchall():
+            cursor.execute('INSERT INTO CustomJob(CustomDate, Job_ID) VALUES(?, ?)', (run_time, job_id))
+            custom_job_id = cursor.lastrowid
+            assert custom_job_id is not None
+            job_platforms.add(cursor, custom_job_id, custom_job_id)
+            cursor.execute(
+                f"""UPDATE {table} SET NextRunTime = ?, FrequencyCounter = FrequencyCounter + 1
+                    WHERE {key} = ?""",
+                (next_run(*values, max(now, run_time), end_time), row_id),
+            )
+            inserted += 1
+
+    return inserted
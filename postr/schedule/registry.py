@@ -0,0 +1,83 @@
+import importlib
+import threading
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+from postr.config import missing_configs_for
+from postr.postr_logger import make_logger
+
+log = make_logger('adapter_registry')
+
+
+class AdapterRegistry():
+    """
+    Builds each API adapter the first time it is used and keeps it for reuse.
+
+    Adapters are expensive to build (logins, follower downloads, discovery documents),
+    so nothing is imported or constructed until a job actually needs the platform.
+    Each platform has its own lock: two threads never build the same adapter twice,
+    and a slow Instagram login does not hold up the first Twitter post.
+    """
+
+    def __init__(self, factories: Dict[str, Tuple[str, str]]) -> None:
+        """ factories maps an API name to the (module, class) that builds its adapter """
+        self.factories = factories
+        self.instances: Dict[str, Optional[Any]] = {}
+        self.locks = {api: threading.Lock() for api in factories}
+
+    def __contains__(self, api: object) -> bool:
+        return api in self.factories or api in self.instances
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.factories)
+
+    def __getitem__(self, api: str) -> Optional[Any]:
+        """ Returns the adapter for an API, building it if needed.
+            None means the API is missing config files, or failed to build """
+        if api not in self:
+            raise KeyError(api)
+        return self.get(api)
+
+    def __setitem__(self, api: str, instance: Optional[Any]) -> None:
+        """ Replaces the adapter for an API, e.g. with a fake one """
+        self.instances[api] = instance
+
+    def is_built(self, api: str) -> bool:
+        """ Returns whether getting the adapter for an API is instant """
+        return api in self.instances
+
+    def get(self, api: str, default: Optional[Any] = None) -> Optional[Any]:
+        """ Returns the adapter for an API, building it if needed """
+        if api in self.instances:
+            return self.instances[api]
+        if api not in self.factories:
+            return default
+
+        with self.locks[api]:
+            if api in self.instances:
+                return self.instances[api]
+
+            if missing_configs_for(api):
+                log.error(f'The API "{api}" does not have all necessary config files!')
+                self.instances[api] = None
+                return None
+
+            instance = self.build(api)
+            if instance is not None:
+                # A failed build, e.g. while the network is down, is retried on next use
+                self.instances[api] = instance
+            return instance
+
+    def build(self, api: str) -> Optional[Any]:
+        """ Imports and constructs the adapter for an API, or returns None if that fails """
+        module_name, class_name = self.factories[api]
+        try:
+            adapter_class = getattr(importlib.import_module(module_name), class_name)
+            log.info(f'Building the {api} adapter')
+            return adapter_class()
+        except Exception as e:
+            log.error(f'Failed to build the {api} adapter: {e}')
+            return None
@@ -0,0 +1,330 @@
+"""
+Capacity planning: replay a slice of the schedule against a fast virtual clock.
+
+replay() copies the jobs due in a time range, and every recurring job, from a schedule
+database into a scratch one, all pending again. It then runs the Reader and the task processor on
+it under a VirtualClock that starts at the beginning of the range and runs speed times
+faster than real time, with the real rate limits and a recording stub in place of every
+platform's adapter, until the end of the range. Nothing is posted.
+
+The report says, per platform, how many calls the range makes, the busiest minute and
+hour, the deepest queue of posts that were due but not sent yet, and how late posts went
+out. A platform whose rate limit cannot keep up with its calendar shows as a growing queue
+and lag. At high speeds the scheduler's own work is compressed as well; if the lag of every
+platform is high, replay again more slowly.
+
+Usage: python -m postr.schedule.replay --since 2019-04-01 --until 2019-05-01 [--speed 500] [--latency 1]
+"""
+import argparse
+import asyncio
+from bisect import bisect_left
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+
+from postr import clock
+from postr.rate_limiter import limiter
+from postr.schedule import job_platforms
+from postr.schedule import task_processor
+from postr.schedule.database import connect
+from postr.schedule.database import DB_PATH
+from postr.schedule.importer import parse_date
+from postr.schedule.importer import RejectedRow
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.job_status import PENDING
+from postr.schedule.job_status import RETRYING
+from postr.schedule.metrics import Histogram
+from postr.schedule.metrics import metrics
+from postr.schedule.migrations import migrate
+from postr.schedule.reader import Reader
+from postr.schedule.recurrence import RECURRING_TABLES
+
+# Virtual seconds per real second
+DEFAULT_SPEED = 500
+
+# Virtual seconds every stubbed platform call takes
+DEFAULT_LATENCY = 1.0
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+
+
+class StubAdapter():
+    """ Stands in for a platform's adapter. Every method waits for its endpoint's rate limit, like the
+        real adapters' methods, takes latency seconds of virtual time, succeeds and returns a made-up
+        post ID; the virtual time of every call is recorded """
+
+    def __init__(self, platform: str, latency: float, is_async: bool) -> None:
+        self.platform = platform
+        self.latency = latency
+        self.is_async = is_async
+        self.endpoints = {
+            dispatch.method: dispatch.endpoint
+            for (api, _), dispatch in task_processor.dispatch_table.items() if api == platform
+        }
+        self.lock = threading.Lock()
+        self.calls: List[float] = []
+
+    def record(self) -> str:
+        with self.lock:
+            self.calls.append(clock.now())
+            return f'{self.platform}-{len(self.calls)}'
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        endpoint = self.endpoints.get(name, '*')
+
+        if self.is_async:
+            async def call_async(**arguments: Any) -> str:  # pylint: disable=unused-argument
+                await limiter.acquire_async(self.platform, endpoint)
+                await clock.sleep_async(self.latency)
+                return self.record()
+            return call_async
+
+        def call(**arguments: Any) -> str:  # pylint: disable=unused-argument
+            limiter.acquire(self.platform, endpoint)
+            clock.sleep(self.latency)
+            return self.record()
+        return call
+
+
+class DueTimeRecorder(Histogram):
+    """ The schedule lag histogram, also keeping when each platform call it measures was due """
+
+    def __init__(self, histogram: Histogram) -> None:
+        super().__init__(histogram.name, histogram.description, histogram.buckets, histogram.labels)
+        self.due_times: Dict[str, List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        super().observe(value, *label_values)
+        with self.lock:
+            self.due_times.setdefault(label_values[0], []).append(clock.now() - value)
+
+
+class PlatformLoad(NamedTuple):
+    """ What a replayed range asks of one platform. Rates count calls per virtual minute and hour;
+        the queue is posts already due but not sent yet; lags are in seconds """
+    platform: str
+    calls: int
+    peak_per_minute: int
+    peak_per_hour: int
+    peak_queue: int
+    lag_p50: float
+    lag_p95: float
+    lag_max: float
+    limit_per_hour: float
+
+
+def peak_in_window(times: List[float], window: float) -> int:
+    """ Returns the most of times, sorted, that fall within any window seconds """
+    peak = 0
+    for i, start in enumerate(times):
+        peak = max(peak, bisect_left(times, start + window) - i)
+    return peak
+
+
+def peak_queue(due_times: List[float], call_times: List[float]) -> int:
+    """ Returns the most posts that were due but not sent at any moment """
+    events = sorted([(due, 1) for due in due_times] + [(called, -1) for called in call_times])
+    depth = peak = 0
+    for _, change in events:
+        depth += change
+        peak = max(peak, depth)
+    return peak
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def limit_per_hour(platform: str) -> float:
+    """ The sustained rate limit of a platform's post endpoint, per hour """
+    rate, _ = limiter.limits.get((platform, 'post')) or limiter.limits.get((platform, '*')) or (0.0, 0.0)
+    return rate * HOUR
+
+
+def summarize(due_times: Mapping[str, List[float]], calls: Mapping[str, List[float]]) -> List[PlatformLoad]:
+    """ Returns the load on each platform from when its calls were due and when they were made.
+        The schedule lag is measured before an adapter waits for its rate limit, so lags pair
+        due times with calls in order: rate limits hand out calls first come, first served """
+    loads = []
+    for platform in sorted(calls):
+        times = sorted(calls[platform])
+        if not times:
+            continue
+        due = sorted(due_times.get(platform, []))
+        lags = [max(called - due_time, 0.0) for due_time, called in zip(due, times)]
+        loads.append(PlatformLoad(
+            platform=platform,
+            calls=len(times),
+            peak_per_minute=peak_in_window(times, MINUTE),
+            peak_per_hour=peak_in_window(times, HOUR),
+            peak_queue=peak_queue(due, times),
+            lag_p50=percentile(lags, 0.5),
+            lag_p95=percentile(lags, 0.95),
+            lag_max=max(lags, default=0.0),
+            limit_per_hour=limit_per_hour(platform),
+        ))
+    return loads
+
+
+def prepare(source_path: str, path: str, since: int, until: int) -> int:
+    """ Creates a schedule database at path with the occurrences of source_path due from since to until,
+        pending, and its recurring jobs, next due after since. Returns how many occurrences it holds """
+    source = connect(source_path)
+    migrate(source)
+    source.close()
+
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    cursor = conn.cursor()
+    cursor.execute('ATTACH DATABASE ? AS source', (source_path,))
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute(
+        """INSERT INTO main.CustomJob(CustomJobID, CustomDate, Job_ID)
+            SELECT CustomJobID, CustomDate, Job_ID FROM source.CustomJob
+            WHERE CustomDate BETWEEN ? AND ?""",
+        (since, until),
+    )
+    occurrences = cursor.rowcount
+    for table, (key, columns, next_run) in RECURRING_TABLES.items():
+        cursor.execute(
+            f"""INSERT INTO main.{table}({key}, Job_ID, EndTime, {', '.join(columns)})
+                SELECT {key}, Job_ID, EndTime, {', '.join(columns)} FROM source.{table}""",
+        )
+        cursor.execute(f"SELECT {key}, EndTime, {', '.join(columns)} FROM main.{table}")
+        cursor.executemany(
+            f'UPDATE main.{table} SET NextRunTime = ? WHERE {key} = ?',
+            [(next_run(*values, since - 1, end_time), row_id) for row_id, end_time, *values in cursor.fetchall()],
+        )
+
+    # The Jobs of the copied occurrences and recurring jobs
+    job_ids = ' UNION '.join(f'SELECT Job_ID FROM main.{table}' for table in ['CustomJob', *RECURRING_TABLES])
+    cursor.execute(f'INSERT INTO main.Job SELECT * FROM source.Job WHERE JobID IN ({job_ids})')
+    cursor.execute('SELECT MIN(CustomJobID), MAX(CustomJobID) FROM main.CustomJob')
+    first, last = cursor.fetchone()
+    if first is not None:
+        job_platforms.add(cursor, first, last)
+    conn.commit()
+    cursor.execute('DETACH DATABASE source')
+    conn.close()
+    return occurrences
+
+
+async def run_until(reader: Reader, until: int, timeout: float) -> bool:
+    """ Runs the scheduler until the virtual clock passes until and everything due by then has been
+        dispatched, or timeout real seconds pass. Returns whether it finished """
+    scanning = asyncio.ensure_future(reader.scan())
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < timeout:
+            if clock.now() >= until and not await reader.db.query_one(
+                    'SELECT COUNT(*) FROM CustomJob WHERE Status IN (?, ?, ?) AND CustomDate <= ?',
+                    (PENDING, CLAIMED, RETRYING, until),
+            ):
+                return True
+            await asyncio.sleep(0.05)
+        return False
+    finally:
+        # Let the scan's cleanup run before the scratch database goes away
+        scanning.cancel()
+        try:
+            await scanning
+        except asyncio.CancelledError:
+            pass
+
+
+def replay(
+        source_path: str,
+        since: int,
+        until: int,
+        speed: float = DEFAULT_SPEED,
+        latency: float = DEFAULT_LATENCY,
+        timeout: Optional[float] = None,
+        directory: Optional[str] = None,
+) -> List[PlatformLoad]:
+    """ Replays the schedule of source_path from since to until, speed times faster than real time,
+        with every platform call taking latency virtual seconds, and returns the load on each platform.
+        Gives up after timeout real seconds, by default twice the replay's expected duration """
+    timeout = timeout if timeout is not None else 2 * (until - since) / speed + 60
+    recorder = DueTimeRecorder(metrics.schedule_lag)
+    previous_histogram, metrics.schedule_lag = metrics.schedule_lag, recorder
+    previous_adapters = dict(task_processor.api_to_instance.instances)
+
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        path = os.path.join(scratch, 'replay.sqlite')
+        prepare(source_path, path, since, until)
+
+        stubs = {
+            platform: StubAdapter(platform, latency, spec['is_async'])
+            for platform, spec in task_processor.api_to_function.items()
+        }
+        for platform, stub in stubs.items():
+            task_processor.api_to_instance[platform] = stub
+        previous_clock = clock.set_clock(clock.VirtualClock(since, speed))
+        limiter.reset()
+        reader = Reader(file_path=path, worker_id='replay')
+        try:
+            loop = asyncio.get_event_loop()
+            if not loop.run_until_complete(run_until(reader, until, timeout)):
+                raise TimeoutError(f'The replay did not finish within {timeout:.0f}s; try a lower speed')
+        finally:
+            reader.cleanup()
+            reader.pool.close()
+            clock.set_clock(previous_clock)
+            limiter.reset()
+            metrics.schedule_lag = previous_histogram
+            task_processor.api_to_instance.instances.clear()
+            task_processor.api_to_instance.instances.update(previous_adapters)
+
+    return summarize(recorder.due_times, {platform: stub.calls for platform, stub in stubs.items()})
+
+
+def parse_time(value: str) -> int:
+    try:
+        return parse_date(value)
+    except RejectedRow as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replay a slice of the schedule at high speed against stub adapters')
+    parser.add_argument('--db', default=DB_PATH, help='schedule database to replay')
+    parser.add_argument('--since', type=parse_time, required=True, help='start of the range, a date or timestamp')
+    parser.add_argument('--until', type=parse_time, required=True, help='end of the range, a date or timestamp')
+    parser.add_argument('--speed', type=float, default=DEFAULT_SPEED, help='virtual seconds per real second')
+    parser.add_argument(
+        '--latency', type=float, default=DEFAULT_LATENCY, help='virtual seconds each platform call takes',
+    )
+    args = parser.parse_args()
+    if args.until <= args.since:
+        parser.error('--until must be after --since')
+
+    loads = replay(args.db, args.since, args.until, args.speed, args.latency)
+    print(
+        f'{"platform":<12}{"calls":>8}{"peak/min":>10}{"peak/hour":>11}{"limit/hour":>12}'
+        f'{"peak queue":>12}{"lag p50":>10}{"lag p95":>10}{"lag max":>10}',
+    )
+    for load in loads:
+        print(
+            f'{load.platform:<12}{load.calls:>8}{load.peak_per_minute:>10}{load.peak_per_hour:>11}'
+            f'{load.limit_per_hour:>12.0f}{load.peak_queue:>12}'
+            f'{load.lag_p50:>9.0f}s{load.lag_p95:>9.0f}s{load.lag_max:>9.0f}s',
+        )
+
+
+if __name__ == '__main__':
+    main()
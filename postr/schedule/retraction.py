@@ -0,0 +1,116 @@
+"""
+Bulk retraction: delete every post of some jobs, a Person or a campaign, on every platform.
+
+The posts come from PostReceipt. Their remove_post calls all run at once through the
+task processor, so they are bounded by its concurrency limit and wait for each
+platform's rate limit like any dispatch. The jobs' future occurrences are cancelled
+first, so nothing posts after the retraction. A post whose deletion fails keeps its
+receipt, with the error, and is tried again by the next retraction.
+
+Usage: python -m postr.schedule.retraction (--job ID ... | --person ID | --campaign NAME) [--dry-run]
+"""
+import argparse
+import asyncio
+import sqlite3
+import time
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+
+from postr import clock
+from postr.schedule import receipts
+from postr.schedule.async_db import AsyncDatabase
+from postr.schedule.database import ConnectionPool
+from postr.schedule.database import DB_PATH
+from postr.schedule.database import get_pool
+from postr.schedule.task_processor import process_scheduler_events
+
+
+class Retraction(NamedTuple):
+    """ The outcome of deleting one post: error is None if it was deleted """
+    post_receipt_id: int
+    job_id: int
+    platform: str
+    post_id: str
+    error: Optional[str]
+
+
+async def retract(
+        pool: ConnectionPool,
+        job_ids: Sequence[int] = (),
+        person_id: Optional[int] = None,
+        campaign: Optional[str] = None,
+) -> List[Retraction]:
+    """ Cancels the given jobs, a Person's jobs and a campaign's jobs, deletes all of their
+        posts on every platform concurrently, and returns the outcome for each post """
+    jobs = receipts.job_filter(job_ids, person_id, campaign)
+    db = AsyncDatabase(pool)
+    try:
+        def cancel_and_find_posts(cursor: sqlite3.Cursor) -> List[dict]:
+            receipts.cancel_jobs(cursor, jobs)
+            return receipts.posts(cursor, jobs)
+
+        posts = await db.transaction(cancel_and_find_posts)
+        tasks = [
+            {
+                'Platforms': post['Platform'],
+                'Action': 'remove_post',
+                'Comment': None,
+                'MediaPath': None,
+                'OptionalText': post['PostID'],
+            }
+            for post in posts
+        ]
+        results = await process_scheduler_events(tasks)
+
+        retractions = [
+            Retraction(
+                post['PostReceiptID'],
+                post['Job_ID'],
+                post['Platform'],
+                post['PostID'],
+                errors[post['Platform']].message if errors else None,
+            )
+            for post, errors in zip(posts, results)
+        ]
+        now = int(clock.now())
+        await db.transaction(
+            lambda cursor: receipts.mark_retracted(
+                cursor, [(retraction.post_receipt_id, retraction.error) for retraction in retractions], now,
+            ),
+        )
+        return retractions
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Delete every post of some jobs, a person or a campaign')
+    parser.add_argument('--job', nargs='+', type=int, default=[], metavar='ID', help='jobs to retract')
+    parser.add_argument('--person', type=int, metavar='ID', help="retract all of a person's jobs")
+    parser.add_argument('--campaign', help="retract all of a campaign's jobs")
+    parser.add_argument('--dry-run', action='store_true', help='only list the posts that would be deleted')
+    args = parser.parse_args()
+    if not (args.job or args.person is not None or args.campaign is not None):
+        parser.error('choose --job, --person or --campaign')
+
+    pool = get_pool(DB_PATH)
+    if args.dry_run:
+        for post in receipts.posts(pool.cursor(), receipts.job_filter(args.job, args.person, args.campaign)):
+            print(f"job {post['Job_ID']}: {post['Platform']} post {post['PostID']}")
+        return
+
+    start = time.perf_counter()
+    retractions = asyncio.get_event_loop().run_until_complete(retract(pool, args.job, args.person, args.campaign))
+    failed = [retraction for retraction in retractions if retraction.error is not None]
+    for retraction in failed:
+        print(f'job {retraction.job_id}: {retraction.platform} post {retraction.post_id} failed: {retraction.error}')
+    print(
+        f'Deleted {len(retractions) - len(failed)} of {len(retractions)} posts '
+        f'in {time.perf_counter() - start:.1f}s',
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Retries of failed dispatches, and the dead-letter table for jobs out of retries.
+
+A job that fails on some of its platforms goes back into the schedule as retrying:
+the JobPlatform targets that failed are due again at RetryAt and the others are done,
+so the platforms that succeeded never post twice. RetryPlatforms and RetryAt record
+the retry on the CustomJob too. The Reader claims it like any other due job, so a
+retry never blocks the scan loop. The delay doubles with every attempt, with
+jitter so jobs that failed together during an outage do not all retry together.
+After max_attempts, or on an error that retrying cannot fix, the job is failed
+and copied to DeadLetter, where it can be inspected and replayed.
+"""
+import random
+import sqlite3
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+
+from postr.schedule import job_platforms
+from postr.schedule import journal
+from postr.schedule.database import rows_to_dicts
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.job_status import FAILED
+from postr.schedule.job_status import PENDING
+from postr.schedule.job_status import RETRYING
+from postr.schedule.task_processor import DispatchError
+
+# Attempts a job gets, the first one included, before it is dead-lettered
+MAX_ATTEMPTS = 5
+
+# Delay before the first retry, doubled for every attempt after it, up to RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 60 * 60
+
+
+def backoff_seconds(
+        attempts: int,
+        base: float = RETRY_BASE_SECONDS,
+        maximum: float = RETRY_MAX_SECONDS,
+) -> float:
+    """ Returns how long to wait before retrying a job that has failed attempts times.
+        Half the delay is fixed and half is random, so it stays exponential but spreads out """
+    delay: float = min(maximum, base * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def record_failure(
+        cursor: sqlite3.Cursor,
+        custom_job_id: int,
+        worker_id: str,
+        errors: Mapping[str, DispatchError],
+        now: int,
+        max_attempts: int = MAX_ATTEMPTS,
+) -> Optional[str]:
+    """ Schedules a retry of the platforms a claimed job failed on, or dead-letters it
+        once it is out of attempts. Returns the job's new status, or None if the
+        worker's claim had already run out """
+    cursor.execute(
+        """SELECT Job_ID, Attempts FROM CustomJob
+            WHERE CustomJobID = ? AND Status = ? AND WorkerID = ?""",
+        (custom_job_id, CLAIMED, worker_id),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    job_id, attempts = row
+    attempts += 1
+    platforms = ','.join(errors)
+    last_error = '\n'.join(error.message for error in errors.values())
+
+    if attempts < max_attempts and all(error.retryable for error in errors.values()):
+        retry_at = now + int(backoff_seconds(attempts))
+        cursor.execute(
+            """UPDATE CustomJob
+                SET Status = ?, Attempts = ?, RetryPlatforms = ?, RetryAt = ?, LastError = ?, LeaseExpiry = NULL
+                WHERE CustomJobID = ?""",
+            (RETRYING, attempts, platforms, retry_at, last_error, custom_job_id),
+        )
+        job_platforms.fail(cursor, custom_job_id, errors, RETRYING, now, retry_at)
+        return RETRYING
+
+    cursor.execute(
+        """UPDATE CustomJob
+            SET Status = ?, Attempts = ?, RetryPlatforms = ?, RetryAt = NULL, LastError = ?, LeaseExpiry = NULL
+            WHERE CustomJobID = ?""",
+        (FAILED, attempts, platforms, last_error, custom_job_id),
+    )
+    job_platforms.fail(cursor, custom_job_id, errors, FAILED, now)
+    cursor.execute(
+        """INSERT INTO DeadLetter(CustomJob_ID, Job_ID, Platforms, Attempts, LastError, FailedAt)
+            VALUES(?, ?, ?, ?, ?, ?)""",
+        (custom_job_id, job_id, platforms, attempts, last_error, now),
+    )
+    return FAILED
+
+
+def dead_letters(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    """ Returns every dead-lettered job with its Job, oldest failure first """
+    cursor.execute(
+        """SELECT DeadLetter.*, Job.Comment, Job.MediaPath, Job.OptionalText, Job.Action, CustomJob.CustomDate
+            FROM DeadLetter
+            INNER JOIN Job ON Job.JobID = DeadLetter.Job_ID
+            INNER JOIN CustomJob ON CustomJob.CustomJobID = DeadLetter.CustomJob_ID
+            ORDER BY DeadLetter.FailedAt, DeadLetter.DeadLetterID""",
+    )
+    return rows_to_dicts(cursor)
+
+
+def replay_dead_letters(cursor: sqlite3.Cursor, dead_letter_ids: Optional[Sequence[int]] = None) -> int:
+    """ Puts dead-lettered jobs back in the schedule, due immediately, with a fresh set of
+        attempts on the platforms they failed on. Replays every dead letter unless
+        dead_letter_ids is given. Calls left in doubt by a crash are made again.
+        Returns the number of jobs replayed """
+    where = ''
+    parameters: Sequence[Any] = ()
+    if dead_letter_ids is not None:
+        if not dead_letter_ids:
+            return 0
+        where = f"WHERE DeadLetterID IN ({', '.join('?' * len(dead_letter_ids))})"
+        parameters = tuple(dead_letter_ids)
+
+    cursor.execute(f'SELECT DeadLetterID, CustomJob_ID, Platforms FROM DeadLetter {where}', parameters)
+    replayed = cursor.fetchall()
+    for dead_letter_id, custom_job_id, platforms in replayed:
+        # Pending and already past its CustomDate, so the next claim picks it up
+        cursor.execute(
+            """UPDATE CustomJob
+                SET Status = ?, Attempts = 0, RetryPlatforms = ?, RetryAt = NULL, WorkerID = NULL
+                WHERE CustomJobID = ?""",
+            (PENDING, platforms, custom_job_id),
+        )
+        job_platforms.requeue(cursor, custom_job_id, job_platforms.split_platforms(platforms))
+        cursor.execute('DELETE FROM DeadLetter WHERE DeadLetterID = ?', (dead_letter_id,))
+    journal.clear_in_doubt(cursor, [custom_job_id for _, custom_job_id, _ in replayed])
+
+    return len(replayed)
@@ -1,33 +1,76 @@
-# import asyncio
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import time
+from typing import Awaitable
+from typing import Callable
+from typing import FrozenSet
 from typing import List
+from typing import NamedTuple
 from typing import Set
 from typing import Any
 from typing import Dict
+from typing import Optional
+from typing import Tuple
+from postr import clock
 from postr.postr_logger import make_logger
-
-from postr.reddit_postr import Reddit
-# from postr import discord_api
-from postr.twitter_postr import Twitter
-# from postr.fbchat_api import FacebookChatApi
-from postr.slack_api import SlackApi
-# from postr.Tumblr_api import TumblrApi
-from postr.instagram_postr import Instagram
-from postr.youtube_postr import Youtube
-from postr.config import missing_configs_for
+from postr.rate_limiter import limiter
+from postr.schedule.metrics import metrics
+from postr.schedule.registry import AdapterRegistry
 
 
 log = make_logger('task_processor')
 
-api_to_instance: Dict[str, Any] = {
-    # 'Discord': Discord_api if missing_configs_for('Discord') == [] else None,
-    'Reddit': Reddit() if missing_configs_for('Reddit') == [] else None,
-    'Twitter': Twitter() if missing_configs_for('Twitter') == [] else None,
-    # 'Facebook': FacebookChatApi() if missing_configs_for('Facebook') == [] else None,
-    'Slack': SlackApi() if missing_configs_for('Slack') == [] else None,
-    # 'Tumblr': TumblrApi() if missing_configs_for('Tumblr') == [] else None,
-    'Instagram': Instagram() if missing_configs_for('Instagram') == [] else None,
-    'YouTube': Youtube() if missing_configs_for('YouTube') == [] else None,
-}
+# Most platform calls in flight at once, across all jobs being dispatched.
+# Synchronous APIs run on a thread pool of the same size, or larger, see ensure_dispatch_threads.
+MAX_CONCURRENT_DISPATCHES = 16
+max_concurrency = MAX_CONCURRENT_DISPATCHES
+dispatch_threads = MAX_CONCURRENT_DISPATCHES
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def set_max_concurrency(limit: int) -> None:
+    """ Changes how many platform calls may run at once """
+    global max_concurrency, dispatch_threads, _executor  # pylint: disable=global-statement
+    max_concurrency = dispatch_threads = limit
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def ensure_dispatch_threads(count: int) -> None:
+    """ Grows the thread pool of the synchronous APIs to at least count threads,
+    for a Reader that lets more calls than that run at once. It never shrinks, since other
+    Readers in the process share it; calls already handed to the old pool still run
+    """
+    global dispatch_threads, _executor  # pylint: disable=global-statement
+    if count <= dispatch_threads:
+        return
+    dispatch_threads = count
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def dispatch_executor() -> ThreadPoolExecutor:
+    """ Returns the thread pool that runs synchronous API calls """
+    global _executor  # pylint: disable=global-statement
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=dispatch_threads, thread_name_prefix='dispatch')
+    return _executor
+
+
+# Adapters are imported and built on first use, see AdapterRegistry
+api_to_instance = AdapterRegistry({
+    # 'Discord': ('postr.discord_api', ...),
+    'Reddit': ('postr.reddit_postr', 'Reddit'),
+    'Twitter': ('postr.twitter_postr', 'Twitter'),
+    # 'Facebook': ('postr.fbchat_api', 'FacebookChatApi'),
+    'Slack': ('postr.slack_api', 'SlackApi'),
+    # 'Tumblr': ('postr.tumblr_api', 'TumblrApi'),
+    'Instagram': ('postr.instagram_postr', 'Instagram'),
+    'YouTube': ('postr.youtube_postr', 'Youtube'),
+})
 # if missing_configs_for('Discord') != []:
 #   api_to_instance['Discord'].main()
 
@@ -36,15 +79,15 @@ api_to_function: Dict[str, Any] = {
         'is_async': True,
         'supported_actions': {
             'post_text': {
-                'function_call': 'api_to_instance["Discord"].post_text',
+                'method': 'post_text',
                 'arguments': {'Comment': 'text'},
             },
             'post_photo': {
-                'function_call': 'api_to_instance["Discord"].post_image',
+                'method': 'post_image',
                 'arguments': {'MediaPath': 'image_filepath'},
             },
             'update_bio': {
-                'function_call': 'api_to_instance["Discord"].update_status',
+                'method': 'update_status',
                 'arguments': {'OptionalText': 'status'},
             },
         },
@@ -53,15 +96,15 @@ api_to_function: Dict[str, Any] = {
         'is_async': False,
         'supported_actions': {
             'post_text': {
-                'function_call': 'api_to_instance["Reddit"].post_text',
+                'method': 'post_text',
                 'arguments': {'Comment': 'text'},
             },
             'post_photo': {
-                'function_call': 'api_to_instance["Reddit"].post_photo',
+                'method': 'post_photo',
                 'arguments': {'MediaPath': 'url', 'OptionalText': 'text'},
             },
             'remove_post': {
-                'function_call': 'api_to_instance["Reddit"].update_status',
+                'method': 'remove_post',
                 'arguments': {'OptionalText': 'post_id'},
             },
         },
@@ -70,15 +113,15 @@ api_to_function: Dict[str, Any] = {
         'is_async': False,
         'supported_actions': {
             'post_text': {
-                'function_call': 'api_to_instance["Twitter"].post_text',
+                'method': 'post_text',
                 'arguments': {'Comment': 'text'},
             },
             'post_photo': {
-                'function_call': 'api_to_instance["Twitter"].post_photo',
+                'method': 'post_photo',
                 'arguments': {'MediaPath': 'url', 'Comment': 'text'},
             },
             'remove_post': {
-                'function_call': 'api_to_instance["Twitter"].update_status',
+                'method': 'remove_post',
                 'arguments': {'OptionalText': 'post_id'},
             },
         },
@@ -87,19 +130,19 @@ api_to_function: Dict[str, Any] = {
         'is_async': False,
         'supported_actions': {
             'post_text': {
-                'function_call': 'api_to_instance["Facebook"].post_text',
+                'method': 'post_text',
                 'arguments': {'Comment': 'text'},
             },
             'post_photo': {
-                'function_call': 'api_to_instance["Facebook"].post_image',
+                'method': 'post_image',
                 'arguments': {'MediaPath': 'image_filepath'},
             },
             'update_bio': {
-                'function_call': 'api_to_instance["Facebook"].update_status',
+                'method': 'update_status',
                 'arguments': {'OptionalText': 'status'},
             },
             'remove_post': {
-                'function_call': 'api_to_instance["Facebook"].delete_thread',
+                'method': 'delete_thread',
                 'arguments': {'OptionalText': 'thread_id'},
             },
         },
@@ -108,15 +151,16 @@ api_to_function: Dict[str, Any] = {
         'is_async': False,
         'supported_actions': {
             'post_text': {
-                'function_call': 'api_to_instance["Slack"].post_text',
+                'method': 'post_text',
                 'arguments': {'Comment': 'text'},
             },
             'post_photo': {
-                'function_call': 'api_to_instance["Slack"].post_photo',
+                'method': 'post_photo',
                 'arguments': {'MediaPath': 'url', 'Comment': 'text'},
+                'endpoint': 'upload',
             },
             'remove_post': {
-                'function_call': 'api_to_instance["Slack"].remove_post',
+                'method': 'remove_post',
                 'arguments': {'OptionalText': 'post_id'},
             },
         },
@@ -125,19 +169,19 @@ api_to_function: Dict[str, Any] = {
         'is_async': False,
         'supported_actions': {
             'post_text': {
-                'function_call': 'api_to_instance["Tumblr"].post_text',
+                'method': 'post_text',
                 'arguments': {'Comment': 'text'},
             },
             'post_video': {
-                'function_call': 'api_to_instance["Tumblr"].post_video',
+                'method': 'post_video',
                 'arguments': {'MediaPath': 'url', 'Comment': 'text'},
             },
             'post_photo': {
-                'function_call': 'api_to_instance["Tumblr"].post_photo',
+                'method': 'post_photo',
                 'arguments': {'MediaPath': 'url', 'Comment': 'text'},
             },
             'remove_post': {
-                'function_call': 'api_to_instance["Tumblr"].remove_post',
+                'method': 'remove_post',
                 'arguments': {'OptionalText': 'post_id'},
             },
         },
@@ -146,11 +190,11 @@ api_to_function: Dict[str, Any] = {
         'is_async': False,
         'supported_actions': {
             'post_photo': {
-                'function_call': 'api_to_instance["Instagram"].post_photo',
+                'method': 'post_photo',
                 'arguments': {'MediaPath': 'url', 'Comment': 'text'},
             },
             'remove_post': {
-                'function_call': 'api_to_instance["Instagram"].remove_post',
+                'method': 'remove_post',
                 'arguments': {'OptionalText': 'post_id'},
             },
         },
@@ -159,11 +203,11 @@ api_to_function: Dict[str, Any] = {
         'is_async': False,
         'supported_actions': {
             'post_video': {
-                'function_call': 'api_to_instance["YouTube"].post_video',
-                'arguments': {'MediaPath': 'file', 'OptionalText': 'text'},
+                'method': 'post_video',
+                'arguments': {'MediaPath': 'url', 'OptionalText': 'text'},
             },
             'remove_post': {
-                'function_call': 'api_to_instance["YouTube"].remove_post',
+                'method': 'remove_post',
                 'arguments': {'OptionalText': 'post_id'},
             },
         },
@@ -171,6 +215,15 @@ api_to_function: Dict[str, Any] = {
 
 }
 
+# The rate limited endpoint each action calls, unless the action names its own
+action_to_endpoint: Dict[str, str] = {
+    'post_text': 'post',
+    'post_photo': 'post',
+    'post_video': 'post',
+    'remove_post': 'delete',
+    'update_bio': 'profile',
+}
+
 
 def has_required_arguments(api: str, action: str, arguments: Set[str]) -> bool:
     required_arguments: Set[str] = api_to_function[api]['supported_actions'][action]['arguments'].keys()
@@ -193,75 +246,189 @@ def get_existing_arguments(task: Dict[str, Any]) -> Set[str]:
     return arguments
 
 
-def create_command(api: str, task: Dict[str, Any], given_arguments: Set[str]) -> str:
-    """ Generates a string that is a valid python command
-    Example: May return api_to_instance['Discord'].post_text(text="wow text here", channel='123232',)
+def map_arguments(arguments: Dict[str, str]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """ Returns a function turning a task into the keyword arguments of an API method,
+    e.g. {'Comment': 'text'} turns a task with Comment 'wow' into {'text': 'wow'}.
+    Arguments the task leaves empty are not passed
     """
-    command = ''
+    columns = tuple(arguments.items())
 
-    action = task['Action']
-    action_to_perform = api_to_function[api]['supported_actions'][action]
-    callable_func = action_to_perform['function_call']
+    def mapper(task: Dict[str, Any]) -> Dict[str, Any]:
+        return {keyword: task[column] for column, keyword in columns if task[column]}
 
-    command += callable_func
-    command += '('
+    return mapper
 
-    functions_for_actions: Dict[str, str] = api_to_function[api]['supported_actions'][action]['arguments']
-    log.info(f'Functions for actions were... {functions_for_actions}')
-    log.info(f'Given arguments were: {given_arguments}')
 
-    method_args = ''
-    for argument in given_arguments:
-        if argument not in functions_for_actions:
-            continue  # Scheduler provided extra argument, skip
-        method_args += functions_for_actions[argument]
-        method_args += '='
-        method_args += f'"{task[argument]}"'
-        method_args += ','
+class Dispatch(NamedTuple):
+    """ A precompiled API action: which adapter method to call and how to call it """
+    method: str
+    is_async: bool
+    endpoint: str
+    required_arguments: FrozenSet[str]
+    map_arguments: Callable[[Dict[str, Any]], Dict[str, Any]]
 
-    command += method_args
-    command += ')'
 
-    return command
+def compile_dispatch_table() -> Dict[Tuple[str, str], Dispatch]:
+    """ Compiles every supported action of every API, once """
+    table: Dict[Tuple[str, str], Dispatch] = {}
+    for api, spec in api_to_function.items():
+        for action, action_spec in spec['supported_actions'].items():
+            table[(api, action)] = Dispatch(
+                method=action_spec['method'],
+                is_async=spec['is_async'],
+                endpoint=action_spec.get('endpoint', action_to_endpoint.get(action, '*')),
+                required_arguments=frozenset(action_spec['arguments']),
+                map_arguments=map_arguments(action_spec['arguments']),
+            )
+    return table
 
 
-async def run_task(task: Dict[str, Any]) -> None:
-    apis = task['Platforms'].split(',')
-    for api in apis:
-        if api not in api_to_function:
-            log.error(f'The function keys were: {api_to_function.keys()}')
-            log.error(f'{api} is not a valid api.')
-            continue
+# (api, action) -> Dispatch
+dispatch_table = compile_dispatch_table()
 
-        if api_to_instance[api] is None:
-            log.error(f'The API "{api}" does not have all necessary config files!')
-            continue
 
-        supported_actions = api_to_function[api]['supported_actions'].keys()
-        action = task['Action']
-        if action not in supported_actions:
-            log.error(f'{action} is not a valid action.')
-            continue
+async def get_adapter(api: str) -> Optional[Any]:
+    """ Returns the adapter for an API. The first use builds it on the dispatch
+    thread pool, since logging in blocks
+    """
+    if api_to_instance.is_built(api):
+        return api_to_instance.get(api)
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(dispatch_executor(), api_to_instance.get, api)
 
-        given_arguments = get_existing_arguments(task)
-        if not has_required_arguments(api=api, action=task['Action'], arguments=given_arguments):
-            log.error(f'Provided arguments are not sufficient for API={api}.')
-            continue
 
-        command = create_command(api, task, given_arguments)
+class DispatchError(NamedTuple):
+    """ Why a task failed on a platform. Only retryable errors are worth trying again,
+    a task with an invalid action or missing arguments fails the same way every time.
+    in_doubt means the call may have posted anyway, e.g. its worker process died during it;
+    such an error is never retryable, and the journal keeps the call unfinished, see journal
+    """
+    message: str
+    retryable: bool
+    in_doubt: bool = False
+
 
-        if api_to_function[api]['is_async'] is True:
-            # command = f'loop.run_until_complete({command})'
-            command = f'await {command}'
+def dispatch_error(message: str, retryable: bool) -> DispatchError:
+    log.error(message)
+    return DispatchError(message, retryable)
 
-        print(f'Command to be executed: {command}')
 
-        # Run the generated string command directly as python code
-        eval(command)  # pylint: disable=W0123
+# Platforms dispatched by a worker process instead of this one, see process_pool.ProcessDispatcher:
+# api -> coroutine function that runs a task on that platform in the worker
+platform_workers: Dict[str, Callable[[str, Dict[str, Any]], Awaitable[Optional[DispatchError]]]] = {}
+
+
+async def run_in_worker(api: str, task: Dict[str, Any]) -> Optional[DispatchError]:
+    """ Hands a task to its platform's worker process, which waits for the rate limit
+    and bounds its own concurrency. Lag is measured up to the hand-over
+    """
+    if task.get('CustomDate') is not None:
+        metrics.schedule_lag.observe(max(clock.now() - task['CustomDate'], 0), api)
+
+    start = time.perf_counter()
+    error = await platform_workers[api](api, task)
+    outcome = 'ok' if error is None else 'error'
+    metrics.platform_call.observe(time.perf_counter() - start, api, outcome)
+    metrics.dispatches.inc(api, outcome)
+    if error is not None:
+        log.error(error.message)
+    return error
+
+
+async def run_platform(api: str, task: Dict[str, Any], semaphore: asyncio.Semaphore) -> Optional[DispatchError]:
+    """ Runs a task on one platform, returning None if it succeeded or why it failed.
+    When the adapter returns the ID of the new post, it is added to the task's 'PostIDs'.
+    Async APIs run on the event loop, synchronous ones on the dispatch thread pool.
+    The semaphore bounds how many platform calls are in flight at once
+    """
+    action = task['Action']
+    dispatch = dispatch_table.get((api, action))
+    if dispatch is None:
+        metrics.dispatches.inc(api, 'invalid')
+        if api not in api_to_function:
+            log.error(f'The function keys were: {api_to_function.keys()}')
+            return dispatch_error(f'{api} is not a valid api.', retryable=False)
+        return dispatch_error(f'{action} is not a valid action.', retryable=False)
+
+    if not dispatch.required_arguments <= get_existing_arguments(task):
+        metrics.dispatches.inc(api, 'invalid')
+        return dispatch_error(f'Provided arguments are not sufficient for API={api}.', retryable=False)
+
+    if api in platform_workers:
+        return await run_in_worker(api, task)
+
+    adapter = await get_adapter(api)
+    if adapter is None:
+        # The registry retries a failed build, e.g. after a network outage, on next use
+        metrics.dispatches.inc(api, 'unavailable')
+        return dispatch_error(f'The API "{api}" is not available.', retryable=True)
+
+    function = getattr(adapter, dispatch.method, None)
+    if function is None:
+        metrics.dispatches.inc(api, 'invalid')
+        return dispatch_error(f'{api} has no method {dispatch.method} for {action}.', retryable=False)
+
+    arguments = dispatch.map_arguments(task)
+    log.debug(f'Running {action} on {api} with {arguments}')
+
+    # Take the platform's token before a dispatch slot, so a call waiting for a throttled
+    # platform does not tie up a slot or a thread that other platforms could use
+    await limiter.acquire_async(api, dispatch.endpoint)
+
+    async with semaphore:
+        # Lag counts every wait before the call: the scan, retries, rate limits and free slots
+        if task.get('CustomDate') is not None:
+            metrics.schedule_lag.observe(max(clock.now() - task['CustomDate'], 0), api)
+
+        start = time.perf_counter()
+        error: Optional[DispatchError] = None
+        outcome = 'ok'
+        try:
+            # The adapter's own rate_limited wrapper uses the token taken above
+            if dispatch.is_async:
+                result = await limiter.call_reserved_async(api, dispatch.endpoint, function, **arguments)
+            else:
+                loop = asyncio.get_event_loop()
+                result = await loop.run_in_executor(
+                    dispatch_executor(), partial(limiter.call_reserved, api, dispatch.endpoint, function, **arguments),
+                )
+            if result is False:
+                outcome = 'failed'
+                error = dispatch_error(f'{api} reported that {action} failed.', retryable=True)
+            elif isinstance(result, str) and result:
+                task.setdefault('PostIDs', {})[api] = result
+        except Exception as e:
+            outcome = 'error'
+            error = dispatch_error(f'{api} failed to run {action}: {e}', retryable=True)
+
+        metrics.platform_call.observe(time.perf_counter() - start, api, outcome)
+        metrics.dispatches.inc(api, outcome)
+
+    return error
+
+
+async def run_task(task: Dict[str, Any], semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, DispatchError]:
+    """ Runs a task on all of its platforms at once: its Platforms, which the Reader fills in
+    from the JobPlatform targets it claimed.
+    Returns the platforms that failed to run it, with why; empty if all succeeded
+    """
+    semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+    apis = task['Platforms'].split(',')
+    errors = await asyncio.gather(*[run_platform(api, task, semaphore) for api in apis])
+    return {api: error for api, error in zip(apis, errors) if error is not None}
 
 
-async def process_scheduler_events(tasks: List[Dict[str, Any]]) -> None:
+async def process_scheduler_events(
+        tasks: List[Dict[str, Any]],
+        semaphore: Optional[asyncio.Semaphore] = None,
+) -> List[Dict[str, DispatchError]]:
+    """ Runs all tasks at once, returning the failed platforms of each one.
+    Takes about as long as the slowest platform call, rather than the sum of them.
+    The semaphore bounds the platform calls in flight, max_concurrency of them if there is none
+    """
     print('received task:')
     print(tasks)
-    for task in tasks:
-        await run_task(task)
+    semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+    results: List[Dict[str, DispatchError]] = await asyncio.gather(*[run_task(task, semaphore) for task in tasks])
+    return results
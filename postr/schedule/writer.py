@@ -1,62 +1,312 @@
-from datetime import datetime as dt
-import os
+from contextlib import contextmanager
+import itertools
 import sqlite3
+import threading
 import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from postr import clock
+from postr.schedule import cron
+from postr.schedule import job_platforms
+from postr.schedule import notify
+from postr.schedule import retry
+from postr.schedule.database import DB_PATH
+from postr.schedule.database import get_pool
+from postr.schedule.recurrence import first_run
+
+
+# Most jobs create_jobs inserts per executemany call, so a huge campaign is never held in memory at once
+INSERT_CHUNK_SIZE = 10_000
+
+
+class JobSpec(NamedTuple):
+    """ A one-time job for Writer.create_jobs: a Job and the date to run it on """
+    date: int
+    comment: str
+    media_path: str
+    optional_text: str
+    platforms: str
+    action: str
+    campaign: Optional[str] = None
+    person_id: Optional[int] = None
+
+
+def next_id(cursor: sqlite3.Cursor, table: str) -> int:
+    """ Returns the ID the next row inserted into an AUTOINCREMENT table gets.
+        Rows inserted in the same write transaction get consecutive IDs from there """
+    cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+    row = cursor.fetchone()
+    return (row[0] if row else 0) + 1
 
 
 class Writer():
     """
     Inserts rows into the database tables regarding scheduling
-    operations
+    operations.
+
+    The Writer can be shared by threads. Single-row writes are group committed:
+    a write joins the open transaction and returns once it is committed, and one
+    commit covers every write that other threads made meanwhile, so concurrent
+    writers share fsyncs instead of paying one each.
     """
 
-    def __init__(self) -> None:
-        file_path: str = os.path.join('postr', 'schedule', 'master_schedule.sqlite')
-        self.conn = sqlite3.connect(file_path, check_same_thread=False)
+    def __init__(self, file_path: str = DB_PATH) -> None:
+        # Writes go through a connection of their own, shared by the threads using this Writer
+        # so that their writes can share commits. Reads use the calling thread's connection
+        self.pool = get_pool(file_path)
+        self.conn = self.pool.connect()
         self.cursor = self.conn.cursor()
 
+        # lock guards the write connection. commit_lock is held by the thread committing a batch,
+        # and is always taken before lock
+        self.lock = threading.Lock()
+        self.commit_lock = threading.Lock()
+        # Writes join batch open_batch; every batch up to committed_batch has been committed
+        # or, if it is in failed_batches, rolled back
+        self.open_batch = 1
+        self.committed_batch = 0
+        self.failed_batches: Dict[int, BaseException] = {}
+
+        # Called after a new scheduled job is committed, e.g. Reader.notify.
+        # Readers in other processes are woken through their sockets, see notify
+        self.listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """ Registers a callback to run whenever a scheduled job is committed """
+        self.listeners.append(listener)
+
+    def notify_listeners(self) -> None:
+        """ Tells every listener, and every Reader in another process, that the schedule has changed """
+        for listener in self.listeners:
+            listener()
+        notify.notify(self.pool.path)
+
     def cleanup(self) -> None:
-        """ Closes the database connection"""
-        self.conn.close()
+        """ Closes the database connections"""
+        with self.lock:
+            self.pool.release(self.conn)
+        self.pool.release()
+
+    def _commit_batch(self) -> None:
+        """ Commits the open batch of writes. The caller holds commit_lock and lock """
+        batch = self.open_batch
+        self.open_batch += 1
+        try:
+            self.conn.commit()
+        except BaseException as e:
+            self.conn.rollback()
+            self.failed_batches[batch] = e
+            raise
+        finally:
+            self.committed_batch = batch
+
+    def _write(
+            self,
+            sql: str,
+            parameters: Sequence[Any],
+            then: Optional[Callable[[sqlite3.Cursor, int], None]] = None,
+    ) -> str:
+        """ Runs a single-row write in the open batch and returns the row's ID once the batch
+            is committed. The first writer to get commit_lock commits for everyone waiting.
+            then(cursor, row ID) runs right after the write, in the same batch. If either fails,
+            both are undone and the rest of the batch is still committed """
+        with self.lock:
+            if not self.conn.in_transaction:
+                self.conn.execute('BEGIN')
+            # A savepoint, so a failed write leaves nothing behind for the batch to commit
+            self.conn.execute('SAVEPOINT write')
+            try:
+                cursor = self.conn.execute(sql, parameters)
+                row_id = str(cursor.lastrowid)
+                if then is not None:
+                    then(cursor, int(row_id))
+            except BaseException:
+                self.conn.execute('ROLLBACK TO write')
+                self.conn.execute('RELEASE write')
+                raise
+            self.conn.execute('RELEASE write')
+            batch = self.open_batch
+
+        with self.commit_lock:
+            if batch > self.committed_batch:
+                with self.lock:
+                    self._commit_batch()
+            elif batch in self.failed_batches:
+                raise self.failed_batches[batch]
+
+        return row_id
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        """ Runs a block of writes in its own write transaction, committed when the block ends """
+        with self.commit_lock, self.lock:
+            # Single-row writes already made go first, in their own batch
+            self._commit_batch()
+            self.cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.cursor
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
 
     @classmethod
     def now(cls) -> int:
         """ Returns the current time """
-        return int(dt.now().timestamp())
+        return int(clock.now())
 
     def create_person(self, first: str, last: str, social: str) -> str:
         """Inserts a person/user into the database Person table; generates a unique ID """
-        self.cursor.execute(
+        # return the autoincrement ID
+        return self._write(
             """INSERT INTO Person(FirstName, LastName, SocialMedia)
                     VALUES(?, ?, ?)""", (first, last, social),
         )
-        self.conn.commit()
-
-        # return the autoincrement ID
-        return str(self.cursor.lastrowid)
 
     def create_job(
         self, comment: str, media_path: str,
         optional_text: str, platforms: str, action: str,
+        campaign: Optional[str] = None, person_id: Optional[int] = None,
     ) -> str:
         """Creates a scheduled job/task for media operations.
-           comment and media path can be null """
-        self.cursor.execute(
-            """INSERT INTO Job(Comment, MediaPath, OptionalText, Platforms, Action)
-                    VALUES(?, ?, ?, ?, ?)""", (comment, media_path, optional_text, platforms, action),
-        )
-        self.conn.commit()
-
+           comment and media path can be null. campaign and person_id group jobs to retract together """
         # return the autoincrement ID
-        return str(self.cursor.lastrowid)
+        return self._write(
+            """INSERT INTO Job(Comment, MediaPath, OptionalText, Platforms, Action, Campaign, Person_ID)
+                    VALUES(?, ?, ?, ?, ?, ?, ?)""",
+            (comment, media_path, optional_text, platforms, action, campaign, person_id),
+        )
 
     def create_custom_job(self, date: int, job_id: str) -> None:
         """Creates a custom job/task, that is, a one-time job on a specific date """
-        self.cursor.execute(
+        self._write(
             """INSERT INTO CustomJob(CustomDate, Job_ID)
                     VALUES(?, ?)""", (date, job_id),
+            then=lambda cursor, custom_job_id: job_platforms.add(cursor, custom_job_id, custom_job_id),
         )
-        self.conn.commit()
+        self.notify_listeners()
+
+    def create_jobs(self, specs: Iterable[JobSpec]) -> List[Tuple[str, str]]:
+        """Creates many one-time jobs at once, e.g. a whole campaign, in a single transaction.
+           Returns the (JobID, CustomJobID) of each job, in the order of specs """
+        ids: List[Tuple[str, str]] = []
+        spec_iterator = iter(specs)
+        with self.transaction() as cursor:
+            while True:
+                chunk = list(itertools.islice(spec_iterator, INSERT_CHUNK_SIZE))
+                if not chunk:
+                    break
+
+                first_job_id = next_id(cursor, 'Job')
+                cursor.executemany(
+                    """INSERT INTO Job(Comment, MediaPath, OptionalText, Platforms, Action, Campaign, Person_ID)
+                            VALUES(?, ?, ?, ?, ?, ?, ?)""",
+                    # The Job columns are every field of the spec but its date
+                    (spec[1:] for spec in chunk),
+                )
+                job_ids = range(first_job_id, first_job_id + len(chunk))
+
+                first_custom_job_id = next_id(cursor, 'CustomJob')
+                cursor.executemany(
+                    """INSERT INTO CustomJob(CustomDate, Job_ID)
+                            VALUES(?, ?)""",
+                    ((spec.date, job_id) for spec, job_id in zip(chunk, job_ids)),
+                )
+                custom_job_ids = range(first_custom_job_id, first_custom_job_id + len(chunk))
+                job_platforms.add(cursor, custom_job_ids[0], custom_job_ids[-1])
+
+                ids.extend(zip(map(str, job_ids), map(str, custom_job_ids)))
+
+        if ids:
+            self.notify_listeners()
+        return ids
+
+    def create_daily_job(
+            self,
+            start_time: int,
+            job_id: str,
+            frequency: int = 1,
+            interval_in_minutes: int = 0,
+            end_time: Optional[int] = None,
+    ) -> str:
+        """Creates a daily job/task, run at start_time and then every interval_in_minutes
+           minutes, or every frequency days when no interval is given, until end_time """
+        daily_job_id = self._write(
+            """INSERT INTO DailyJob(Frequency, IntervalInMinutes, StartTime, EndTime, Job_ID, NextRunTime)
+                    VALUES(?, ?, ?, ?, ?, ?)""",
+            (frequency, interval_in_minutes, start_time, end_time, job_id, first_run(start_time, end_time)),
+        )
+        self.notify_listeners()
+
+        # return the autoincrement ID
+        return daily_job_id
+
+    def create_monthly_job(
+            self,
+            start_time: int,
+            job_id: str,
+            frequency: int = 1,
+            interval_in_days: int = 0,
+            end_time: Optional[int] = None,
+    ) -> str:
+        """Creates a monthly job/task, run at start_time and then every interval_in_days
+           days, or every frequency months when no interval is given, until end_time """
+        monthly_job_id = self._write(
+            """INSERT INTO MonthlyJob(Frequency, IntervalInDays, StartTime, EndTime, Job_ID, NextRunTime)
+                    VALUES(?, ?, ?, ?, ?, ?)""",
+            (frequency, interval_in_days, start_time, end_time, job_id, first_run(start_time, end_time)),
+        )
+        self.notify_listeners()
+
+        # return the autoincrement ID
+        return monthly_job_id
+
+    def create_cron_job(
+            self,
+            expression: str,
+            job_id: str,
+            start_time: Optional[int] = None,
+            end_time: Optional[int] = None,
+    ) -> str:
+        """Creates a job/task run on a cron expression, e.g. '0,30 9 * * mon-fri', from start_time
+           (by default now) until end_time. Raises ValueError if the expression is not valid """
+        start_time = self.now() if start_time is None else start_time
+        schedule = cron.encode(cron.parse(expression))
+        cron_job_id = self._write(
+            """INSERT INTO CronJob(Expression, Schedule, StartTime, EndTime, Job_ID, NextRunTime)
+                    VALUES(?, ?, ?, ?, ?, ?)""",
+            (
+                expression, schedule, start_time, end_time, job_id,
+                cron.next_cron_run(start_time, schedule, start_time - 1, end_time),
+            ),
+        )
+        self.notify_listeners()
+
+        # return the autoincrement ID
+        return cron_job_id
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """ Returns the jobs that ran out of retries, with their last errors """
+        return retry.dead_letters(self.pool.cursor())
+
+    def replay_dead_letters(self, dead_letter_ids: Optional[Sequence[int]] = None) -> int:
+        """ Reschedules dead-lettered jobs, all of them unless dead_letter_ids is given,
+            on the platforms they failed on. Returns the number of jobs replayed """
+        with self.transaction() as cursor:
+            replayed = retry.replay_dead_letters(cursor, dead_letter_ids)
+
+        if replayed:
+            self.notify_listeners()
+        return replayed
 
     def create_bio(
             self,
@@ -71,12 +321,11 @@ class Writer():
         """ Creates a Bio for an associated user on a given platform
             Used to store all saved users' bios, and can be used to retrieve any user
             bio that meets a certain condition (e.g. contains a specific handle) """
-        self.cursor.execute(
+        self._write(
             """INSERT INTO Bio (UseDisplayNameInfo, DisplayFirstName,
-                    DisplayLastName, Age, Comment, Website, Person_ID) VALUES(?, ?, ?, ?, ?, ?)""",
+                    DisplayLastName, Age, Comment, Website, Person_ID) VALUES(?, ?, ?, ?, ?, ?, ?)""",
             (use_display, display_first, display_last, age, comment, website, person_id),
         )
-        self.conn.commit()
 
     def example(self) -> None:
         """ Inserts two times for custom jobs """
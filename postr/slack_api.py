@@ -1,4 +1,6 @@
 import time
+from typing import Any
+from typing import Dict
 from typing import List
 import urllib.request
 import shutil
@@ -9,7 +11,11 @@ from postr.config import get_api_key
 from postr.git_tools import git_root_dir
 from postr.config import update_api_key
 from postr.api_interface import ApiInterface
+from postr.api_interface import PostResult
 from postr.postr_logger import make_logger
+from postr.rate_limiter import DEFAULT_RETRY_AFTER
+from postr.rate_limiter import limiter
+from postr.rate_limiter import rate_limited
 
 default_channel = get_api_key('Slack', 'default_channel') or ''
 LOG_FOLDER = 'slack'
@@ -26,6 +32,13 @@ def download(url: str, extension: str) -> str:
         return file_name
 
 
+def observe_rate_limit(result: Dict[str, Any], endpoint: str) -> None:
+    ''' Backs off an endpoint if Slack answered a call with a ratelimited error '''
+    if not result.get('ok') and result.get('error') == 'ratelimited':
+        retry_after = result.get('headers', {}).get('Retry-After', DEFAULT_RETRY_AFTER)
+        limiter.retry_after('Slack', endpoint, float(retry_after))
+
+
 def extension_from_url(url: str) -> str:
     return url.split('.')[-1]
 
@@ -36,11 +49,16 @@ class SlackApi(ApiInterface):
         slack_token = get_api_key('Slack', 'API_TOKEN')
         self.client = SlackClient(slack_token)
 
-    def post_text(self, text: str) -> bool:
+    @rate_limited('Slack', 'post')
+    def post_text(self, text: str) -> PostResult:
+        ''' Posts a message to the default channel, returning its timestamp, which is its ID '''
         channel = default_channel
         result = self.client.api_call('chat.postMessage', channel=channel, text=text)
-        success: bool = result['ok']
-        return success
+        observe_rate_limit(result, 'post')
+        if not result['ok']:
+            return False
+        ts = result.get('ts')
+        return str(ts) if ts else True
 
     @classmethod
     def change_default_channel(cls, channel: str) -> None:
@@ -55,21 +73,27 @@ class SlackApi(ApiInterface):
         return self.post_file(url, text)
 
     #  def post_file(self, url: str, title: str, extension: str) -> bool:
+    @rate_limited('Slack', 'upload')
     def post_file(self, url: str, title: str) -> bool:
         ''' This method takes in the url for the photo the user wants
-        to post and returns the success of this action'''
+        to post and returns the success of this action. Slack deletes files by their own ID, not
+        a message timestamp, so no post ID is returned for remove_post'''
         try:
             # file_name = download(url, extension)
             file_name = url  # Changed to filename at last minute
             log.info(f'File successfully downloaded to {file_name}')
             with open(file_name, 'rb') as file_content:
-                self.client.api_call(
+                result = self.client.api_call(
                     'files.upload',
                     channels=default_channel,
                     file=file_content,
                     title=title,
                 )
-            return True
+            observe_rate_limit(result, 'upload')
+            if not result['ok']:
+                log.error(f'Failed to post file with error: {result.get("error")}')
+            success: bool = result['ok']
+            return success
         except Exception as e:
             log.error(f'Failed to post photo with error: {e}')
             return False
@@ -86,9 +110,11 @@ class SlackApi(ApiInterface):
         '''Slack does not support following a user'''
         return [text]
 
+    @rate_limited('Slack', 'delete')
     def remove_post(self, post_id: str) -> bool:
         channel = default_channel
         result = self.client.api_call('chat.delete', channel=channel, ts=post_id)
+        observe_rate_limit(result, 'delete')
         success: bool = result['ok']
         return success
 
@@ -1,10 +1,21 @@
 from urllib.parse import parse_qsl
+from typing import Any
 from typing import List
 import oauth2
 import pytumblr
 from postr.config import get_api_key
 from postr.config import update_api_key
 from postr.api_interface import ApiInterface
+from postr.api_interface import PostResult
+from postr.rate_limiter import limiter
+from postr.rate_limiter import rate_limited
+
+
+def post_id(response: Any) -> PostResult:
+    ''' Returns the ID of the post a create_* call made, or True if the response has none '''
+    if isinstance(response, dict) and 'id' in response:
+        return str(response['id'])
+    return True
 
 
 class TumblrApi(ApiInterface):
@@ -70,67 +81,83 @@ class TumblrApi(ApiInterface):
 
         return success
 
-    def post_text(self, text: str) -> bool:
-        success = True
+    @rate_limited('Tumblr', 'post')
+    def post_text(self, text: str) -> PostResult:
+        success: PostResult = True
         try:
-            self.client.create_text(self.current_blog_name, state='published', body=text)
-        except Exception:
+            success = post_id(self.client.create_text(self.current_blog_name, state='published', body=text))
+        except Exception as e:
+            limiter.observe_error('Tumblr', 'post', e)
             success = False
 
         return success
 
-    def post_video(self, url: str, text: str) -> bool:
-        success = True
+    @rate_limited('Tumblr', 'post')
+    def post_video(self, url: str, text: str) -> PostResult:
+        success: PostResult = True
         try:
             if ('https' in url) or ('http' in url) or ('.com' in url):
                 # Creating an upload from YouTube
-                self.client.create_video(self.current_blog_name, caption=text, embed=url)
+                success = post_id(self.client.create_video(self.current_blog_name, caption=text, embed=url))
             else:
                 # Creating a video post from local file
-                self.client.create_video(self.current_blog_name, caption=text, data=url)
-        except Exception:
+                success = post_id(self.client.create_video(self.current_blog_name, caption=text, data=url))
+        except Exception as e:
+            limiter.observe_error('Tumblr', 'post', e)
             success = False
 
         return success
 
-    def post_photo(self, url: str, text: str) -> bool:
+    @rate_limited('Tumblr', 'post')
+    def post_photo(self, url: str, text: str) -> PostResult:
 
-        success = True
+        success: PostResult = True
         try:
             if ('https' in url) or ('http' in url) or ('.com' in url):
                 # Creates a photo post using a source URL
-                self.client.create_photo(self.current_blog_name, state='published', caption=text, source=url)
+                success = post_id(self.client.create_photo(
+                    self.current_blog_name, state='published', caption=text, source=url,
+                ))
             else:
                 # Creates a photo post using a local filepath
-                self.client.create_photo(self.current_blog_name, state='published', caption=text, data=url)
+                success = post_id(self.client.create_photo(
+                    self.current_blog_name, state='published', caption=text, data=url,
+                ))
 
-        except Exception:
+        except Exception as e:
+            limiter.observe_error('Tumblr', 'post', e)
             success = False
 
         return success
 
+    @rate_limited('Tumblr', 'read')
     def get_user_likes(self) -> int:
         like_num = 0
         try:
             like_list = list(self.client.blog_likes(self.current_blog_name))  # get the likes on a blog
             like_num = len(like_list)
-        except Exception:
+        except Exception as e:
+            limiter.observe_error('Tumblr', 'read', e)
             like_num = -1
 
         return like_num
 
+    @rate_limited('Tumblr', 'read')
     def get_user_followers(self, text: str) -> List[str]:
         try:
             follow_list = list(self.client.followers(self.current_blog_name))
-        except Exception:
+        except Exception as e:
+            limiter.observe_error('Tumblr', 'read', e)
             follow_list = [text]
         return follow_list
 
+    @rate_limited('Tumblr', 'delete')
     def remove_post(self, post_id: str) -> bool:
         success = True
         try:
             self.client.delete_post(self.current_blog_name, post_id)
-        except Exception:
+        except Exception as e:
+            limiter.observe_error('Tumblr', 'delete', e)
             success = False
 
         return success
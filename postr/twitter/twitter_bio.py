@@ -1,4 +1,5 @@
 from tweepy.api import API
+from postr.rate_limiter import rate_limited
 
 
 class TwitterBio:
@@ -9,14 +10,17 @@ class TwitterBio:
     def __init__(self, api: API) -> None:
         self.api = api
 
+    @rate_limited('Twitter', 'profile')
     def update_name(self, new_name: str) -> None:
         """ Updates your profile name """
         self.api.update_profile(name=new_name)
 
+    @rate_limited('Twitter', 'read')
     def username(self) -> str:
         """ Gets the username of the authenticated user """
         return str(self.api.me().screen_name)
 
+    @rate_limited('Twitter', 'read')
     def bio(self) -> str:
         """ Gets the bio description of the authenticated user """
         return str(self.api.me().description)
@@ -1,5 +1,6 @@
 from tweepy.api import API
 from tweepy.models import Status
+from postr.rate_limiter import rate_limited
 
 
 class TwitterInfo():
@@ -11,10 +12,12 @@ class TwitterInfo():
         """ Holds API keys for twitter access """
         self.api = api
 
+    @rate_limited('Twitter', 'read')
     def id(self) -> int:
         """ Gets the id of the authenticated user """
         return int(self.api.me().id)
 
+    @rate_limited('Twitter', 'read')
     def last_tweet(self) -> Status:
         """ Returns the info of the authenticated user's latest tweet """
         return self.api.user_timeline(id=self.id(), count=1)[0]
@@ -23,6 +26,7 @@ class TwitterInfo():
         """ Returns the favorite count of the latest tweet """
         return self.favorites_on(self.last_tweet().id)
 
+    @rate_limited('Twitter', 'read')
     def favorites_on(self, tweet_id: int) -> int:
         """ Returns the favorite count of a specified tweet """
         return int(self.api.get_status(tweet_id).favorite_count)
@@ -31,5 +35,6 @@ class TwitterInfo():
         """ Returns the retweet count of the latest tweet """
         return self.retweets_on(self.last_tweet().id)
 
+    @rate_limited('Twitter', 'read')
     def retweets_on(self, tweet_id: int) -> int:
         """ Returns the retweet count of a specified tweet """
@@ -3,7 +3,6 @@ import datetime
 import json
 import re
 import os
-import time
 from typing import List
 
 import matplotlib
@@ -16,6 +15,9 @@ from tweepy.cursor import Cursor
 from textblob import TextBlob
 
 from .api_interface import ApiInterface
+from .api_interface import PostResult
+from .rate_limiter import limiter
+from .rate_limiter import rate_limited
 from .twitter.twitter_key import TwitterKey
 from .twitter.twitter_info import TwitterInfo
 from .twitter.twitter_bio import TwitterBio
@@ -108,12 +110,14 @@ class Twitter(ApiInterface):
         self.graphfile = os.path.join('postr', 'twitter', 'twitter_graphing.csv')
         self.blobfile = os.path.join('postr', 'twitter', 'twitter_blob.csv')
 
-    def post_text(self, text: str) -> bool:
-        """ Posts a tweet containing text """
+    @rate_limited('Twitter', 'post')
+    def post_text(self, text: str) -> PostResult:
+        """ Posts a tweet containing text, returning its ID """
         try:
-            self.api.update_status(status=text)
-            return True
+            status = self.api.update_status(status=text)
+            return str(status.id_str)
         except BaseException as e:
+            limiter.observe_error('Twitter', 'post', e)
             print(e)
             return False
 
@@ -122,38 +126,44 @@ class Twitter(ApiInterface):
         """ Not applicable """
         return False
 
-    def post_photo(self, url: str, text: str) -> bool:
-        """ Posts a tweet with text and a picture """
+    @rate_limited('Twitter', 'post')
+    def post_photo(self, url: str, text: str) -> PostResult:
+        """ Posts a tweet with text and a picture, returning its ID """
         try:
-            self.api.update_with_media(filename=url, status=text)
-            return True
+            status = self.api.update_with_media(filename=url, status=text)
+            return str(status.id_str)
         except BaseException as e:
+            limiter.observe_error('Twitter', 'post', e)
             print(e)
             return False
 
     def get_user_followers(self, text: str) -> List[str]:
         """ Gets user followers, note: this is rate limited """
-        my_followers = []
-        i = 0
-
-        # Use the cursor module for pagination
-        for follower in Cursor(self.api.followers, screen_name=text).items():
-            my_followers.append(follower.screen_name)
-            i += 1
-
-            # Simple rate limit for requests
-            if i >= 100:
-                i = 0
-                time.sleep(1)
+        my_followers: List[str] = []
+
+        # Use the cursor module for pagination, each page is one request
+        pages = Cursor(self.api.followers, screen_name=text).pages()
+        while True:
+            limiter.acquire('Twitter', 'followers')
+            try:
+                page = next(pages)
+            except StopIteration:
+                break
+            except BaseException as e:
+                limiter.observe_error('Twitter', 'followers', e)
+                raise
+            my_followers.extend(follower.screen_name for follower in page)
 
         return my_followers
 
+    @rate_limited('Twitter', 'delete')
     def remove_post(self, post_id: str) -> bool:
         """ Removes a tweet given its ID """
         try:
             self.api.destroy_status(post_id)
             return True
         except BaseException as e:
+            limiter.observe_error('Twitter', 'delete', e)
             print(e)
             return False
 
@@ -238,6 +248,7 @@ class Twitter(ApiInterface):
 
         plt.show()
 
+    @rate_limited('Twitter', 'profile')
     def update_bio(self, message: str) -> None:
         """ Sets an authenticated user's bio to a specified message """
         self.api.update_profile(description=message)
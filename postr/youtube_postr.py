@@ -5,7 +5,10 @@ from typing import List, Any, Dict
 import httplib2
 
 from postr.api_interface import ApiInterface
+from postr.api_interface import PostResult
 from postr import config
+from postr.rate_limiter import limiter
+from postr.rate_limiter import rate_limited
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
@@ -61,12 +64,13 @@ class Youtube(ApiInterface):
         # No text to be posted on YouTube
         return False
 
-    def post_video(self, url: str, text: str) -> bool:
+    def post_video(self, url: str, text: str) -> PostResult:
         ''' This method takes in the url for the video the user
-        want to post and returns the success of this action'''
-        self.upload_video(url, text, text, 22, '', 'public',)
-        return True
+        want to post and returns the ID of the video, or False if the upload failed'''
+        response = self.upload_video(url, text, text, 22, '', 'public',)
+        return str(response['id']) if response else False
 
+    @rate_limited('YouTube', 'post')
     def upload_video(
         self,
         file: str, title: str, description: str,
@@ -77,9 +81,11 @@ class Youtube(ApiInterface):
             'category': category, 'keywords': keywords, 'privacy_status': privacy_status,
         }
         try:
-            initialize_upload(self.build, args)
+            return initialize_upload(self.build, args)
         except HttpError as e:
+            limiter.observe_error('YouTube', 'post', e)
             print('An HTTP error %d occurred:\n%s' % (e.resp.status, e.content))
+            return None
 
     def post_photo(self, url: str, text: str) -> bool:
         ''' This method takes in the url for the photo the user
@@ -87,6 +93,7 @@ class Youtube(ApiInterface):
         # No photos on YouTube
         return False
 
+    @rate_limited('YouTube', 'read')
     def get_user_likes(self) -> int:
         ''' This method returns the number of likes a user has total between link and client'''
         # Returns subscriber count instead
@@ -96,6 +103,7 @@ class Youtube(ApiInterface):
             mine='true',
         )['items'][0]['statistics']['subscriberCount'])
 
+    @rate_limited('YouTube', 'read')
     def get_user_videos(self) -> List[str]:
         ''' This method returns the video ids of this user.'''
         # Returns a list of video ids where the first item is the most recently uploaded video
@@ -123,6 +131,7 @@ class Youtube(ApiInterface):
         # Not possible to get a list of subscriber names, as it is anonymous.
         return None  # type: ignore
 
+    @rate_limited('YouTube', 'delete')
     def remove_post(self, post_id: str) -> bool:
         ''' This method removes the post with the specified id
         and returns the success of this action'''
@@ -252,7 +261,7 @@ def initialize_upload(client: Any, options: dict) -> Any:
         media_body=MediaFileUpload(options['file'], chunksize=-1, resumable=True),
     )
 
-    resumable_upload(insert_request)
+    return resumable_upload(insert_request)
 
 # This method implements an exponential backoff strategy to resume a
 # failed upload.
@@ -292,3 +301,5 @@ def resumable_upload(request: Any) -> Any:
             sleep_seconds = random.random() * max_sleep
             print('Sleeping %f seconds and then retrying...' % sleep_seconds)
             time.sleep(sleep_seconds)
+
+    return response
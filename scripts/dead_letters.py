@@ -0,0 +1,26 @@
+import argparse
+from datetime import datetime as dt
+
+from postr.schedule.writer import Writer
+
+# Lists the scheduled jobs that ran out of retries, or puts them back in the schedule.
+#   python -m scripts.dead_letters              lists them
+#   python -m scripts.dead_letters --replay     replays all of them
+#   python -m scripts.dead_letters --replay 3 7 replays dead letters 3 and 7
+parser = argparse.ArgumentParser(description='Inspect and replay dead-lettered jobs')
+parser.add_argument('--replay', nargs='*', type=int, metavar='ID', help='replay these dead letters, or all of them')
+args = parser.parse_args()
+
+writer = Writer()
+if args.replay is None:
+    for letter in writer.dead_letters():
+        failed_at = dt.fromtimestamp(letter['FailedAt'])
+        print(
+            f"{letter['DeadLetterID']}: job {letter['Job_ID']} ({letter['Action']}) on {letter['Platforms']}, "
+            f"failed {failed_at} after {letter['Attempts']} attempts",
+        )
+        print(f"    {letter['LastError']}")
+else:
+    replayed = writer.replay_dead_letters(args.replay or None)
+    print(f'Replayed {replayed} dead-lettered jobs')
+writer.cleanup()
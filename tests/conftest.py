@@ -1,7 +1,10 @@
 # Holds fixtures
 # https://stackoverflow.com/questions/34466027/in-py-test-what-is-the-use-of-conftest-py-files
 # http://mcs.une.edu.au/doc/python3-pytest/html/en/fixture.html
+from typing import Iterator
 import pytest
+from postr.rate_limiter import RateLimiter
+from postr.rate_limiter import limiter
 
 
 @pytest.fixture(scope='module')
@@ -12,3 +15,14 @@ def add() -> int:
 @pytest.fixture(scope='module')
 def fbchat_test() -> int:
     return 17
+
+
+@pytest.fixture(autouse=True)
+def rate_limits() -> Iterator[RateLimiter]:
+    """ The shared rate limiter, with fresh buckets for every test, so the calls one test
+        dispatches do not throttle the next, and its default limits restored afterwards """
+    limits = dict(limiter.limits)
+    limiter.reset()
+    yield limiter
+    limiter.limits = limits
+    limiter.reset()
@@ -0,0 +1,90 @@
+import asyncio
+import importlib
+import json
+import os
+from typing import Any
+from typing import List
+from unittest.mock import patch
+import pytest
+from postr.schedule import task_processor
+from postr.schedule.job_status import DONE
+from postr.schedule.reader import Reader
+from postr.schedule.writer import Writer
+
+InstagramAPI = pytest.importorskip('InstagramAPI').InstagramAPI
+PIL_Image = pytest.importorskip('PIL.Image')
+
+# The module picks the Tk backend for its graphs, which a headless test run does not have
+with patch('matplotlib.use'):
+    instagram_postr = importlib.import_module('postr.instagram_postr')
+
+
+class FakeResponse():
+    def __init__(self, body: Any) -> None:
+        self.status_code = 200
+        self.text = json.dumps(body)
+
+
+class FakeSession():
+    """ Answers InstagramAPI's requests like Instagram does when a photo is posted """
+
+    def __init__(self) -> None:
+        self.headers: dict = {}
+        self.endpoints: List[str] = []
+
+    def post(self, url: str, **kwargs: Any) -> FakeResponse:
+        endpoint = url[len(InstagramAPI.API_URL):]
+        self.endpoints.append(endpoint)
+        if endpoint.startswith('media/configure/'):
+            return FakeResponse({'status': 'ok', 'media': {'id': '1234_5678'}})
+        return FakeResponse({'status': 'ok'})
+
+
+def instagram(session: FakeSession) -> Any:
+    """ An Instagram adapter logged in to the fake session, without the login and follower requests """
+    api = InstagramAPI('user', 'password')
+    api.s = session
+    api.isLoggedIn = True
+    api.token = 'token'
+    api.username_id = 1
+    adapter = instagram_postr.Instagram.__new__(instagram_postr.Instagram)
+    adapter.api = api
+    return adapter
+
+
+def test_post_photo_returns_the_media_id(tmpdir: str) -> None:
+    photo = os.path.join(str(tmpdir), 'photo.jpg')
+    PIL_Image.new('RGB', (8, 8)).save(photo)
+    session = FakeSession()
+
+    assert instagram(session).post_photo(photo, 'caption') == '1234_5678'
+    assert [endpoint.split('/')[0] for endpoint in session.endpoints] == ['upload', 'media', 'qe']
+
+
+def test_successful_post_is_dispatched_once(tmpdir: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    photo = os.path.join(str(tmpdir), 'photo.jpg')
+    PIL_Image.new('RGB', (8, 8)).save(photo)
+    session = FakeSession()
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Instagram', instagram(session))
+
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    job_id = writer.create_job('caption', photo, '', 'Instagram', 'post_photo')
+    writer.create_custom_job(Reader.now() - 10, job_id)
+    writer.cleanup()
+    worker = Reader(file_path=db_path, worker_id='worker')
+
+    async def scan_until_done() -> None:
+        scanning = asyncio.ensure_future(worker.scan())
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if await worker.db.query_one('SELECT Status FROM CustomJob') == DONE:
+                break
+        scanning.cancel()
+        await asyncio.gather(scanning, return_exceptions=True)
+
+    asyncio.get_event_loop().run_until_complete(scan_until_done())
+    assert worker.pool.query_one('SELECT Status FROM CustomJob') == DONE
+    assert worker.pool.query_one('SELECT PostID FROM PostReceipt') == '1234_5678'
+    worker.cleanup()
+    assert session.endpoints.count('upload/photo/') == 1
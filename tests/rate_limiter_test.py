@@ -0,0 +1,84 @@
+import asyncio
+import time
+from typing import Any
+from typing import Dict
+import pytest
+from postr.rate_limiter import RateLimiter
+from postr.rate_limiter import TokenBucket
+from postr.rate_limiter import limiter as shared_limiter
+from postr.rate_limiter import rate_limited
+
+
+class TooManyRequests(Exception):
+    pass
+
+
+@pytest.fixture
+def limiter() -> RateLimiter:
+    return RateLimiter({('Test', 'post'): (10, 2), ('Test', '*'): (100, 1)})
+
+
+def test_bucket_allows_a_burst_then_spaces_calls() -> None:
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_wait_time_does_not_take_a_token() -> None:
+    bucket = TokenBucket(rate=10, capacity=1)
+    assert bucket.wait_time() == 0
+    assert bucket.wait_time() == 0
+    bucket.reserve()
+    assert bucket.wait_time() == pytest.approx(0.1, abs=0.01)
+
+
+def test_endpoints_fall_back_to_platform_then_default(limiter: RateLimiter) -> None:
+    assert limiter.bucket('Test', 'post').capacity == 2
+    assert limiter.bucket('Test', 'delete').capacity == 1
+    assert limiter.bucket('Other', 'post').rate == 1
+    assert limiter.bucket('Test', 'post') is limiter.bucket('Test', 'post')
+
+
+def test_retry_after_header_pauses_the_endpoint(limiter: RateLimiter) -> None:
+    limiter.observe_headers('Test', 'post', {'Retry-After': '30'})
+    assert limiter.bucket('Test', 'post').wait_time() == pytest.approx(30, abs=0.1)
+    assert limiter.bucket('Test', 'delete').wait_time() == 0
+
+
+def test_remaining_header_is_trusted(limiter: RateLimiter) -> None:
+    limiter.observe_headers('Test', 'post', {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': time.time() + 60})
+    assert limiter.bucket('Test', 'post').wait_time() == pytest.approx(60, abs=1)
+
+    limiter.observe_headers('Test', 'delete', {'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '5'})
+    assert limiter.bucket('Test', 'delete').wait_time() == pytest.approx(5, abs=0.1)
+
+
+def test_decorator_backs_off_after_rate_limit_error() -> None:
+    calls: Dict[str, Any] = {'count': 0}
+
+    @rate_limited('DecoratorTest', 'post')
+    def post() -> None:
+        calls['count'] += 1
+        raise TooManyRequests()
+
+    with pytest.raises(TooManyRequests):
+        post()
+
+    assert calls['count'] == 1
+    assert shared_limiter.bucket('DecoratorTest', 'post').wait_time() > 1
+
+
+def test_reserved_call_does_not_take_a_second_token() -> None:
+    @rate_limited('ReservedTest', 'post')
+    def post() -> str:
+        return 'posted'
+
+    shared_limiter.configure('ReservedTest', 'post', 1, 1)
+    asyncio.get_event_loop().run_until_complete(shared_limiter.acquire_async('ReservedTest', 'post'))
+
+    start = time.monotonic()
+    assert shared_limiter.call_reserved('ReservedTest', 'post', post) == 'posted'
+    assert time.monotonic() - start < 0.1
+    assert shared_limiter.bucket('ReservedTest', 'post').wait_time() == pytest.approx(1, abs=0.05)
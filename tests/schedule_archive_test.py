@@ -0,0 +1,47 @@
+import os
+from datetime import datetime as dt
+from postr.schedule import archive
+from postr.schedule.job_status import DONE
+from postr.schedule.writer import Writer
+
+NOW = int(dt(2019, 6, 15, 12).timestamp())
+JANUARY = int(dt(2019, 1, 10, 9).timestamp())
+FEBRUARY = int(dt(2019, 2, 10, 9).timestamp())
+
+
+def test_finished_jobs_move_to_monthly_archives(tmpdir: str) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    finished = writer.create_job('finished', '', '', 'Twitter', 'post_text')
+    ongoing = writer.create_job('ongoing', '', '', 'Twitter', 'post_text')
+    for date, job_id in [(JANUARY, finished), (FEBRUARY, finished), (FEBRUARY, ongoing), (NOW - 60, ongoing)]:
+        writer.create_custom_job(date, job_id)
+    writer.create_custom_job(NOW + 3600, ongoing)
+    writer.pool.execute('UPDATE CustomJob SET Status = ? WHERE CustomDate < ?', (DONE, NOW))
+
+    moved = []
+    while True:
+        count = archive.archive_jobs(writer.pool, NOW, batch_size=2)
+        if not count:
+            break
+        moved.append(count)
+
+    assert moved == [2, 1]
+    assert archive.archive_paths(db_path) == [
+        archive.archive_path(db_path, '2019-01'), archive.archive_path(db_path, '2019-02'),
+    ]
+    assert archive.archive_paths(db_path, since=FEBRUARY) == [archive.archive_path(db_path, '2019-02')]
+    # Only the recent and the upcoming occurrences stay, and the Job nothing refers to any more is gone
+    assert writer.pool.query('SELECT CustomDate FROM CustomJob ORDER BY CustomDate') == [
+        {'CustomDate': NOW - 60}, {'CustomDate': NOW + 3600},
+    ]
+    assert writer.pool.query('SELECT Comment FROM Job') == [{'Comment': 'ongoing'}]
+
+    history = archive.history(db_path, JANUARY, NOW)
+    assert [(row['CustomDate'], row['Comment']) for row in history] == [
+        (JANUARY, 'finished'), (FEBRUARY, 'finished'), (FEBRUARY, 'ongoing'), (NOW - 60, 'ongoing'),
+    ]
+    assert [row['CustomDate'] for row in archive.history(db_path, JANUARY, NOW, job_id=int(ongoing))] == [
+        FEBRUARY, NOW - 60,
+    ]
+    writer.cleanup()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+from typing import Awaitable
+from typing import Generator
+import pytest
+from postr.schedule.async_db import AsyncDatabase
+from postr.schedule.database import ConnectionPool
+
+
+@pytest.fixture
+def db(tmpdir: str) -> Generator:
+    pool = ConnectionPool(os.path.join(str(tmpdir), 'schedule.sqlite'))
+    db = AsyncDatabase(pool)
+    yield db
+    db.close()
+    pool.close()
+
+
+def run(coroutine: Awaitable) -> Any:
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def test_queries_run_on_the_database_thread(db: AsyncDatabase) -> None:
+    thread_name = run(db.run(lambda: threading.current_thread().name))
+    assert thread_name != threading.current_thread().name
+
+    run(db.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('text', 'Twitter', 'post_text')"))
+    assert run(db.query('SELECT Comment FROM Job')) == [{'Comment': 'text'}]
+    assert run(db.query_one('SELECT COUNT(*) FROM Job')) == 1
+
+
+def test_transaction_commits_or_rolls_back(db: AsyncDatabase) -> None:
+    def insert(cursor: sqlite3.Cursor) -> int:
+        cursor.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('text', 'Twitter', 'post_text')")
+        return 1
+
+    def fail(cursor: sqlite3.Cursor) -> None:
+        insert(cursor)
+        raise ValueError()
+
+    assert run(db.transaction(insert)) == 1
+    with pytest.raises(ValueError):
+        run(db.transaction(fail))
+    assert run(db.query_one('SELECT COUNT(*) FROM Job')) == 1
+
+
+def test_slow_database_work_does_not_block_the_loop(db: AsyncDatabase) -> None:
+    ticks = []
+
+    async def ticker() -> None:
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def both() -> None:
+        await asyncio.gather(db.run(time.sleep, 0.2), ticker())
+
+    start = time.monotonic()
+    run(both())
+    assert len(ticks) == 5
+    assert ticks[-1] - start < 0.15
@@ -0,0 +1,64 @@
+import os
+from datetime import datetime as dt
+import pytest
+from postr.schedule import cron
+from postr.schedule.recurrence import materialize_due_jobs
+from postr.schedule.writer import Writer
+
+# A Friday
+FRIDAY = int(dt(2019, 3, 15, 17, 45).timestamp())
+
+
+def fires(expression: str, after: int, count: int = 3) -> list:
+    schedule = cron.encode(cron.parse(expression))
+    times = []
+    for _ in range(count):
+        next_run = cron.next_cron_run(0, schedule, after)
+        assert next_run is not None
+        times.append(dt.fromtimestamp(next_run))
+        after = next_run
+    return times
+
+
+def test_weekdays_at_two_times() -> None:
+    assert fires('0,30 9 * * mon-fri', FRIDAY) == [
+        dt(2019, 3, 18, 9, 0), dt(2019, 3, 18, 9, 30), dt(2019, 3, 19, 9, 0),
+    ]
+    assert fires('30 17 * * 1-5', FRIDAY - 30 * 60, count=2) == [dt(2019, 3, 15, 17, 30), dt(2019, 3, 18, 17, 30)]
+
+
+def test_steps_names_and_aliases() -> None:
+    assert fires('*/20 18 * * *', FRIDAY) == [dt(2019, 3, 15, 18, 0), dt(2019, 3, 15, 18, 20), dt(2019, 3, 15, 18, 40)]
+    assert fires('0 0 1 jan,jul *', FRIDAY, count=2) == [dt(2019, 7, 1), dt(2020, 1, 1)]
+    assert fires('@weekly', FRIDAY, count=1) == fires('0 0 * * 7', FRIDAY, count=1) == [dt(2019, 3, 17)]
+
+
+def test_either_day_matches_when_both_are_restricted() -> None:
+    # The 20th, and every Monday
+    assert fires('0 12 20 * mon', FRIDAY) == [dt(2019, 3, 18, 12), dt(2019, 3, 20, 12), dt(2019, 3, 25, 12)]
+
+
+def test_schedule_that_never_fires_again() -> None:
+    schedule = cron.encode(cron.parse('0 0 30 2 *'))
+    assert cron.next_cron_run(0, schedule, FRIDAY) is None
+    assert fires('0 0 29 2 *', FRIDAY, count=1) == [dt(2020, 2, 29)]
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '0 9 * * funday', '5-1 * * * *', '*/0 * * * *'])
+def test_invalid_expression(expression: str) -> None:
+    with pytest.raises(ValueError):
+        cron.parse(expression)
+
+
+def test_cron_job_is_materialized_and_advanced(tmpdir: str) -> None:
+    writer = Writer(os.path.join(str(tmpdir), 'schedule.sqlite'))
+    job_id = writer.create_job('standup', '', '', 'Slack', 'post_text')
+    writer.create_cron_job('0,30 9 * * mon-fri', job_id, start_time=FRIDAY)
+    first = int(dt(2019, 3, 18, 9).timestamp())
+    assert writer.pool.query('SELECT NextRunTime FROM CronJob') == [{'NextRunTime': first}]
+
+    with writer.transaction() as cursor:
+        assert materialize_due_jobs(cursor, first + 60, limit=10) == 1
+    assert writer.pool.query('SELECT CustomDate FROM CustomJob') == [{'CustomDate': first}]
+    assert writer.pool.query('SELECT NextRunTime FROM CronJob') == [{'NextRunTime': first + 30 * 60}]
+    writer.cleanup()
@@ -0,0 +1,73 @@
+import os
+import threading
+from typing import Generator
+import pytest
+from postr.schedule.database import ConnectionPool
+from postr.schedule.database import connect
+from postr.schedule.migrations import LATEST_VERSION
+
+
+@pytest.fixture
+def pool(tmpdir: str) -> Generator:
+    pool = ConnectionPool(os.path.join(str(tmpdir), 'schedule.sqlite'))
+    yield pool
+    pool.close()
+
+
+def test_connections_use_wal(pool: ConnectionPool) -> None:
+    assert pool.query_one('PRAGMA journal_mode') == 'wal'
+    assert pool.query_one('PRAGMA user_version') == LATEST_VERSION
+    assert connect(pool.path).execute('PRAGMA synchronous').fetchone()[0] == 1
+
+
+def test_each_thread_has_its_own_connection(pool: ConnectionPool) -> None:
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(pool.connection()))
+    thread.start()
+    thread.join()
+
+    assert pool.connection() is pool.connection()
+    assert connections[0] is not pool.connection()
+
+
+def test_acquire_reuses_idle_connections(pool: ConnectionPool) -> None:
+    with pool.acquire() as first:
+        with pool.acquire() as second:
+            assert first is not second
+    with pool.acquire() as third:
+        assert third in (first, second)
+
+
+def test_reads_do_not_wait_for_a_writer(pool: ConnectionPool) -> None:
+    pool.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('old', 'Twitter', 'post_text')")
+
+    with pool.acquire() as conn:
+        with pool.transaction(conn) as cursor:
+            cursor.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('new', 'Twitter', 'post_text')")
+            # Another connection reads the last committed state while the write is open
+            assert [row['Comment'] for row in pool.query('SELECT Comment FROM Job')] == ['old']
+
+    assert pool.query_one('SELECT COUNT(*) FROM Job') == 2
+
+
+def test_concurrent_writers_do_not_fail(pool: ConnectionPool) -> None:
+    errors = []
+
+    def write() -> None:
+        try:
+            for _ in range(50):
+                with pool.transaction() as cursor:
+                    cursor.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('a', 'Twitter', 'post_text')")
+        except Exception as e:  # pylint: disable=broad-except
+            errors.append(e)
+        finally:
+            pool.release()
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert pool.query_one('SELECT COUNT(*) FROM Job') == 400
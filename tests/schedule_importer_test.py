@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+import os
+from typing import Generator
+import pytest
+from postr.schedule import importer
+from postr.schedule.writer import JobSpec
+from postr.schedule.writer import Writer
+
+FUTURE = Writer.now() + 86400
+
+
+@pytest.fixture
+def writer(tmpdir: str) -> Generator:
+    writer = Writer(os.path.join(str(tmpdir), 'schedule.sqlite'))
+    yield writer
+    writer.cleanup()
+
+
+def scheduled(writer: Writer) -> list:
+    return writer.cursor.execute(
+        """
+        SELECT CustomDate, Comment, Platforms, Action FROM CustomJob
+        JOIN Job ON Job.JobID = CustomJob.Job_ID ORDER BY CustomJobID
+        """,
+    ).fetchall()
+
+
+def test_validate_rows() -> None:
+    row = {'date': str(FUTURE), 'platforms': 'Twitter, Slack', 'action': 'post_text', 'comment': 'hi'}
+    assert importer.validate(row, FUTURE) == JobSpec(FUTURE, 'hi', '', '', 'Twitter,Slack', 'post_text')
+    assert importer.parse_date('2019-05-01 09:00') == importer.parse_date('2019-05-01T09:00:00')
+
+    rejected = {
+        'Missing date': dict(row, date=''),
+        'Invalid date "tomorrow"': dict(row, date='tomorrow'),
+        'Unknown platform "MySpace"': dict(row, platforms='Twitter,MySpace'),
+        'Twitter does not support fly': dict(row, action='fly'),
+        'post_text on Twitter needs Comment': dict(row, comment=''),
+    }
+    for reason, bad_row in rejected.items():
+        with pytest.raises(importer.RejectedRow, match=reason):
+            importer.validate(bad_row, FUTURE)
+
+    with pytest.raises(importer.RejectedRow, match='in the past'):
+        importer.validate(row, FUTURE + 1)
+    assert importer.validate(row, FUTURE + 1, allow_past=True).date == FUTURE
+
+
+def test_import_csv_in_batches(writer: Writer, monkeypatch: pytest.MonkeyPatch) -> None:
+    batches: list = []
+    create_jobs = writer.create_jobs
+
+    def record_batch(specs: list) -> list:
+        batches.append(len(specs))
+        return create_jobs(specs)
+
+    monkeypatch.setattr(writer, 'create_jobs', record_batch)
+
+    file = io.StringIO()
+    rows = csv.writer(file)
+    rows.writerow(['date', 'platforms', 'action', 'comment', 'media_path', 'optional_text'])
+    for i in range(7):
+        rows.writerow([FUTURE + i, 'Twitter', 'post_text', f'post {i}', '', ''])
+    rows.writerow([FUTURE, 'Twitter', 'post_photo', 'no photo', '', ''])
+    file.seek(0)
+
+    rejects = io.StringIO()
+    result = importer.import_jobs(file, writer, rejects=rejects, batch_size=3)
+
+    assert result == importer.ImportResult(imported=7, rejected=1)
+    assert batches == [3, 3, 1]
+    assert scheduled(writer) == [(FUTURE + i, f'post {i}', 'Twitter', 'post_text') for i in range(7)]
+    report = list(csv.reader(io.StringIO(rejects.getvalue())))
+    assert report[1][:2] == ['9', 'post_photo on Twitter needs MediaPath']
+
+
+def test_import_jsonl(writer: Writer) -> None:
+    lines = [
+        json.dumps({'date': FUTURE, 'platforms': 'Slack', 'action': 'post_text', 'comment': 'hello'}),
+        '',
+        '{not json',
+        json.dumps(['a', 'list']),
+    ]
+    rejects = io.StringIO()
+    result = importer.import_jobs(io.StringIO('\n'.join(lines)), writer, 'jsonl', rejects)
+
+    assert result == importer.ImportResult(imported=1, rejected=2)
+    assert scheduled(writer) == [(FUTURE, 'hello', 'Slack', 'post_text')]
+    report = list(csv.reader(io.StringIO(rejects.getvalue())))
+    assert [row[0] for row in report[1:]] == ['3', '4']
+    assert report[1][1].startswith('Invalid JSON')
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sqlite3
+import pytest
+from postr.schedule import job_platforms
+from postr.schedule import task_processor
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.job_status import DONE
+from postr.schedule.job_status import PENDING
+from postr.schedule.job_status import RETRYING
+from postr.schedule.migrations import migrate
+from postr.schedule.reader import Reader
+from postr.schedule.writer import Writer
+
+NOW = 1_600_000_000
+
+
+def test_migration_fills_in_existing_jobs() -> None:
+    conn = sqlite3.connect(':memory:')
+    migrate(conn, target_version=9)
+    conn.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('text', 'Twitter,Slack', 'post_text')")
+    conn.execute('INSERT INTO CustomJob(CustomDate, Job_ID, Status) VALUES(?, 1, ?)', (NOW, PENDING))
+    conn.execute(
+        'INSERT INTO CustomJob(CustomDate, Job_ID, Status, RetryPlatforms, RetryAt) VALUES(?, 1, ?, ?, ?)',
+        (NOW, RETRYING, 'Slack', NOW + 60),
+    )
+    migrate(conn)
+
+    assert conn.execute(
+        'SELECT CustomJob_ID, Platform, DueTime, Status FROM JobPlatform ORDER BY CustomJob_ID, Platform',
+    ).fetchall() == [
+        (1, 'Slack', NOW, PENDING), (1, 'Twitter', NOW, PENDING),
+        (2, 'Slack', NOW + 60, RETRYING), (2, 'Twitter', NOW, DONE),
+    ]
+    conn.close()
+
+
+def test_platform_status_follows_dispatch(tmpdir: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    class FakeTwitter():
+        def post_text(self, text: str) -> bool:
+            return True
+
+    class FakeSlack():
+        def post_text(self, text: str) -> bool:
+            raise ConnectionError('Slack is down')
+
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Twitter', FakeTwitter())
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Slack', FakeSlack())
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    now = Reader.now()
+    job_id = writer.create_job('text', '', '', 'Twitter,Slack', 'post_text')
+    writer.create_custom_job(now - 10, job_id)
+    writer.create_custom_job(now + 600, job_id)
+    writer.cleanup()
+
+    reader = Reader(file_path=db_path, worker_id='worker')
+    assert [row['DueTime'] for row in job_platforms.queued(reader.cursor, 'Twitter', now - 60, now + 3600)] == [
+        now - 10, now + 600,
+    ]
+
+    tasks = reader.claim_due_jobs()
+    assert reader.pool.query('SELECT Status FROM JobPlatform WHERE CustomJob_ID = 1') == [
+        {'Status': CLAIMED}, {'Status': CLAIMED},
+    ]
+    asyncio.get_event_loop().run_until_complete(reader.dispatch(tasks, asyncio.Semaphore(1)))
+
+    statuses = reader.pool.query('SELECT Platform, Status, Error FROM JobPlatform WHERE CustomJob_ID = 1')
+    assert {row['Platform']: row['Status'] for row in statuses} == {'Twitter': DONE, 'Slack': RETRYING}
+    assert [row['DueTime'] for row in job_platforms.queued(reader.cursor, 'Twitter', now - 60, now + 3600)] == [
+        now + 600,
+    ]
+    retry_at = reader.pool.query_one('SELECT RetryAt FROM CustomJob WHERE CustomJobID = 1')
+    assert [
+        (row['CustomJob_ID'], row['DueTime'], row['Status'])
+        for row in job_platforms.queued(reader.cursor, 'Slack', now, now + 3600)
+    ] == [(1, retry_at, RETRYING), (2, now + 600, PENDING)]
+    reader.cleanup()
+
+
+def test_each_target_is_dispatched_at_its_own_due_time(tmpdir: str) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    now = Reader.now()
+    job_id = writer.create_job('text', '', '', 'Twitter,Slack', 'post_text')
+    writer.create_custom_job(now - 10, job_id)
+    writer.pool.execute("UPDATE JobPlatform SET DueTime = ? WHERE Platform = 'Slack'", (now + 600,))
+    # Only the targets decide where an occurrence goes
+    writer.pool.execute("UPDATE Job SET Platforms = 'Reddit'")
+    writer.cleanup()
+
+    reader = Reader(file_path=db_path, worker_id='worker')
+    tasks = reader.claim_due_jobs()
+    assert [task['Platforms'] for task in tasks] == ['Twitter']
+    reader.record_results(tasks, [{}])
+    assert reader.pool.query_one('SELECT Status FROM CustomJob') == PENDING
+    assert reader.next_due_time() == now + 600
+    assert reader.claim_due_jobs() == []
+
+    reader.pool.execute("UPDATE JobPlatform SET DueTime = ? WHERE Platform = 'Slack'", (now - 1,))
+    tasks = reader.claim_due_jobs()
+    assert [task['Platforms'] for task in tasks] == ['Slack']
+    reader.record_results(tasks, [{}])
+    assert reader.pool.query_one('SELECT Status FROM CustomJob') == DONE
+    assert reader.next_due_time() is None
+    reader.cleanup()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import sqlite3
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import List
+import pytest
+from postr.schedule import journal
+from postr.schedule import retry
+from postr.schedule import task_processor
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.job_status import DONE
+from postr.schedule.job_status import FAILED
+from postr.schedule.migrations import migrate
+from postr.schedule.reader import Reader
+from postr.schedule.task_processor import DispatchError
+from postr.schedule.writer import Writer
+
+NOW = 1_600_000_000
+
+
+@pytest.fixture
+def cursor() -> Generator:
+    connection = sqlite3.connect(':memory:')
+    migrate(connection)
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('text', 'Twitter,Slack', 'post_text')")
+    for worker_id in ('first', 'second'):
+        cursor.execute(
+            'INSERT INTO CustomJob(CustomDate, Job_ID, Status, WorkerID, LeaseExpiry) VALUES(?, 1, ?, ?, ?)',
+            (NOW, CLAIMED, worker_id, NOW + 300),
+        )
+    yield cursor
+    connection.close()
+
+
+def task(custom_job_id: int = 1, **changes: Any) -> Dict[str, Any]:
+    return dict({
+        'CustomJobID': custom_job_id, 'Job_ID': 1, 'CustomDate': NOW, 'Action': 'post_text',
+        'Comment': 'text', 'MediaPath': None, 'OptionalText': None, 'Platforms': 'Twitter,Slack',
+    }, **changes)
+
+
+def test_key_depends_on_post_and_platform() -> None:
+    key = journal.idempotency_key(task(), 'Twitter')
+    assert key == journal.idempotency_key(task(custom_job_id=2, MediaPath=''), 'Twitter')
+    assert key != journal.idempotency_key(task(), 'Slack')
+    assert key != journal.idempotency_key(task(Comment='other text'), 'Twitter')
+    assert key != journal.idempotency_key(task(CustomDate=NOW + 86400), 'Twitter')
+
+
+def test_finished_calls_are_not_made_again(cursor: sqlite3.Cursor) -> None:
+    first = task()
+    assert journal.begin(cursor, first, 'first', NOW) == {}
+    assert first['Platforms'] == 'Twitter,Slack'
+    journal.finish(cursor, first, {'Slack': DispatchError('Slack is down', retryable=True)}, NOW)
+
+    again = task()
+    assert journal.begin(cursor, again, 'first', NOW) == {}
+    assert again['Platforms'] == 'Slack'
+
+
+def test_unfinished_call_is_in_doubt_until_replayed(cursor: sqlite3.Cursor) -> None:
+    journal.begin(cursor, task(Platforms='Twitter'), 'first', NOW)
+
+    # The same job, claimed again after the worker crashed
+    reclaimed = task(Platforms='Twitter')
+    in_doubt = journal.begin(cursor, reclaimed, 'second', NOW)
+    assert reclaimed['Platforms'] == ''
+    assert not in_doubt['Twitter'].retryable
+
+    assert retry.record_failure(cursor, 1, 'first', in_doubt, NOW) == FAILED
+    assert retry.replay_dead_letters(cursor) == 1
+    replayed = task(Platforms='Twitter')
+    assert journal.begin(cursor, replayed, 'first', NOW) == {}
+    assert replayed['Platforms'] == 'Twitter'
+
+
+def test_call_failed_in_doubt_is_not_made_again(cursor: sqlite3.Cursor) -> None:
+    first = task(Platforms='Twitter')
+    journal.begin(cursor, first, 'first', NOW)
+    crashed = {'Twitter': DispatchError('The worker process exited during the call', retryable=False, in_doubt=True)}
+    journal.finish(cursor, first, crashed, NOW)
+    assert retry.record_failure(cursor, 1, 'first', crashed, NOW) == FAILED
+
+    again = task(Platforms='Twitter')
+    assert journal.begin(cursor, again, 'first', NOW)['Twitter'].in_doubt
+    assert again['Platforms'] == ''
+
+
+def test_duplicate_row_being_posted_is_skipped(cursor: sqlite3.Cursor) -> None:
+    journal.begin(cursor, task(custom_job_id=1), 'first', NOW)
+
+    duplicate = task(custom_job_id=2)
+    assert journal.begin(cursor, duplicate, 'second', NOW) == {}
+    assert duplicate['Platforms'] == ''
+
+
+def test_reader_posts_duplicate_rows_once(tmpdir: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    posts: List[str] = []
+
+    class FakeTwitter():
+        def post_text(self, text: str) -> bool:
+            posts.append(text)
+            return True
+
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Twitter', FakeTwitter())
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    job_id = writer.create_job('text', '', '', 'Twitter', 'post_text')
+    writer.create_custom_job(Reader.now() - 10, job_id)
+    writer.create_custom_job(Reader.now() - 10, job_id)
+    writer.cleanup()
+
+    reader = Reader(file_path=db_path, worker_id='worker')
+    for _ in range(2):
+        tasks = reader.claim_due_jobs()
+        asyncio.get_event_loop().run_until_complete(reader.dispatch(tasks, asyncio.Semaphore(1)))
+
+    assert posts == ['text']
+    assert reader.pool.query('SELECT Status FROM CustomJob') == [{'Status': DONE}, {'Status': DONE}]
+    reader.cleanup()
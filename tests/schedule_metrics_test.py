@@ -0,0 +1,96 @@
+import asyncio
+import os
+import time
+from urllib.request import urlopen
+import pytest
+from postr.schedule import task_processor
+from postr.schedule.metrics import Counter
+from postr.schedule.metrics import Histogram
+from postr.schedule.metrics import Metrics
+from postr.schedule.reader import Reader
+from postr.schedule.writer import Writer
+
+
+@pytest.fixture
+def metrics(monkeypatch: pytest.MonkeyPatch) -> Metrics:
+    fresh = Metrics()
+    monkeypatch.setattr(task_processor, 'metrics', fresh)
+    monkeypatch.setattr('postr.schedule.reader.metrics', fresh)
+    return fresh
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    histogram = Histogram('call_seconds', 'Call duration', (0.1, 1), ('platform',))
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value, 'Twitter')
+
+    assert histogram.count('Twitter') == 4
+    assert histogram.sum('Twitter') == pytest.approx(4.25)
+    assert histogram.render() == [
+        '# HELP call_seconds Call duration',
+        '# TYPE call_seconds histogram',
+        'call_seconds_bucket{platform="Twitter",le="0.1"} 1',
+        'call_seconds_bucket{platform="Twitter",le="1"} 3',
+        'call_seconds_bucket{platform="Twitter",le="+Inf"} 4',
+        'call_seconds_sum{platform="Twitter"} 4.25',
+        'call_seconds_count{platform="Twitter"} 4',
+    ]
+
+
+def test_counter_escapes_label_values() -> None:
+    counter = Counter('calls_total', 'Calls', ('platform',))
+    counter.inc('a"b')
+    counter.inc('a"b', amount=2)
+    assert counter.value('a"b') == 3
+    assert counter.render()[2] == 'calls_total{platform="a\\"b"} 3'
+
+
+def test_platform_calls_are_measured(metrics: Metrics, monkeypatch: pytest.MonkeyPatch) -> None:
+    class FakeTwitter():
+        def post_text(self, text: str) -> bool:
+            return text != 'fail'
+
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Twitter', FakeTwitter())
+    scheduled = int(time.time()) - 30
+    tasks = [
+        {'Comment': comment, 'MediaPath': None, 'OptionalText': None, 'Platforms': platforms,
+         'Action': 'post_text', 'CustomDate': scheduled}
+        for comment, platforms in [('hello', 'Twitter'), ('fail', 'Twitter'), ('hi', 'MySpace')]
+    ]
+    asyncio.get_event_loop().run_until_complete(task_processor.process_scheduler_events(tasks))
+
+    assert metrics.dispatches.value('Twitter', 'ok') == 1
+    assert metrics.dispatches.value('Twitter', 'failed') == 1
+    assert metrics.dispatches.value('MySpace', 'invalid') == 1
+    assert metrics.platform_call.count('Twitter', 'ok') == 1
+    assert metrics.schedule_lag.count('Twitter') == 2
+    assert metrics.schedule_lag.sum('Twitter') >= 60
+
+
+def test_reader_publishes_scan_metrics(metrics: Metrics, tmpdir: str) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    writer.create_custom_job(Reader.now() - 10, writer.create_job('text', '', '', 'Twitter', 'post_text'))
+    writer.cleanup()
+
+    reader = Reader(file_path=db_path, worker_id='worker')
+    tasks = reader.claim_and_measure()
+    reader.claim_and_measure()
+    reader.record_results(tasks, [{}])
+    reader.cleanup()
+
+    assert metrics.scan_cycles.value() == 2
+    assert metrics.jobs_claimed.sum() == 1
+    assert metrics.jobs_finished.value('done') == 1
+
+    metrics_file = os.path.join(str(tmpdir), 'postr.prom')
+    metrics.write(metrics_file)
+    server = metrics.serve(0)
+    try:
+        served = urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics').read().decode('utf-8')
+    finally:
+        server.shutdown()
+        server.server_close()
+    with open(metrics_file) as file:
+        assert file.read() == served
+    assert 'postr_scan_cycles_total 2\n' in served
@@ -0,0 +1,66 @@
+import sqlite3
+from typing import Generator
+import pytest
+from postr.schedule.migrations import LATEST_VERSION
+from postr.schedule.migrations import migrate
+from postr.schedule.migrations import schema_version
+
+FAR_FUTURE = 4_000_000_000
+
+
+@pytest.fixture
+def conn() -> Generator:
+    connection = sqlite3.connect(':memory:')
+    yield connection
+    connection.close()
+
+
+def index_names(conn: sqlite3.Connection) -> list:
+    return [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+
+
+def test_migrate_new_database(conn: sqlite3.Connection) -> None:
+    assert schema_version(conn) == 0
+    assert migrate(conn) == LATEST_VERSION
+    assert schema_version(conn) == LATEST_VERSION
+    assert 'CustomJob_Status_CustomDate' in index_names(conn)
+
+
+def test_migrate_is_idempotent(conn: sqlite3.Connection) -> None:
+    migrate(conn)
+    assert migrate(conn) == LATEST_VERSION
+
+
+def test_migrate_to_target_version(conn: sqlite3.Connection) -> None:
+    assert migrate(conn, target_version=1) == 1
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(CustomJob)')]
+    assert 'Status' not in columns
+
+
+def test_claim_columns_respect_watermark(conn: sqlite3.Connection) -> None:
+    migrate(conn, target_version=2)
+    conn.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('text', 'Twitter', 'post_text')")
+    conn.executemany(
+        'INSERT INTO CustomJob(CustomDate, Job_ID) VALUES(?, 1)',
+        [(100,), (200,), (200,), (300,)],
+    )
+    conn.execute("INSERT INTO SchedulerState VALUES('LastCustomDate', 200), ('LastCustomJobID', 2)")
+    conn.commit()
+
+    migrate(conn)
+    statuses = conn.execute('SELECT Status FROM CustomJob ORDER BY CustomJobID').fetchall()
+    assert [status[0] for status in statuses] == ['done', 'done', 'pending', 'pending']
+
+
+def test_next_run_times_are_filled_in_for_recurring_jobs_of_version_4(conn: sqlite3.Connection) -> None:
+    migrate(conn, target_version=4)
+    conn.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('text', 'Twitter', 'post_text')")
+    conn.execute('INSERT INTO DailyJob(StartTime, IntervalInMinutes, Job_ID) VALUES(?, 0, 1)', (FAR_FUTURE,))
+    conn.execute('INSERT INTO MonthlyJob(StartTime, IntervalInDays, Job_ID) VALUES(?, 0, 1)', (FAR_FUTURE,))
+    conn.execute('INSERT INTO DailyJob(StartTime, EndTime, Job_ID) VALUES(100, 200, 1)')
+    conn.commit()
+
+    migrate(conn)
+    assert conn.execute('SELECT NextRunTime FROM DailyJob ORDER BY DailyJobID').fetchall() == [(FAR_FUTURE,), (None,)]
+    assert conn.execute('SELECT NextRunTime FROM MonthlyJob').fetchall() == [(FAR_FUTURE,)]
+    assert {'DailyJob_NextRunTime', 'MonthlyJob_NextRunTime', 'CronJob_NextRunTime'} <= set(index_names(conn))
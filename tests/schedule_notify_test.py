@@ -0,0 +1,84 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import List
+import pytest
+from postr.schedule import notify
+from postr.schedule import task_processor
+from postr.schedule.job_status import DONE
+from postr.schedule.reader import Reader
+
+pytestmark = pytest.mark.skipif(not notify.supported(), reason='needs Unix sockets')
+
+WRITE_JOB = """
+import sys
+from postr.schedule.reader import Reader
+from postr.schedule.writer import Writer
+writer = Writer(sys.argv[1])
+writer.create_custom_job(Reader.now(), writer.create_job('text', '', '', 'Twitter', 'post_text'))
+writer.cleanup()
+"""
+
+
+def test_notify_wakes_listeners_and_removes_stale_sockets(tmpdir: str) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    assert notify.notify(db_path) == 0
+
+    listener = notify.listen(db_path)
+    assert listener is not None
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stale_path = os.path.join(notify.socket_directory(db_path), 'stale.sock')
+    stale.bind(stale_path)
+    stale.close()
+
+    assert notify.notify(db_path) == 1
+    assert notify.notify(db_path) == 1
+    assert listener.drain() == 2
+    assert listener.drain() == 0
+    assert not os.path.exists(stale_path)
+
+    listener.close()
+    assert not os.path.exists(notify.socket_directory(db_path))
+
+
+def test_job_written_by_another_process_is_dispatched_at_once(
+        tmpdir: str,
+        monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    posts: List[float] = []
+
+    class FakeTwitter():
+        def post_text(self, text: str) -> bool:
+            posts.append(time.time())
+            return True
+
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Twitter', FakeTwitter())
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    # Without a notification the Reader would not look at the schedule again for an hour
+    worker = Reader(file_path=db_path, worker_id='worker', max_sleep=3600)
+
+    async def write_and_wait() -> float:
+        scanning = asyncio.ensure_future(worker.scan())
+        await asyncio.sleep(0.2)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            None, lambda: subprocess.run([sys.executable, '-c', WRITE_JOB, db_path], check=True),
+        )
+        written = time.time()
+        for _ in range(100):
+            if await worker.db.query_one('SELECT Status FROM CustomJob') == DONE:
+                break
+            await asyncio.sleep(0.02)
+        scanning.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await scanning
+        return written
+
+    written = asyncio.get_event_loop().run_until_complete(write_and_wait())
+    worker.cleanup()
+    assert len(posts) == 1
+    assert posts[0] - written < 1
+    assert not os.path.exists(notify.socket_directory(db_path))
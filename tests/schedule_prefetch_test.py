@@ -0,0 +1,100 @@
+import asyncio
+import os
+from typing import Any
+from typing import List
+import pytest
+from postr.schedule import registry
+from postr.schedule import task_processor
+from postr.schedule.prefetch import Prefetcher
+from postr.schedule.reader import Reader
+from postr.schedule.writer import Writer
+
+
+class FakeAdapter():
+    def post_text(self, text: str) -> bool:
+        return True
+
+
+@pytest.fixture
+def built(monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    """ Makes every adapter a FakeAdapter, built on first use, and returns the platforms built """
+    built: List[str] = []
+
+    def build(api: str) -> Any:
+        built.append(api)
+        return FakeAdapter()
+
+    monkeypatch.setattr(registry, 'missing_configs_for', lambda api: [])
+    monkeypatch.setattr(task_processor.api_to_instance, 'build', build)
+    monkeypatch.setattr(task_processor.api_to_instance, 'instances', {})
+    return built
+
+
+def test_prefetcher_stages_jobs_within_the_horizon(tmpdir: str, built: List[str]) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    photo = os.path.join(str(tmpdir), 'photo.jpg')
+    with open(photo, 'wb') as image:
+        image.write(b'\xff\xd8' * 1000)
+    writer = Writer(db_path)
+    now = Reader.now()
+    text = writer.create_job('text', '', '', 'Twitter', 'post_text')
+    writer.create_custom_job(now + 60, text)
+    with_photo = writer.create_job('text', photo, '', 'Twitter', 'post_photo')
+    writer.create_custom_job(now + 90, with_photo)
+    gone = os.path.join(str(tmpdir), 'gone.jpg')
+    missing_photo = writer.create_job('text', gone, '', 'Twitter', 'post_photo')
+    writer.create_custom_job(now + 120, missing_photo)
+    later = writer.create_job('text', '', '', 'Slack', 'post_text')
+    writer.create_custom_job(now + 3600, later)
+    recurring = writer.create_job('text', '', '', 'Reddit,Slack', 'post_text')
+    writer.create_daily_job(now + 200, recurring, interval_in_minutes=60)
+    writer.cleanup()
+
+    reader = Reader(file_path=db_path, worker_id='worker')
+    prefetcher = Prefetcher(reader.db, horizon=300)
+
+    async def stage() -> List[Any]:
+        staged = await prefetcher.stage(await reader.db.run(prefetcher.upcoming, now))
+        assert await reader.db.run(prefetcher.upcoming, now) == []
+        return staged
+
+    staged = asyncio.get_event_loop().run_until_complete(stage())
+    reader.cleanup()
+
+    assert [(target.job_id, target.platform, target.due_time - now) for target in staged] == [
+        (int(text), 'Twitter', 60),
+        (int(with_photo), 'Twitter', 90),
+        (int(missing_photo), 'Twitter', 120),
+        (int(recurring), 'Reddit', 200),
+        (int(recurring), 'Slack', 200),
+    ]
+    assert [target.error for target in staged] == [None, None, f'{gone} does not exist', None, None]
+    assert sorted(built) == ['Reddit', 'Slack', 'Twitter']
+
+    prefetcher.forget_past(now + 800)
+    assert list(prefetcher.staged) == []
+
+
+def test_reader_warms_adapters_of_new_jobs_ahead_of_time(tmpdir: str, built: List[str]) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    worker = Reader(file_path=db_path, worker_id='worker', max_sleep=3600, prefetch_horizon=300)
+    writer = Writer(db_path)
+    writer.add_listener(worker.notify)
+
+    async def write_and_wait() -> None:
+        scanning = asyncio.ensure_future(worker.scan())
+        await asyncio.sleep(0.1)
+        assert built == []
+        writer.create_custom_job(Reader.now() + 120, writer.create_job('text', '', '', 'Slack', 'post_text'))
+        for _ in range(50):
+            if built:
+                break
+            await asyncio.sleep(0.02)
+        scanning.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await scanning
+
+    asyncio.get_event_loop().run_until_complete(write_and_wait())
+    writer.cleanup()
+    worker.cleanup()
+    assert built == ['Slack']
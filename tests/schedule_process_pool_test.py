@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+from typing import Any
+from typing import Dict
+from typing import Generator
+import pytest
+from postr.schedule import process_pool
+from postr.schedule import reader
+from postr.schedule import task_processor
+from postr.schedule.process_pool import ProcessDispatcher
+
+
+class WorkerTwitter():
+    """ Built inside the worker process """
+
+    def post_text(self, text: str) -> bool:
+        if text == 'crash':
+            os._exit(1)
+        if text == 'hang':
+            time.sleep(60)
+        return text != 'fail'
+
+
+def task(comment: str) -> Dict[str, Any]:
+    return {'Comment': comment, 'MediaPath': None, 'OptionalText': None, 'Platforms': 'Twitter', 'Action': 'post_text'}
+
+
+def run(coroutine: Any) -> Any:
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+@pytest.fixture
+def dispatcher(monkeypatch: pytest.MonkeyPatch) -> Generator:
+    monkeypatch.setattr(process_pool, 'RESTART_DELAY_SECONDS', 0)
+    dispatcher = ProcessDispatcher([['Twitter']], timeout=5, adapters={'Twitter': (__name__, 'WorkerTwitter')})
+    dispatcher.start()
+    yield dispatcher
+    dispatcher.close()
+    assert 'Twitter' not in task_processor.platform_workers
+
+
+def test_tasks_run_in_the_worker(dispatcher: ProcessDispatcher) -> None:
+    results = run(task_processor.process_scheduler_events([task('hello'), task('fail'), task('again')]))
+
+    assert results[0] == {} and results[2] == {}
+    assert results[1]['Twitter'].retryable
+    assert dispatcher.workers[0].process.pid != os.getpid()
+
+
+def test_crashed_worker_is_restarted(dispatcher: ProcessDispatcher) -> None:
+    worker = dispatcher.workers[0]
+    errors = run(task_processor.run_task(task('crash')))
+    assert 'exited with code 1' in errors['Twitter'].message
+    # It may have posted before it crashed
+    assert errors['Twitter'].in_doubt and not errors['Twitter'].retryable
+
+    for _ in range(100):
+        if worker.restarts and worker.process.is_alive():
+            break
+        time.sleep(0.05)
+    assert run(task_processor.run_task(task('hello'))) == {}
+
+
+def test_hung_worker_is_restarted(dispatcher: ProcessDispatcher) -> None:
+    worker = dispatcher.workers[0]
+    worker.timeout = 0.5
+    hung_process = worker.process
+
+    errors = run(task_processor.run_task(task('hang')))
+    assert 'did not finish' in errors['Twitter'].message
+    assert errors['Twitter'].in_doubt and not errors['Twitter'].retryable
+
+    hung_process.join(5)
+    assert not hung_process.is_alive()
+    worker.timeout = 5
+    for _ in range(100):
+        if worker.process is not hung_process and worker.process.is_alive():
+            break
+        time.sleep(0.05)
+    assert run(task_processor.run_task(task('hello'))) == {}
+
+
+def test_reader_stops_workers_without_blocking_the_loop(tmpdir: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    class SlowToStop():
+        def __init__(self, groups: Any, max_concurrency: int) -> None:
+            pass
+
+        def start(self) -> None:
+            pass
+
+        def close(self) -> None:
+            time.sleep(0.5)
+
+    monkeypatch.setattr(reader, 'ProcessDispatcher', SlowToStop)
+    worker = reader.Reader(file_path=os.path.join(str(tmpdir), 'schedule.sqlite'), worker_groups=[['Twitter']])
+    ticks = []
+
+    async def scan_and_stop() -> None:
+        scanning = asyncio.ensure_future(worker.scan())
+        await asyncio.sleep(0.1)
+        scanning.cancel()
+        while not scanning.done():
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    run(scan_and_stop())
+    worker.cleanup()
+    assert len(ticks) > 20
@@ -0,0 +1,286 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import List
+import pytest
+from postr.rate_limiter import RateLimiter
+from postr.schedule import reader as reader_module
+from postr.schedule import task_processor
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.job_status import DONE
+from postr.schedule.job_status import RETRYING
+from postr.schedule.reader import Reader
+from postr.schedule.task_processor import DispatchError
+from postr.schedule.writer import Writer
+
+
+@pytest.fixture
+def db_path(tmpdir: str) -> str:
+    return os.path.join(str(tmpdir), 'schedule.sqlite')
+
+
+@pytest.fixture
+def writer(db_path: str) -> Generator:
+    writer = Writer(db_path)
+    yield writer
+    writer.cleanup()
+
+
+def reader(db_path: str, worker_id: str) -> Reader:
+    return Reader(file_path=db_path, worker_id=worker_id)
+
+
+def schedule(writer: Writer, date: int, platforms: str = 'Twitter,Slack') -> str:
+    job_id = writer.create_job('text', '', '', platforms, 'post_text')
+    writer.create_custom_job(date, job_id)
+    return job_id
+
+
+def test_due_jobs_are_claimed_once(writer: Writer, db_path: str) -> None:
+    now = Reader.now()
+    schedule(writer, now - 10)
+    schedule(writer, now + 3600)
+    first, second = reader(db_path, 'first'), reader(db_path, 'second')
+
+    jobs = first.claim_due_jobs()
+    assert [(job['Status'], job['WorkerID']) for job in jobs] == [(CLAIMED, 'first')]
+    assert second.claim_due_jobs() == []
+    assert first.next_due_time() == jobs[0]['LeaseExpiry']
+
+
+def test_concurrent_claims_are_disjoint(writer: Writer, db_path: str) -> None:
+    now = Reader.now()
+    for _ in range(60):
+        schedule(writer, now - 10)
+    workers = [Reader(file_path=db_path, worker_id=worker_id, batch_size=7) for worker_id in ('first', 'second')]
+    claimed: Dict[str, List[int]] = {'first': [], 'second': []}
+    start = threading.Barrier(len(workers))
+
+    def claim_all(worker: Reader) -> None:
+        start.wait()
+        while True:
+            jobs = worker.claim_due_jobs()
+            if not jobs:
+                return
+            assert {job['WorkerID'] for job in jobs} == {worker.worker_id}
+            claimed[worker.worker_id] += [job['CustomJobID'] for job in jobs]
+
+    # Each thread claims over its own connection, so the BEGIN IMMEDIATE transactions really race
+    threads = [threading.Thread(target=claim_all, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not set(claimed['first']) & set(claimed['second'])
+    assert sorted(claimed['first'] + claimed['second']) == list(range(1, 61))
+
+
+def test_expired_lease_is_taken_over(writer: Writer, db_path: str) -> None:
+    schedule(writer, Reader.now() - 10)
+    first, second = reader(db_path, 'first'), reader(db_path, 'second')
+
+    job_id = first.claim_due_jobs()[0]['CustomJobID']
+    assert second.claim_due_jobs() == []
+
+    # The first worker died without renewing its lease
+    first.cursor.execute('UPDATE CustomJob SET LeaseExpiry = ?', (Reader.now() - 1,))
+    first.conn.commit()
+    jobs = second.claim_due_jobs()
+    assert [(job['CustomJobID'], job['WorkerID']) for job in jobs] == [(job_id, 'second')]
+    assert jobs[0]['LeaseExpiry'] > Reader.now()
+
+
+def test_finish_needs_the_lease(writer: Writer, db_path: str) -> None:
+    schedule(writer, Reader.now() - 10)
+    # Renewing with a longer lease than the second worker's would show in LeaseExpiry
+    first = Reader(file_path=db_path, worker_id='first', lease_seconds=1000)
+    second = reader(db_path, 'second')
+
+    job_id = first.claim_due_jobs()[0]['CustomJobID']
+    first.cursor.execute('UPDATE CustomJob SET LeaseExpiry = ?', (Reader.now() - 1,))
+    first.conn.commit()
+    lease_expiry = second.claim_due_jobs()[0]['LeaseExpiry']
+
+    # The first worker comes back: it can neither finish the job nor renew the lease it lost
+    first.finish_job(job_id, DONE)
+    first.renew_leases([job_id])
+    row = first.cursor.execute('SELECT Status, WorkerID, LeaseExpiry FROM CustomJob').fetchone()
+    assert tuple(row) == (CLAIMED, 'second', lease_expiry)
+
+    second.finish_job(job_id, DONE)
+    assert first.cursor.execute('SELECT Status FROM CustomJob').fetchone()[0] == DONE
+
+
+def test_finished_job_is_not_claimed_again(writer: Writer, db_path: str) -> None:
+    schedule(writer, Reader.now() - 10)
+    worker = reader(db_path, 'worker')
+
+    job = worker.claim_due_jobs()[0]
+    worker.finish_job(job['CustomJobID'], DONE)
+
+    assert worker.claim_due_jobs() == []
+    assert worker.next_due_time() is None
+
+
+def test_retry_goes_to_failed_platforms_only(writer: Writer, db_path: str) -> None:
+    schedule(writer, Reader.now() - 10)
+    worker = reader(db_path, 'worker')
+    job = worker.claim_due_jobs()[0]
+
+    worker.record_results([job], [{'Slack': DispatchError('Slack is down', retryable=True)}])
+    worker.cursor.execute('UPDATE JobPlatform SET DueTime = ? WHERE Status = ?', (Reader.now() - 1, RETRYING))
+    worker.conn.commit()
+
+    retried = worker.claim_due_jobs()
+    assert [(job['Platforms'], job['Attempts']) for job in retried] == [('Slack', 1)]
+
+
+def test_scan_dispatches_due_jobs(writer: Writer, db_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    posts: List[str] = []
+
+    class FakeTwitter():
+        def post_text(self, text: str) -> bool:
+            posts.append(text)
+            return True
+
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Twitter', FakeTwitter())
+    schedule(writer, Reader.now() - 10, platforms='Twitter')
+    worker = reader(db_path, 'worker')
+
+    async def scan_until_done() -> None:
+        scanning = asyncio.ensure_future(worker.scan())
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if await worker.db.query_one('SELECT Status FROM CustomJob') == DONE:
+                break
+        scanning.cancel()
+
+    asyncio.get_event_loop().run_until_complete(scan_until_done())
+    worker.cleanup()
+    assert posts == ['text']
+
+
+def test_writer_wakes_sleeping_reader(writer: Writer, db_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    posts: List[str] = []
+
+    class FakeTwitter():
+        def post_text(self, text: str) -> bool:
+            posts.append(text)
+            return True
+
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Twitter', FakeTwitter())
+    # Only the in-process wake-up, not the notify socket
+    monkeypatch.setattr(reader_module, 'listen', lambda db_path: None)
+    worker = Reader(file_path=db_path, worker_id='worker', max_sleep=3600)
+    writer.add_listener(worker.notify)
+
+    async def schedule_while_sleeping() -> float:
+        loop = asyncio.get_event_loop()
+        scanning = asyncio.ensure_future(worker.scan())
+        await asyncio.sleep(0.2)
+        # As from the GUI thread
+        await loop.run_in_executor(None, schedule, writer, Reader.now(), 'Twitter')
+        start = time.perf_counter()
+        while await worker.db.query_one('SELECT Status FROM CustomJob') != DONE and time.perf_counter() - start < 5:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        scanning.cancel()
+        await asyncio.gather(scanning, return_exceptions=True)
+        return elapsed
+
+    elapsed = asyncio.get_event_loop().run_until_complete(schedule_while_sleeping())
+    worker.cleanup()
+    assert posts == ['text']
+    assert elapsed < 1
+
+
+def test_max_concurrency_is_per_reader(writer: Writer, db_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    in_flight: List[int] = [0, 0]
+
+    class FakeAdapter():
+        async def post_text(self, text: str) -> bool:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            await asyncio.sleep(0.05)
+            in_flight[0] -= 1
+            return True
+
+    for api in ('Twitter', 'Slack', 'Reddit'):
+        monkeypatch.setitem(task_processor.api_to_instance.instances, api, FakeAdapter())
+        monkeypatch.setitem(task_processor.dispatch_table, (api, 'post_text'), task_processor.dispatch_table[
+            (api, 'post_text')
+        ]._replace(is_async=True))
+    executor = task_processor.dispatch_executor()
+    schedule(writer, Reader.now() - 10, platforms='Twitter,Slack,Reddit')
+    worker = Reader(file_path=db_path, worker_id='worker', max_concurrency=1)
+
+    async def scan_until_done() -> None:
+        scanning = asyncio.ensure_future(worker.scan())
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if await worker.db.query_one('SELECT Status FROM CustomJob') == DONE:
+                break
+        scanning.cancel()
+        await asyncio.gather(scanning, return_exceptions=True)
+
+    asyncio.get_event_loop().run_until_complete(scan_until_done())
+    worker.cleanup()
+    assert in_flight[1] == 1
+    # The process's dispatch thread pool, shared with other Readers, is left alone
+    assert task_processor.max_concurrency == task_processor.MAX_CONCURRENT_DISPATCHES
+    assert task_processor.dispatch_executor() is executor
+
+
+def test_dispatch_threads_grow_with_max_concurrency(
+        db_path: str, rate_limits: RateLimiter, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # The test's own thread pool replaces the process's, which is put back afterwards
+    monkeypatch.setattr(task_processor, 'dispatch_threads', task_processor.dispatch_threads)
+    monkeypatch.setattr(task_processor, '_executor', None)
+    concurrency = task_processor.MAX_CONCURRENT_DISPATCHES + 4
+    rate_limits.configure('Twitter', 'post', concurrency, concurrency)
+    all_in_flight = threading.Barrier(concurrency, timeout=5)
+
+    class BlockingAdapter():
+        def post_text(self, text: str) -> bool:
+            all_in_flight.wait()
+            return True
+
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Twitter', BlockingAdapter())
+    worker = Reader(file_path=db_path, worker_id='worker', max_concurrency=concurrency)
+    tasks = [
+        {'Action': 'post_text', 'Comment': f'text {i}', 'MediaPath': None, 'OptionalText': None}
+        for i in range(concurrency)
+    ]
+
+    async def dispatch() -> List[Any]:
+        semaphore = asyncio.Semaphore(worker.max_concurrency)
+        return await asyncio.gather(*[task_processor.run_platform('Twitter', task, semaphore) for task in tasks])
+
+    try:
+        assert asyncio.get_event_loop().run_until_complete(dispatch()) == [None] * concurrency
+    finally:
+        task_processor.dispatch_executor().shutdown()
+        worker.cleanup()
+
+
+def test_failed_dispatch_releases_the_batch(writer: Writer, db_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    async def fail(tasks: List[Dict[str, Any]], semaphore: Any) -> None:
+        raise RuntimeError('dispatch crashed')
+
+    monkeypatch.setattr(reader_module, 'process_scheduler_events', fail)
+    schedule(writer, Reader.now() - 10)
+    first, second = reader(db_path, 'first'), reader(db_path, 'second')
+
+    tasks = first.claim_due_jobs()
+    asyncio.get_event_loop().run_until_complete(first.dispatch(tasks, asyncio.Semaphore(0)))
+    # Renewing leases now would not keep the failed batch claimed
+    assert first.in_flight == set()
+
+    jobs = second.claim_due_jobs()
+    assert [(job['CustomJobID'], job['WorkerID']) for job in jobs] == [(tasks[0]['CustomJobID'], 'second')]
@@ -0,0 +1,85 @@
+import asyncio
+import os
+from typing import Generator
+from typing import List
+import pytest
+from postr.schedule import task_processor
+from postr.schedule.job_status import CANCELLED
+from postr.schedule.job_status import PENDING
+from postr.schedule.reader import Reader
+from postr.schedule.retraction import retract
+from postr.schedule.writer import Writer
+
+
+class FakePlatform():
+    """ Posts with increasing IDs, and fails to delete the IDs in undeletable """
+
+    def __init__(self, name: str, undeletable: List[str]) -> None:
+        self.name = name
+        self.undeletable = undeletable
+        self.posted: List[str] = []
+        self.deleted: List[str] = []
+
+    def post_text(self, text: str) -> str:
+        self.posted.append(text)
+        return f'{self.name}-{len(self.posted)}'
+
+    def remove_post(self, post_id: str) -> bool:
+        if post_id in self.undeletable:
+            return False
+        self.deleted.append(post_id)
+        return True
+
+
+@pytest.fixture
+def platforms(monkeypatch: pytest.MonkeyPatch) -> Generator:
+    fakes = {'Twitter': FakePlatform('tweet', ['tweet-2']), 'Slack': FakePlatform('message', [])}
+    for name, fake in fakes.items():
+        monkeypatch.setitem(task_processor.api_to_instance.instances, name, fake)
+    yield fakes
+
+
+def test_retract_campaign(tmpdir: str, platforms: dict) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    launch = [
+        writer.create_job(f'launch {i}', '', '', 'Twitter,Slack', 'post_text', campaign='launch')
+        for i in range(2)
+    ]
+    other = writer.create_job('other', '', '', 'Twitter', 'post_text', campaign='other')
+    for job_id in [*launch, other]:
+        writer.create_custom_job(Reader.now() - 10, job_id)
+    writer.create_custom_job(Reader.now() + 3600, launch[0])
+    writer.cleanup()
+
+    reader = Reader(file_path=db_path, worker_id='worker')
+    tasks = reader.claim_due_jobs()
+    asyncio.get_event_loop().run_until_complete(reader.dispatch(tasks, asyncio.Semaphore(1)))
+    assert len(reader.pool.query('SELECT * FROM PostReceipt')) == 5
+
+    retractions = asyncio.get_event_loop().run_until_complete(retract(reader.pool, campaign='launch'))
+
+    assert sorted(platforms['Twitter'].deleted + platforms['Slack'].deleted) == [
+        'message-1', 'message-2', 'tweet-1',
+    ]
+    failed = [retraction for retraction in retractions if retraction.error is not None]
+    assert [(retraction.platform, retraction.post_id) for retraction in failed] == [('Twitter', 'tweet-2')]
+    assert reader.pool.query(
+        'SELECT PostID FROM PostReceipt WHERE RetractedAt IS NULL ORDER BY PostID',
+    ) == [{'PostID': 'tweet-2'}, {'PostID': 'tweet-3'}]
+    assert reader.pool.query(
+        'SELECT Job_ID, Status FROM CustomJob WHERE CustomDate > ?', (Reader.now(),),
+    ) == [{'Job_ID': int(launch[0]), 'Status': CANCELLED}]
+    reader.cleanup()
+
+
+def test_retract_needs_a_selection(tmpdir: str) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    job_id = writer.create_job('text', '', '', 'Twitter', 'post_text')
+    writer.create_custom_job(Reader.now() + 3600, job_id)
+
+    with pytest.raises(ValueError):
+        asyncio.get_event_loop().run_until_complete(retract(writer.pool))
+    assert writer.pool.query('SELECT Status FROM CustomJob') == [{'Status': PENDING}]
+    writer.cleanup()
@@ -0,0 +1,55 @@
+import sqlite3
+from datetime import datetime as dt
+from postr.schedule.migrations import migrate
+from postr.schedule.recurrence import add_months
+from postr.schedule.recurrence import materialize_due_jobs
+from postr.schedule.recurrence import next_daily_run
+from postr.schedule.recurrence import next_monthly_run
+
+START = int(dt(2019, 1, 31, 9, 30).timestamp())
+HOUR = 60 * 60
+
+
+def test_next_daily_run_by_interval() -> None:
+    assert next_daily_run(START, 1, 90, after=START - 1) == START
+    assert next_daily_run(START, 1, 90, after=START) == START + 90 * 60
+    assert next_daily_run(START, 1, 90, after=START + 100 * 60) == START + 180 * 60
+
+
+def test_next_daily_run_by_days() -> None:
+    expected = int(dt(2019, 2, 2, 9, 30).timestamp())
+    assert next_daily_run(START, 2, 0, after=START) == expected
+    assert next_daily_run(START, 2, 0, after=START + 30 * HOUR) == expected
+
+
+def test_next_daily_run_ends() -> None:
+    assert next_daily_run(START, 1, 0, after=START, end_time=START + HOUR) is None
+
+
+def test_add_months_clamps_day() -> None:
+    assert add_months(START, 1) == int(dt(2019, 2, 28, 9, 30).timestamp())
+    assert add_months(START, 13) == int(dt(2020, 2, 29, 9, 30).timestamp())
+
+
+def test_next_monthly_run() -> None:
+    assert next_monthly_run(START, 1, 0, after=START) == int(dt(2019, 2, 28, 9, 30).timestamp())
+    assert next_monthly_run(START, 3, 0, after=START + 100 * 24 * HOUR) == int(dt(2019, 7, 31, 9, 30).timestamp())
+    assert next_monthly_run(START, 1, 10, after=START) == int(dt(2019, 2, 10, 9, 30).timestamp())
+
+
+def test_materialize_due_jobs() -> None:
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    conn.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('text', 'Twitter', 'post_text')")
+    conn.execute(
+        'INSERT INTO DailyJob(IntervalInMinutes, StartTime, Job_ID, NextRunTime) VALUES(60, ?, 1, ?)',
+        (START, START),
+    )
+    cursor = conn.cursor()
+
+    # Three occurrences were missed; they collapse into one run and the next run is in the future
+    now = START + 3 * HOUR + 5
+    assert materialize_due_jobs(cursor, now, limit=10) == 1
+    assert materialize_due_jobs(cursor, now, limit=10) == 0
+    assert conn.execute('SELECT CustomDate, Job_ID, Status FROM CustomJob').fetchall() == [(START, 1, 'pending')]
+    assert conn.execute('SELECT NextRunTime, FrequencyCounter FROM DailyJob').fetchone() == (START + 4 * HOUR, 2)
@@ -0,0 +1,56 @@
+import threading
+import time
+from typing import Generator
+from unittest.mock import patch
+import pytest
+from postr.schedule.registry import AdapterRegistry
+
+
+class SlowAdapter():
+    built = 0
+
+    def __init__(self) -> None:
+        time.sleep(0.05)
+        SlowAdapter.built += 1
+
+
+@pytest.fixture
+def registry() -> Generator:
+    SlowAdapter.built = 0
+    with patch('postr.schedule.registry.missing_configs_for', return_value=[]):
+        yield AdapterRegistry({'Slow': (__name__, 'SlowAdapter')})
+
+
+def test_nothing_is_built_up_front(registry: AdapterRegistry) -> None:
+    assert not registry.is_built('Slow')
+    assert SlowAdapter.built == 0
+
+
+def test_adapter_is_built_once(registry: AdapterRegistry) -> None:
+    threads = [threading.Thread(target=registry.get, args=('Slow',)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert SlowAdapter.built == 1
+    assert registry['Slow'] is registry.get('Slow')
+
+
+def test_missing_config_is_none(registry: AdapterRegistry) -> None:
+    with patch('postr.schedule.registry.missing_configs_for', return_value=['API_TOKEN']):
+        assert registry['Slow'] is None
+    assert SlowAdapter.built == 0
+
+
+def test_unknown_api(registry: AdapterRegistry) -> None:
+    assert registry.get('Unknown') is None
+    with pytest.raises(KeyError):
+        registry['Unknown']  # pylint: disable=pointless-statement
+
+
+def test_fake_adapter(registry: AdapterRegistry) -> None:
+    fake = object()
+    registry['Slow'] = fake
+    assert registry['Slow'] is fake
+    assert SlowAdapter.built == 0
@@ -0,0 +1,72 @@
+import os
+import time
+import pytest
+from postr import clock
+from postr.rate_limiter import limiter
+from postr.schedule import replay
+from postr.schedule import task_processor
+from postr.schedule.database import get_pool
+from postr.schedule.job_status import DONE
+from postr.schedule.writer import Writer
+
+START = 1_600_000_000
+
+
+def test_virtual_clock_runs_faster() -> None:
+    virtual = clock.VirtualClock(START, speed=1000)
+    assert START <= virtual.now() < START + 100
+    assert virtual.real_seconds(60) == pytest.approx(0.06)
+
+    before = virtual.now()
+    time.sleep(0.01)
+    assert virtual.now() - before >= 10
+
+    previous = clock.set_clock(virtual)
+    try:
+        assert clock.now() >= START
+        assert clock.monotonic() == pytest.approx(clock.now(), abs=1)
+    finally:
+        clock.set_clock(previous)
+    assert clock.now() == pytest.approx(time.time(), abs=1)
+
+
+def test_summarize() -> None:
+    # 10 posts due at once, sent 10 seconds apart, then one on time
+    due = [float(START)] * 10 + [START + 7200.0]
+    calls = [START + i * 10.0 for i in range(10)] + [START + 7200.0]
+    load, = replay.summarize({'Slack': due}, {'Slack': calls, 'Twitter': []})
+    assert load.calls == 11
+    assert load.peak_per_minute == 6
+    assert load.peak_per_hour == 10
+    assert load.peak_queue == 9
+    assert load.lag_max == 90
+    assert load.limit_per_hour == 3600
+
+
+def test_replay_reports_platform_load(tmpdir: str) -> None:
+    db_path = os.path.join(str(tmpdir), 'schedule.sqlite')
+    writer = Writer(db_path)
+    for i in range(30):
+        writer.create_custom_job(START + 600, writer.create_job(f'text {i}', '', '', 'Slack,Twitter', 'post_text'))
+    job_id = writer.create_job('text', '', '', 'Slack,Twitter', 'post_text')
+    writer.create_custom_job(START + 2 * 3600, job_id)
+    writer.create_daily_job(START + 1800, job_id, interval_in_minutes=10)
+    writer.cleanup()
+    adapters = dict(task_processor.api_to_instance.instances)
+
+    loads = {load.platform: load for load in replay.replay(db_path, START - 1, START + 3600, speed=3600, latency=1)}
+
+    # A burst of 30 one-off posts and the daily job's 4 runs in the hour, nothing after it.
+    # Slack takes a post a second; Twitter 10 at once, then one every 36 seconds
+    assert loads['Slack'].calls == loads['Twitter'].calls == 34
+    assert loads['Twitter'].limit_per_hour == pytest.approx(100)
+    assert loads['Twitter'].peak_per_minute <= 12
+    assert 600 < loads['Twitter'].lag_max
+    assert loads['Slack'].lag_p50 < loads['Twitter'].lag_p50
+    assert loads['Twitter'].peak_queue >= 15
+
+    # The source database and the process's clock and adapters are left alone
+    assert get_pool(db_path).query_one('SELECT COUNT(*) FROM CustomJob WHERE Status = ?', (DONE,)) == 0
+    assert isinstance(clock.get_clock(), clock.Clock) and not isinstance(clock.get_clock(), clock.VirtualClock)
+    assert task_processor.api_to_instance.instances == adapters
+    assert not limiter.buckets
@@ -0,0 +1,85 @@
+import sqlite3
+from typing import Generator
+import pytest
+from postr.schedule import retry
+from postr.schedule.job_status import CLAIMED
+from postr.schedule.job_status import FAILED
+from postr.schedule.job_status import PENDING
+from postr.schedule.job_status import RETRYING
+from postr.schedule.migrations import migrate
+from postr.schedule.task_processor import DispatchError
+
+NOW = 1_600_000_000
+TIMEOUT = DispatchError('Twitter failed to run post_text: timed out', retryable=True)
+INVALID = DispatchError('post_text is not a valid action.', retryable=False)
+
+
+@pytest.fixture
+def cursor() -> Generator:
+    connection = sqlite3.connect(':memory:')
+    migrate(connection)
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO Job(Comment, Platforms, Action) VALUES('text', 'Twitter,Slack', 'post_text')")
+    cursor.execute(
+        'INSERT INTO CustomJob(CustomDate, Job_ID, Status, WorkerID) VALUES(?, 1, ?, ?)',
+        (NOW, CLAIMED, 'worker'),
+    )
+    yield cursor
+    connection.close()
+
+
+def job(cursor: sqlite3.Cursor) -> tuple:
+    cursor.execute('SELECT Status, Attempts, RetryPlatforms, RetryAt FROM CustomJob WHERE CustomJobID = 1')
+    row: tuple = cursor.fetchone()
+    return row
+
+
+def claim(cursor: sqlite3.Cursor) -> None:
+    cursor.execute('UPDATE CustomJob SET Status = ?, WorkerID = ? WHERE CustomJobID = 1', (CLAIMED, 'worker'))
+
+
+def test_backoff_doubles_with_jitter() -> None:
+    for attempts in range(1, 5):
+        delay = retry.RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        assert delay / 2 <= retry.backoff_seconds(attempts) <= delay
+    assert retry.backoff_seconds(50) <= retry.RETRY_MAX_SECONDS
+
+
+def test_failure_retries_only_failed_platforms(cursor: sqlite3.Cursor) -> None:
+    assert retry.record_failure(cursor, 1, 'worker', {'Twitter': TIMEOUT}, NOW) == RETRYING
+
+    status, attempts, platforms, retry_at = job(cursor)
+    assert (status, attempts, platforms) == (RETRYING, 1, 'Twitter')
+    assert NOW + retry.RETRY_BASE_SECONDS / 2 <= retry_at <= NOW + retry.RETRY_BASE_SECONDS
+
+
+def test_failure_of_lost_claim_is_ignored(cursor: sqlite3.Cursor) -> None:
+    assert retry.record_failure(cursor, 1, 'other worker', {'Twitter': TIMEOUT}, NOW) is None
+    assert job(cursor)[0] == CLAIMED
+
+
+def test_out_of_attempts_is_dead_lettered(cursor: sqlite3.Cursor) -> None:
+    for _ in range(retry.MAX_ATTEMPTS - 1):
+        assert retry.record_failure(cursor, 1, 'worker', {'Twitter': TIMEOUT}, NOW) == RETRYING
+        claim(cursor)
+    assert retry.record_failure(cursor, 1, 'worker', {'Twitter': TIMEOUT}, NOW) == FAILED
+
+    letters = retry.dead_letters(cursor)
+    assert len(letters) == 1
+    assert letters[0]['Attempts'] == retry.MAX_ATTEMPTS
+    assert letters[0]['Platforms'] == 'Twitter'
+    assert letters[0]['Action'] == 'post_text'
+
+
+def test_permanent_error_is_dead_lettered_at_once(cursor: sqlite3.Cursor) -> None:
+    assert retry.record_failure(cursor, 1, 'worker', {'Twitter': TIMEOUT, 'Slack': INVALID}, NOW) == FAILED
+    assert retry.dead_letters(cursor)[0]['Platforms'] == 'Twitter,Slack'
+
+
+def test_replay_reschedules_dead_letters(cursor: sqlite3.Cursor) -> None:
+    retry.record_failure(cursor, 1, 'worker', {'Slack': INVALID}, NOW)
+
+    assert retry.replay_dead_letters(cursor, []) == 0
+    assert retry.replay_dead_letters(cursor) == 1
+    assert job(cursor) == (PENDING, 0, 'Slack', None)
+    assert retry.dead_letters(cursor) == []
@@ -0,0 +1,133 @@
+import ast
+import asyncio
+import os
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+import pytest
+from postr.rate_limiter import RateLimiter
+from postr.rate_limiter import rate_limited
+from postr.schedule import task_processor
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def adapter_methods(module: str, class_name: str) -> Dict[str, List[str]]:
+    """ Returns the parameter names of every method of an adapter class, read from its source,
+        since most adapters cannot be imported without their platform's SDK """
+    with open(os.path.join(REPO, *module.split('.')) + '.py') as source:
+        tree = ast.parse(source.read())
+    adapter = next(node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == class_name)
+    return {
+        node.name: [argument.arg for argument in node.args.args + node.args.kwonlyargs]
+        for node in adapter.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+
+
+@pytest.mark.parametrize('api', sorted(task_processor.api_to_instance.factories))
+def test_dispatch_table_calls_existing_methods(api: str) -> None:
+    methods = adapter_methods(*task_processor.api_to_instance.factories[api])
+    actions = task_processor.api_to_function[api]['supported_actions']
+    for action, action_spec in actions.items():
+        dispatch = task_processor.dispatch_table[(api, action)]
+        assert dispatch.method in methods, f'{api} has no method {dispatch.method} for {action}'
+        keywords = set(action_spec['arguments'].values())
+        assert keywords <= set(methods[dispatch.method]), f'{api}.{dispatch.method} does not take {keywords}'
+        assert dispatch.required_arguments == frozenset(action_spec['arguments'])
+
+
+def test_text_is_passed_unchanged(monkeypatch: pytest.MonkeyPatch) -> None:
+    posts: List[Any] = []
+
+    class FakeTwitter():
+        def post_text(self, text: str) -> bool:
+            posts.append(text)
+            return True
+
+    monkeypatch.setitem(task_processor.api_to_instance.instances, 'Twitter', FakeTwitter())
+    text = 'He said "it\'s done"\nand left; \\n is not a newline\r\n\t{text}'
+    task = {'Action': 'post_text', 'Comment': text, 'MediaPath': None, 'OptionalText': None}
+
+    error = asyncio.get_event_loop().run_until_complete(
+        task_processor.run_platform('Twitter', task, asyncio.Semaphore(1)),
+    )
+    assert error is None
+    assert posts == [text]
+    assert task_processor.dispatch_table[('Twitter', 'post_text')].map_arguments(task) == {'text': text}
+
+
+class SlowAdapter():
+    """ Stands in for a platform whose calls take latency seconds """
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def post_text(self, text: str) -> bool:
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return True
+
+
+def test_fan_out_takes_as_long_as_the_slowest_platform(
+        rate_limits: RateLimiter, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    adapters = {'Twitter': SlowAdapter(0.1), 'Slack': SlowAdapter(0.2), 'Reddit': SlowAdapter(0.4)}
+    for api, adapter in adapters.items():
+        monkeypatch.setitem(task_processor.api_to_instance.instances, api, adapter)
+        rate_limits.configure(api, 'post', 100, 10)
+    tasks = [
+        {'Action': 'post_text', 'Comment': f'text {i}', 'MediaPath': None, 'OptionalText': None,
+         'Platforms': 'Twitter,Slack,Reddit'}
+        for i in range(3)
+    ]
+
+    start = time.perf_counter()
+    results = asyncio.get_event_loop().run_until_complete(task_processor.process_scheduler_events(tasks))
+    elapsed = time.perf_counter() - start
+
+    assert results == [{}, {}, {}]
+    assert [adapter.calls for adapter in adapters.values()] == [3, 3, 3]
+    # One after the other, the calls would take 2.1 seconds
+    assert 0.4 <= elapsed < 0.8
+
+
+class RateLimitedAdapter():
+    """ Records when each post is made, after waiting for the platform's post rate limit like the real adapters """
+
+    def __init__(self, api: str) -> None:
+        self.calls: List[float] = []
+        self.post_text = rate_limited(api, 'post')(self.record)
+
+    def record(self, text: str) -> bool:
+        self.calls.append(time.perf_counter())
+        return True
+
+
+def test_throttled_platform_does_not_delay_another(rate_limits: RateLimiter, monkeypatch: pytest.MonkeyPatch) -> None:
+    # A burst of 2 tweets, then 2 per second
+    rate_limits.configure('Twitter', 'post', 2, 2)
+    adapters = {'Twitter': RateLimitedAdapter('Twitter'), 'Slack': RateLimitedAdapter('Slack')}
+    for api, adapter in adapters.items():
+        monkeypatch.setitem(task_processor.api_to_instance.instances, api, adapter)
+    calls = [('Twitter', f'tweet {i}') for i in range(4)] + [('Slack', 'message')]
+
+    async def dispatch() -> List[Any]:
+        semaphore = asyncio.Semaphore(2)
+        return await asyncio.gather(*[
+            task_processor.run_platform(
+                api, {'Action': 'post_text', 'Comment': text, 'MediaPath': None, 'OptionalText': None}, semaphore,
+            )
+            for api, text in calls
+        ])
+
+    start = time.perf_counter()
+    assert asyncio.get_event_loop().run_until_complete(dispatch()) == [None] * 5
+
+    # The last two tweets wait for tokens without holding the two dispatch slots
+    assert [round(call - start, 1) for call in adapters['Twitter'].calls] == [0.0, 0.0, 0.5, 1.0]
+    assert adapters['Slack'].calls[0] - start < 0.1
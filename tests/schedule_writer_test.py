@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import threading
+from typing import Generator
+import pytest
+from postr.schedule.writer import JobSpec
+from postr.schedule.writer import Writer
+
+
+@pytest.fixture
+def db_path(tmpdir: str) -> str:
+    return os.path.join(str(tmpdir), 'schedule.sqlite')
+
+
+@pytest.fixture
+def writer(db_path: str) -> Generator:
+    writer = Writer(db_path)
+    yield writer
+    writer.cleanup()
+
+
+def committed_rows(db_path: str, table: str) -> list:
+    """ Reads a table through a second connection, so only committed rows show """
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(f'SELECT * FROM {table} ORDER BY 1').fetchall()
+    conn.close()
+    return rows
+
+
+def test_create_jobs_returns_ids_in_order(writer: Writer, db_path: str) -> None:
+    writer.create_job('first', '', '', 'Twitter', 'post_text')
+    specs = [JobSpec(1000 + i, f'post {i}', '', '', 'Twitter,Slack', 'post_text') for i in range(5)]
+
+    ids = writer.create_jobs(specs)
+
+    assert ids == [(str(i + 2), str(i + 1)) for i in range(5)]
+    jobs = {row[0]: row[1] for row in committed_rows(db_path, 'Job')}
+    for (job_id, custom_job_id), spec in zip(ids, specs):
+        assert jobs[int(job_id)] == spec.comment
+    custom_jobs = {row[0]: row[1:3] for row in committed_rows(db_path, 'CustomJob')}
+    for (job_id, custom_job_id), spec in zip(ids, specs):
+        assert custom_jobs[int(custom_job_id)] == (spec.date, int(job_id))
+
+
+def test_create_jobs_spans_chunks(writer: Writer, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr('postr.schedule.writer.INSERT_CHUNK_SIZE', 3)
+    ids = writer.create_jobs(JobSpec(i, 'text', '', '', 'Twitter', 'post_text') for i in range(8))
+    assert ids == [(str(i), str(i)) for i in range(1, 9)]
+
+
+def test_create_jobs_rolls_back_on_error(writer: Writer, db_path: str) -> None:
+    missing_date = JobSpec(None, 'text', '', '', 'Twitter', 'post_text')  # type: ignore
+    with pytest.raises(sqlite3.IntegrityError):
+        writer.create_jobs([JobSpec(1, 'text', '', '', 'Twitter', 'post_text'), missing_date])
+
+    assert committed_rows(db_path, 'Job') == []
+    assert writer.create_job('text', '', '', 'Twitter', 'post_text') == '1'
+
+
+def test_concurrent_writes_are_all_committed(writer: Writer, db_path: str) -> None:
+    job_ids: list = []
+
+    def schedule() -> None:
+        for _ in range(20):
+            job_id = writer.create_job('text', '', '', 'Twitter', 'post_text')
+            writer.create_custom_job(1000, job_id)
+            job_ids.append(job_id)
+
+    threads = [threading.Thread(target=schedule) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(map(int, job_ids)) == list(range(1, 161))
+    assert len(committed_rows(db_path, 'CustomJob')) == 160
+
+
+def test_failed_follow_up_undoes_its_write(writer: Writer, db_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    job_id = writer.create_job('text', '', '', 'Twitter', 'post_text')
+
+    def fail(cursor: sqlite3.Cursor, first: int, last: int) -> None:
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr('postr.schedule.job_platforms.add', fail)
+    with pytest.raises(sqlite3.OperationalError):
+        writer.create_custom_job(1000, job_id)
+    monkeypatch.undo()
+    writer.create_custom_job(2000, job_id)
+
+    assert [row[:2] for row in committed_rows(db_path, 'CustomJob')] == [(1, 2000)]
+    assert [row[1:3] for row in committed_rows(db_path, 'JobPlatform')] == [(1, 'Twitter')]
@@ -0,0 +1,32 @@
+from typing import Any
+from typing import Dict
+from unittest.mock import MagicMock
+from unittest.mock import patch
+import pytest
+
+pytest.importorskip('slackclient')
+from postr.slack_api import SlackApi  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def post_file(tmpdir: Any, result: Dict[str, Any]) -> Any:
+    photo = tmpdir.join('photo.png')
+    photo.write('png')
+    with patch('postr.slack_api.get_api_key', return_value='token'):
+        slack = SlackApi()
+    slack.client = MagicMock()
+    slack.client.api_call.return_value = result
+    return slack.post_file(str(photo), 'title')
+
+
+def test_uploaded_file_is_posted(tmpdir: Any) -> None:
+    assert post_file(tmpdir, {'ok': True, 'file': {'id': 'F123'}}) is True
+
+
+def test_rejected_upload_is_not_posted(tmpdir: Any) -> None:
+    assert post_file(tmpdir, {'ok': False, 'error': 'invalid_auth'}) is False
+
+
+def test_throttled_upload_is_not_posted(tmpdir: Any) -> None:
+    with patch('postr.slack_api.limiter') as limiter:
+        assert post_file(tmpdir, {'ok': False, 'error': 'ratelimited', 'headers': {'Retry-After': '30'}}) is False
+    limiter.retry_after.assert_called_once_with('Slack', 'upload', 30.0)
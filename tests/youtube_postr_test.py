@@ -0,0 +1,22 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from googleapiclient.errors import HttpError
+from postr.youtube_postr import Youtube
+
+
+def youtube() -> Youtube:
+    """ An adapter that skips the OAuth flow of Youtube() """
+    adapter = Youtube.__new__(Youtube)
+    adapter.build = MagicMock()
+    return adapter
+
+
+def test_post_video_returns_the_video_id() -> None:
+    with patch('postr.youtube_postr.initialize_upload', return_value={'id': 'abc123'}):
+        assert youtube().post_video('video.mp4', 'title') == 'abc123'
+
+
+def test_failed_upload_is_not_posted() -> None:
+    error = HttpError(MagicMock(status=500, reason='Backend Error'), b'Backend Error')
+    with patch('postr.youtube_postr.initialize_upload', side_effect=error):
+        assert youtube().post_video('video.mp4', 'title') is False